@@ -1,10 +1,11 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, session
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from config import config
 from extensions import db, jwt, mail
 from datetime import datetime
 import os
+import time
 
 # Global SocketIO instance - will be initialized in create_app
 socketio = None
@@ -25,6 +26,17 @@ def create_app(config_name=None):
     jwt.init_app(app)
     mail.init_app(app)
     
+    # Keep the in-memory geofence index in sync with committed zone changes
+    from utils import geofence_index, spatial, zone_transitions, tile_cache, incident_density, latest_location, fix_filter, report_interval
+    geofence_index.init_app(app)
+    zone_transitions.init_app(app)
+    fix_filter.init_app(app)
+    report_interval.init_app(app)
+    tile_cache.init_app(app)
+    incident_density.init_app(app)
+    # Probe for PostGIS before any DDL so Geofence.geom gets the right column type
+    spatial.init_app(app)
+    
     # Configure CORS with explicit settings
     CORS(app, 
          resources={r"/api/*": {
@@ -54,6 +66,16 @@ def create_app(config_name=None):
     print(f"✅ SocketIO initialized: {socketio is not None}")
     print(f"✅ SocketIO type: {type(socketio)}")
     
+    # Optional write-behind for location fixes (flushed by a background task)
+    from utils import location_buffer
+    location_buffer.init_app(app, socketio)
+    # Coalesced tourist position deltas for the authorities room
+    from utils.position_feed import position_feed, init_app as init_position_feed
+    init_position_feed(app, socketio)
+    # Periodic retention/downsampling of location history (if configured)
+    from utils import location_history
+    location_history.init_app(app, socketio)
+    
     # Register blueprints
     from routes.auth import auth_bp
     from routes.user import user_bp
@@ -62,6 +84,7 @@ def create_app(config_name=None):
     from routes.geofence import geofence_bp
     from routes.cultural import cultural_bp
     from routes.weather import weather_bp
+    from routes.tiles import tiles_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(user_bp, url_prefix='/api/user')
@@ -70,6 +93,7 @@ def create_app(config_name=None):
     app.register_blueprint(geofence_bp, url_prefix='/api/geofence')
     app.register_blueprint(cultural_bp, url_prefix='/api/cultural')
     app.register_blueprint(weather_bp, url_prefix='/api/weather')
+    app.register_blueprint(tiles_bp, url_prefix='/api/tiles')
     
     # WebSocket event handlers
     @socketio.on('connect')
@@ -80,12 +104,57 @@ def create_app(config_name=None):
     def handle_disconnect():
         print(f"🔌 Client disconnected: {request.sid}")
     
+    def authenticate_socket(data):
+        """
+        User for the access token sent with a socket event, else None. The
+        user is remembered on the connection until the token expires, so
+        later events don't need to resend it.
+        """
+        from flask_jwt_extended import decode_token
+        from models.user import User
+        token = data.get('token') if isinstance(data, dict) else None
+        if not token:
+            return None
+        try:
+            claims = decode_token(token)
+            user = User.query.get(int(claims['sub']))
+        except Exception as e:
+            print(f"⚠️ Rejected socket token: {e}")
+            return None
+        if user is not None:
+            session['user_id'] = user.id
+            session['token_exp'] = claims.get('exp')
+        return user
+    
+    def socket_user_id(data):
+        """Authenticated user id for this connection (or from a token in data), else None"""
+        exp = session.get('token_exp')
+        if session.get('user_id') is not None and (exp is None or exp > time.time()):
+            return session['user_id']
+        user = authenticate_socket(data)
+        return user.id if user else None
+    
+    def socket_authority(data):
+        """Authority user for the access token sent with a socket event, else None"""
+        user = authenticate_socket(data)
+        return user if user is not None and user.role == 'authority' else None
+    
     @socketio.on('join_authority_room')
-    def handle_join_authority():
-        """Authority joins room to receive real-time alerts"""
+    def handle_join_authority(data=None):
+        """Authority joins room to receive real-time alerts and tourist positions"""
+        if socket_authority(data) is None:
+            emit('join_error', {'room': 'authorities', 'error': 'Authority access required'})
+            return
         join_room('authorities')
         print(f"👮 Authority joined alert room: {request.sid}")
         emit('joined', {'room': 'authorities'})
+        emit('tourist_snapshot', position_feed.snapshot())
+    
+    @socketio.on('request_tourist_snapshot')
+    def handle_tourist_snapshot():
+        """Resend all tourist positions (after a gap in the position sequence)"""
+        if 'authorities' in rooms():
+            emit('tourist_snapshot', position_feed.snapshot())
     
     @socketio.on('join_incident_room')
     def handle_join_incident(data):
@@ -105,7 +174,33 @@ def create_app(config_name=None):
             room = f"user_{user_id}"
             join_room(room)
             print(f"👤 Tourist {user_id} joined personal notification room: {room}")
-            emit('joined_user_room', {'user_id': user_id, 'room': room})
+            # A token here also authenticates the connection for location_update
+            user = authenticate_socket(data) if data.get('token') else None
+            emit('joined_user_room', {'user_id': user_id, 'room': room, 'authenticated': user is not None})
+    
+    @socketio.on('location_update')
+    def handle_location_update(data):
+        """
+        Location fix over the socket - same pipeline as POST /api/location/update.
+        The return value is the acknowledgement (if the client asked for one).
+        """
+        from utils.location_ingest import parse_fix, parse_speed, ingest_fix
+        if not isinstance(data, dict):
+            return {'error': 'fix must be an object'}
+        user_id = socket_user_id(data)
+        if user_id is None:
+            return {'error': 'Authentication required'}
+        try:
+            fix = parse_fix({key: data[key] for key in ('latitude', 'longitude', 'accuracy') if key in data}, datetime.utcnow())
+            speed = parse_speed(data.get('speed'))
+        except (ValueError, TypeError) as e:
+            return {'error': str(e)}
+        try:
+            return dict(ingest_fix(user_id, fix, speed), message='Location updated successfully')
+        except Exception as e:
+            db.session.rollback()
+            print(f"[Location] Socket update failed for user {user_id}: {e}")
+            return {'error': 'Failed to store location'}
     
     @socketio.on('send_message')
     def handle_message(data):
@@ -134,7 +229,8 @@ def create_app(config_name=None):
         print(f"[REQUEST] {request.method} {request.path}")
         print(f"[HEADERS] Authorization: {request.headers.get('Authorization', 'NONE')[:50]}...")
         print(f"[CONTENT-TYPE] {request.headers.get('Content-Type', 'NONE')}")
-        if request.method in ['POST', 'PUT', 'PATCH']:
+        # Skip large bodies (bulk uploads) - parsing them here would defeat streaming
+        if request.method in ['POST', 'PUT', 'PATCH'] and (request.content_length or 0) <= 65536:
             try:
                 print(f"[BODY] {request.get_json()}")
             except:
@@ -177,7 +273,17 @@ def create_app(config_name=None):
     # Health check endpoint
     @app.route('/api/health')
     def health_check():
-        return jsonify({'status': 'healthy', 'message': 'VIKRANTA API is running'}), 200
+        from utils.location_buffer import location_buffer
+        from utils.fix_filter import fix_filter
+        from utils.report_interval import report_interval
+        return jsonify({
+            'status': 'healthy',
+            'message': 'VIKRANTA API is running',
+            'location_buffer': location_buffer.stats(),
+            'position_feed': position_feed.stats(),
+            'fix_filter': fix_filter.stats(),
+            'report_interval': report_interval.stats()
+        }), 200
     
     # Environment variables check endpoint (for debugging)
     @app.route('/api/debug/env-check')
@@ -204,6 +310,14 @@ def create_app(config_name=None):
     # Create database tables
     with app.app_context():
         db.create_all()
+        # Add/backfill the PostGIS geometry column on existing databases
+        spatial.migrate(app)
+        # Daily partitions for user_locations on PostgreSQL
+        location_history.migrate(app)
+        # Build the incident density grid for databases that predate it
+        incident_density.backfill(app)
+        # Seed latest positions from location history
+        latest_location.backfill(app)
         # Initialize sample data
         initialize_sample_data()
     
@@ -296,4 +410,9 @@ print("="*60 + "\n")
 
 if __name__ == '__main__':
     # Only use the development server when running directly (python app.py)
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, allow_unsafe_werkzeug=True)
+    from utils.location_buffer import location_buffer
+    try:
+        socketio.run(app, host='0.0.0.0', port=5000, debug=True, allow_unsafe_werkzeug=True)
+    finally:
+        # Write any buffered fixes before the process exits
+        location_buffer.drain()
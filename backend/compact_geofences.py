@@ -0,0 +1,32 @@
+"""
+Script to compact duplicate geofences.
+Deactivates active zones that overlap an older zone by at least the IoU
+threshold (repeated AI generation for the same area), keeping the oldest.
+
+Usage: python compact_geofences.py [--threshold 0.6] [--dry-run]
+"""
+import argparse
+
+def compact_geofences(threshold, dry_run):
+    """Find and deactivate duplicate zones"""
+    from app import app
+    from utils.zone_dedup import compact_duplicate_zones
+
+    with app.app_context():
+        clusters = compact_duplicate_zones(threshold=threshold, dry_run=dry_run)
+
+    removed = sum(len(ids) for ids in clusters.values())
+    for kept, duplicates in sorted(clusters.items()):
+        print(f"🗺️ Zone {kept}: {len(duplicates)} duplicate(s) {duplicates}")
+
+    if dry_run:
+        print(f"\n🔍 Dry run: {removed} duplicate zones would be deactivated")
+    else:
+        print(f"\n🎉 Deactivated {removed} duplicate zones across {len(clusters)} clusters")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deactivate duplicate geofences')
+    parser.add_argument('--threshold', type=float, default=0.6, help='IoU at or above which zones count as duplicates')
+    parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+    args = parser.parse_args()
+    compact_geofences(args.threshold, args.dry_run)
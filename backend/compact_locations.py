@@ -0,0 +1,52 @@
+"""
+Script to compact location history.
+Creates upcoming daily partitions, deletes fixes past LOCATION_RETENTION_DAYS
+(off unless set above 0) and downsamples days older than LOCATION_DOWNSAMPLE_AFTER_DAYS to simplified
+tracks. Run it daily (e.g. from cron) unless LOCATION_MAINTENANCE_INTERVAL_HOURS
+schedules it inside the app.
+
+Usage: python compact_locations.py [--dry-run] [--partition] [--retention-days N] [--downsample-after-days N]
+"""
+import argparse
+
+def compact_locations(args):
+    """Run one pass of location history maintenance"""
+    from app import app
+    from extensions import db
+    from utils.location_history import convert_to_partitioned, run_maintenance
+
+    if args.retention_days is not None:
+        app.config['LOCATION_RETENTION_DAYS'] = args.retention_days
+    if args.downsample_after_days is not None:
+        app.config['LOCATION_DOWNSAMPLE_AFTER_DAYS'] = args.downsample_after_days
+
+    if args.partition:
+        with app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                print("❌ Partitioning needs PostgreSQL")
+                return
+            with db.engine.begin() as connection:
+                copied = convert_to_partitioned(connection, app.config['LOCATION_PARTITIONS_AHEAD_DAYS'])
+        if copied is None:
+            print("✅ user_locations is already partitioned")
+        else:
+            print(f"✅ Converted user_locations to daily partitions ({copied} fixes copied)")
+
+    summary = run_maintenance(app, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"\n🔍 Dry run: {summary['expired']} fixes past retention, "
+              f"{summary['fixes_before']} → {summary['fixes_after']} fixes over {summary['days_downsampled']} days to downsample")
+    else:
+        print(f"🗂️ Partitions: {summary['partitions_created']} created, {summary['partitions_dropped']} dropped")
+        print(f"🗑️ Expired {summary['expired']} fixes past retention")
+        print(f"📉 Downsampled {summary['days_downsampled']} days: {summary['fixes_before']} → {summary['fixes_after']} fixes")
+        print(f"\n🎉 Location history compacted in {summary['elapsed_s']}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Expire and downsample location history')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing anything')
+    parser.add_argument('--partition', action='store_true', help='Convert an existing user_locations table to daily partitions (PostgreSQL)')
+    parser.add_argument('--retention-days', type=int, help='Override LOCATION_RETENTION_DAYS')
+    parser.add_argument('--downsample-after-days', type=int, help='Override LOCATION_DOWNSAMPLE_AFTER_DAYS')
+    args = parser.parse_args()
+    compact_locations(args)
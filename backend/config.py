@@ -61,6 +61,108 @@ class Config:
     OTP_EXPIRY_MINUTES = 10
     MAX_LOGIN_ATTEMPTS = 5
 
+    # --- Geofence Spatial Index ---
+    # Patched zones are checked linearly until this many accumulate, then the STRtree is rebuilt
+    GEOFENCE_INDEX_REBUILD_THRESHOLD = int(os.environ.get('GEOFENCE_INDEX_REBUILD_THRESHOLD', 64))
+    # Full reload interval so zones written by other processes are picked up (0 disables)
+    GEOFENCE_INDEX_MAX_AGE_SECONDS = int(os.environ.get('GEOFENCE_INDEX_MAX_AGE_SECONDS', 300))
+    # 'auto' pushes containment/proximity into PostGIS when available, 'python' always uses the index
+    SPATIAL_QUERY_BACKEND = os.environ.get('SPATIAL_QUERY_BACKEND', 'auto')
+    # Upper bound on points accepted by /api/geofence/check-batch
+    GEOFENCE_BATCH_MAX_POINTS = int(os.environ.get('GEOFENCE_BATCH_MAX_POINTS', 10000))
+    # Generated zones overlapping an existing zone by at least this IoU update it instead of inserting
+    GEOFENCE_DEDUP_IOU_THRESHOLD = float(os.environ.get('GEOFENCE_DEDUP_IOU_THRESHOLD', 0.6))
+    # Caps on /api/geofence/nearest (result count and search radius in metres)
+    GEOFENCE_NEAREST_MAX_RESULTS = int(os.environ.get('GEOFENCE_NEAREST_MAX_RESULTS', 100))
+    GEOFENCE_NEAREST_MAX_DISTANCE_M = int(os.environ.get('GEOFENCE_NEAREST_MAX_DISTANCE_M', 200000))
+
+    # --- Vector Tiles ---
+    # Encoded /api/tiles responses kept in memory (LRU, invalidated per tile on writes)
+    TILE_CACHE_MAX_ENTRIES = int(os.environ.get('TILE_CACHE_MAX_ENTRIES', 4096))
+
+    # --- Geofence Transitions ---
+    # Minimum gap between enter/exit notifications for the same zone (debounces boundary jitter)
+    GEOFENCE_TRANSITION_COOLDOWN_SECONDS = int(os.environ.get('GEOFENCE_TRANSITION_COOLDOWN_SECONDS', 120))
+    # Emit a 'dwell' event after this long inside a zone, then every DWELL_REPEAT seconds (0 = once)
+    GEOFENCE_DWELL_SECONDS = int(os.environ.get('GEOFENCE_DWELL_SECONDS', 600))
+    GEOFENCE_DWELL_REPEAT_SECONDS = int(os.environ.get('GEOFENCE_DWELL_REPEAT_SECONDS', 1800))
+    # Users whose zone state is kept in memory; older ones reload from user_zone_states
+    GEOFENCE_STATE_MAX_USERS = int(os.environ.get('GEOFENCE_STATE_MAX_USERS', 10000))
+
+    # --- Location Ingestion ---
+    # Upper bound on fixes accepted by /api/location/batch
+    LOCATION_BATCH_MAX_FIXES = int(os.environ.get('LOCATION_BATCH_MAX_FIXES', 1000))
+    # Buffer fixes in memory and insert them in batches from a background task
+    LOCATION_WRITE_BEHIND = os.environ.get('LOCATION_WRITE_BEHIND', 'false').lower() in ['true', '1', 't']
+    # Flush every FLUSH_MS or once FLUSH_ROWS are waiting; writers flush inline at MAX_ROWS
+    LOCATION_BUFFER_FLUSH_MS = int(os.environ.get('LOCATION_BUFFER_FLUSH_MS', 200))
+    LOCATION_BUFFER_FLUSH_ROWS = int(os.environ.get('LOCATION_BUFFER_FLUSH_ROWS', 500))
+    LOCATION_BUFFER_MAX_ROWS = int(os.environ.get('LOCATION_BUFFER_MAX_ROWS', 10000))
+    # Skip fixes from stationary phones: a fix within the noise radius (its accuracy,
+    # at least MIN_MOVE_M) of the last stored one is merged into it, or dropped if it
+    # arrives within MIN_INTERVAL of the last accepted fix; HEARTBEAT forces a stored fix
+    FIX_FILTER_ENABLED = os.environ.get('FIX_FILTER_ENABLED', 'true').lower() in ['true', '1', 't']
+    FIX_FILTER_MIN_MOVE_M = float(os.environ.get('FIX_FILTER_MIN_MOVE_M', 10))
+    FIX_FILTER_MIN_INTERVAL_SECONDS = int(os.environ.get('FIX_FILTER_MIN_INTERVAL_SECONDS', 10))
+    FIX_FILTER_HEARTBEAT_SECONDS = int(os.environ.get('FIX_FILTER_HEARTBEAT_SECONDS', 300))
+    FIX_FILTER_MAX_USERS = int(os.environ.get('FIX_FILTER_MAX_USERS', 10000))
+    # Recommended delay before a client's next fix (next_update_seconds): IDLE when
+    # parked, about every TARGET_DISTANCE_M when moving, MIN in high-risk zones or near
+    # active incidents; stretched while the fleet exceeds TARGET_RATE fixes/second
+    REPORT_INTERVAL_ENABLED = os.environ.get('REPORT_INTERVAL_ENABLED', 'true').lower() in ['true', '1', 't']
+    REPORT_INTERVAL_MIN_SECONDS = int(os.environ.get('REPORT_INTERVAL_MIN_SECONDS', 5))
+    REPORT_INTERVAL_MAX_SECONDS = int(os.environ.get('REPORT_INTERVAL_MAX_SECONDS', 300))
+    REPORT_INTERVAL_DEFAULT_SECONDS = int(os.environ.get('REPORT_INTERVAL_DEFAULT_SECONDS', 30))
+    REPORT_INTERVAL_IDLE_SECONDS = int(os.environ.get('REPORT_INTERVAL_IDLE_SECONDS', 120))
+    REPORT_INTERVAL_TARGET_DISTANCE_M = float(os.environ.get('REPORT_INTERVAL_TARGET_DISTANCE_M', 50))
+    REPORT_INTERVAL_RISK_LOOKAHEAD_M = float(os.environ.get('REPORT_INTERVAL_RISK_LOOKAHEAD_M', 2000))
+    REPORT_INTERVAL_INCIDENT_RADIUS_M = float(os.environ.get('REPORT_INTERVAL_INCIDENT_RADIUS_M', 1000))
+    REPORT_INTERVAL_TARGET_RATE = float(os.environ.get('REPORT_INTERVAL_TARGET_RATE', 200))
+
+    # --- Location History ---
+    # On PostgreSQL, keep user_locations as a table partitioned by day (opt-in; the
+    # partitioned table's primary key is (id, timestamp), unlike the model's)
+    LOCATION_PARTITIONING = os.environ.get('LOCATION_PARTITIONING', 'false').lower() in ['true', '1', 't']
+    LOCATION_PARTITIONS_AHEAD_DAYS = int(os.environ.get('LOCATION_PARTITIONS_AHEAD_DAYS', 7))
+    # Fixes older than RETENTION_DAYS are deleted (opt-in; 0 = keep forever)
+    LOCATION_RETENTION_DAYS = int(os.environ.get('LOCATION_RETENTION_DAYS', 0))
+    # Days older than DOWNSAMPLE_AFTER_DAYS keep time-aware simplification vertices (within
+    # TOLERANCE_M) plus at least one fix per INTERVAL_SECONDS (0 = never)
+    LOCATION_DOWNSAMPLE_AFTER_DAYS = int(os.environ.get('LOCATION_DOWNSAMPLE_AFTER_DAYS', 7))
+    LOCATION_DOWNSAMPLE_INTERVAL_SECONDS = int(os.environ.get('LOCATION_DOWNSAMPLE_INTERVAL_SECONDS', 60))
+    LOCATION_DOWNSAMPLE_TOLERANCE_M = float(os.environ.get('LOCATION_DOWNSAMPLE_TOLERANCE_M', 15))
+    # Fixes per /api/location/history page (default and hard cap)
+    LOCATION_HISTORY_DEFAULT_LIMIT = int(os.environ.get('LOCATION_HISTORY_DEFAULT_LIMIT', 1000))
+    LOCATION_HISTORY_MAX_LIMIT = int(os.environ.get('LOCATION_HISTORY_MAX_LIMIT', 5000))
+    # Run the retention/downsampling job in-process this often (0 = only via compact_locations.py)
+    LOCATION_MAINTENANCE_INTERVAL_HOURS = float(os.environ.get('LOCATION_MAINTENANCE_INTERVAL_HOURS', 0))
+    # Bulk export (export_locations.py, /api/location/export): rows per server-side cursor fetch,
+    # and the longest range one /api/location/export request may cover
+    LOCATION_EXPORT_CHUNK_ROWS = int(os.environ.get('LOCATION_EXPORT_CHUNK_ROWS', 50000))
+    LOCATION_EXPORT_MAX_DAYS = int(os.environ.get('LOCATION_EXPORT_MAX_DAYS', 31))
+    # Accept: application/x-ndjson listings: rows per server-side cursor fetch, bytes per write
+    NDJSON_CHUNK_ROWS = int(os.environ.get('NDJSON_CHUNK_ROWS', 1000))
+    NDJSON_FLUSH_BYTES = int(os.environ.get('NDJSON_FLUSH_BYTES', 65536))
+
+    # --- Live Positions ---
+    # Push coalesced tourist position deltas to the authorities Socket.IO room
+    POSITION_FEED_ENABLED = os.environ.get('POSITION_FEED_ENABLED', 'true').lower() in ['true', '1', 't']
+    # Check for due positions every TICK_MS; send each tourist at most every MIN_INTERVAL_MS
+    POSITION_FEED_TICK_MS = int(os.environ.get('POSITION_FEED_TICK_MS', 250))
+    POSITION_FEED_MIN_INTERVAL_MS = int(os.environ.get('POSITION_FEED_MIN_INTERVAL_MS', 2000))
+    # /api/location/all-tourists?zoom= below this returns clusters of roughly CLUSTER_RADIUS_PX
+    TOURIST_CLUSTER_MAX_ZOOM = int(os.environ.get('TOURIST_CLUSTER_MAX_ZOOM', 14))
+    TOURIST_CLUSTER_RADIUS_PX = int(os.environ.get('TOURIST_CLUSTER_RADIUS_PX', 60))
+
+    # --- Safety Score ---
+    # Local clock used for the day/night factor (IST by default)
+    SAFETY_SCORE_UTC_OFFSET_MINUTES = int(os.environ.get('SAFETY_SCORE_UTC_OFFSET_MINUTES', 330))
+    # Zones within this distance count as nearby (safe-zone bonus, high-risk proximity)
+    SAFETY_SCORE_ZONE_RADIUS_M = int(os.environ.get('SAFETY_SCORE_ZONE_RADIUS_M', 2000))
+    # Incidents reported within this radius and window lower the score
+    SAFETY_SCORE_INCIDENT_RADIUS_M = int(os.environ.get('SAFETY_SCORE_INCIDENT_RADIUS_M', 1000))
+    SAFETY_SCORE_INCIDENT_WINDOW_HOURS = int(os.environ.get('SAFETY_SCORE_INCIDENT_WINDOW_HOURS', 24))
+
 class DevelopmentConfig(Config):
     """Development-specific configuration."""
     DEBUG = True
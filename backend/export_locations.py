@@ -0,0 +1,53 @@
+"""
+Script to export location history for analytics.
+Streams user_locations for a time range through a server-side cursor into a
+columnar file: Parquet or Arrow IPC (needs pyarrow) or NumPy .npz. Memory
+use is bounded by LOCATION_EXPORT_CHUNK_ROWS whatever the range.
+
+Usage: python export_locations.py --start 2024-01-01 [--end 2024-02-01] [--format parquet|arrow|npz]
+                                  [--user-id N ...] [--chunk-rows N] [-o FILE]
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+
+def export_locations(args):
+    """Write one export file"""
+    from app import app
+    from utils.location_export import export_chunks, export_filename, check_format
+    from utils.location_ingest import parse_timestamp
+
+    now = datetime.utcnow()
+    try:
+        check_format(args.format)
+        start = parse_timestamp(args.start, now)
+        end = parse_timestamp(args.end, now)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if start >= end:
+        print("❌ --start must be before --end")
+        return
+
+    output = args.output or export_filename(args.format, start, end)
+    chunk_rows = args.chunk_rows or app.config['LOCATION_EXPORT_CHUNK_ROWS']
+    stats = {}
+    started = time.perf_counter()
+    print(f"📦 Exporting fixes {start.isoformat()} → {end.isoformat()} as {args.format}...")
+    with app.app_context(), open(output, 'wb') as f:
+        for data in export_chunks(args.format, start, end, args.user_id, chunk_rows=chunk_rows, stats=stats):
+            f.write(data)
+    size_mb = os.path.getsize(output) / (1024 * 1024)
+    print(f"\n🎉 Exported {stats['rows']} fixes to {output} ({size_mb:.1f} MB) in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export location history as Parquet, Arrow or NumPy .npz')
+    parser.add_argument('--start', required=True, help='Range start (ISO 8601 or epoch), inclusive')
+    parser.add_argument('--end', help='Range end (ISO 8601 or epoch), exclusive; default now')
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'arrow', 'npz'], help='Output format')
+    parser.add_argument('--user-id', type=int, action='append', help='Only this user (repeatable)')
+    parser.add_argument('--chunk-rows', type=int, help='Override LOCATION_EXPORT_CHUNK_ROWS')
+    parser.add_argument('-o', '--output', help='Output file (default: user_locations_<start>_<end>.<format>)')
+    args = parser.parse_args()
+    export_locations(args)
@@ -0,0 +1,10 @@
+"""
+Gunicorn settings picked up automatically from the working directory
+(the Dockerfile runs gunicorn from backend/).
+"""
+
+
+def worker_exit(server, worker):
+    """Write fixes still held by the write-behind buffer before the worker exits"""
+    from utils.location_buffer import location_buffer
+    location_buffer.drain()
@@ -0,0 +1,47 @@
+"""
+Script to bulk-import geofences from GeoJSON.
+Accepts a FeatureCollection or newline-delimited GeoJSON features (.ndjson,
+.geojsonl) and streams it into the geofences table in batches (COPY on
+PostgreSQL), so large files load without being read into memory.
+
+Usage: python import_geofences.py zones.geojson [--batch-size 5000] [--dry-run]
+       cat zones.ndjson | python import_geofences.py -
+"""
+import argparse
+import sys
+
+def import_file(path, batch_size, dry_run):
+    """Stream a GeoJSON file into the database"""
+    from app import app
+    from utils.geofence_import import iter_features, import_geofences, GeoJSONStreamError
+
+    def report(stats):
+        rate = stats['imported'] / stats['seconds'] if stats['seconds'] else 0
+        print(f"📦 {stats['imported']} zones from {stats['features']} features "
+              f"({stats['skipped']} skipped, {rate:,.0f} zones/s)", flush=True)
+
+    stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    try:
+        with app.app_context():
+            stats = import_geofences(iter_features(stream), batch_size=batch_size,
+                                     dry_run=dry_run, progress=report)
+    except GeoJSONStreamError as e:
+        print(f"❌ Invalid input: {e}")
+        return
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    for error in stats['errors']:
+        print(f"⚠️ Feature {error['feature']}: {error['error']}")
+    verb = 'Validated' if dry_run else 'Imported'
+    print(f"\n🎉 {verb} {stats['imported']} zones in {stats['seconds']}s "
+          f"({stats['skipped']} features skipped)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk-import geofences from GeoJSON')
+    parser.add_argument('path', help="GeoJSON/NDJSON file, or '-' for stdin")
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per COPY/INSERT batch')
+    parser.add_argument('--dry-run', action='store_true', help='Validate without writing')
+    args = parser.parse_args()
+    import_file(args.path, args.batch_size, args.dry_run)
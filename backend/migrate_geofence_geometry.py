@@ -0,0 +1,40 @@
+"""
+Script to add the PostGIS geometry column to geofences.
+Adds geofences.geom, backfills it from polygon_data and builds the GiST index.
+The app also runs this on startup; use the script for a one-off migration.
+"""
+import os
+from sqlalchemy import create_engine
+
+from utils.spatial import detect_postgis, ensure_geofence_geometry
+
+def migrate_geofence_geometry():
+    """Backfill geofences.geom from polygon_data"""
+    database_url = os.environ.get('DATABASE_URL')
+
+    if not database_url:
+        print("❌ DATABASE_URL not found in environment variables")
+        return
+
+    # Fix Railway's postgres:// to postgresql://
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print(f"🔌 Connecting to database...")
+
+    try:
+        engine = create_engine(database_url)
+        with engine.begin() as conn:
+            postgis = detect_postgis(conn)
+            if not postgis:
+                print("❌ PostGIS is not available - geofences will use the in-memory index")
+            backfilled = ensure_geofence_geometry(conn, postgis)
+            print(f"✅ Geometry column ready, {backfilled} geofences backfilled")
+    except Exception as e:
+        print(f"❌ Error migrating geofence geometry: {e}")
+        return
+
+    print("\n🎉 Geofence geometry migration complete!")
+
+if __name__ == '__main__':
+    migrate_geofence_geometry()
@@ -1,5 +1,5 @@
 from .user import User
-from .incident import Incident
-from .geofence import Geofence
+from .incident import Incident, IncidentDensityCell
+from .geofence import Geofence, UserZoneState
 
-__all__ = ['User', 'Incident', 'Geofence']
+__all__ = ['User', 'Incident', 'IncidentDensityCell', 'Geofence', 'UserZoneState']
@@ -7,6 +7,40 @@ try:
     POSTGIS_AVAILABLE = True
 except ImportError:
     POSTGIS_AVAILABLE = False
+from sqlalchemy import event
+from sqlalchemy.types import TypeDecorator, Text
+
+# Flipped by utils.spatial.init_app() once the database has been probed for PostGIS.
+# Must be settled before the first query/DDL, since dialect impls are cached.
+POSTGIS_ENABLED = False
+
+class PolygonGeometry(TypeDecorator):
+    """geometry(Polygon, 4326) on PostGIS, WKT text everywhere else (e.g. SQLite tests)"""
+    impl = Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql' and POSTGIS_ENABLED and POSTGIS_AVAILABLE:
+            return dialect.type_descriptor(Geometry('POLYGON', srid=4326, spatial_index=False))
+        return dialect.type_descriptor(Text())
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        # Plain EWKT string - PostGIS casts it on insert
+        return f'SRID=4326;{value.wkt}'
+    
+    def process_result_value(self, value, dialect):
+        from shapely import wkb, wkt
+        if value is None:
+            return None
+        if hasattr(value, 'data'):  # geoalchemy2 WKBElement
+            return wkb.loads(bytes(value.data))
+        if value.startswith('SRID='):
+            value = value.split(';', 1)[1]
+        if value[:1].isdigit():
+            return wkb.loads(value, hex=True)
+        return wkt.loads(value)
 
 class Geofence(db.Model):
     """Geofence/Zone model"""
@@ -19,6 +53,8 @@ class Geofence(db.Model):
     
     # Simplified polygon storage (JSON text for now)
     polygon_data = db.Column(db.Text)  # Store GeoJSON as text
+    # Derived from polygon_data on write; GiST-indexed by utils.spatial.ensure_geofence_geometry
+    geom = db.deferred(db.Column(PolygonGeometry()))
     
     # Details
     description = db.Column(db.Text)
@@ -52,5 +88,64 @@ class Geofence(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
+    def get_shape(self):
+        """Parse polygon_data into a Shapely geometry (None if missing or invalid)"""
+        import json
+        from shapely.geometry import shape
+        if not self.polygon_data:
+            return None
+        try:
+            geometry = shape(json.loads(self.polygon_data))
+        except Exception:
+            return None
+        if geometry.is_empty:
+            return None
+        if not geometry.is_valid:
+            # AI-generated rings are sometimes self-intersecting
+            geometry = geometry.buffer(0)
+        return geometry
+    
+    def get_polygon(self):
+        """Single Polygon for the geom column (largest part if repair split it)"""
+        geometry = self.get_shape()
+        if geometry is None:
+            return None
+        if geometry.geom_type != 'Polygon':
+            parts = [part for part in getattr(geometry, 'geoms', []) if part.geom_type == 'Polygon']
+            if not parts:
+                return None
+            geometry = max(parts, key=lambda part: part.area)
+        return geometry
+    
     def __repr__(self):
         return f'<Geofence {self.name}>'
+
+class UserZoneState(db.Model):
+    """Durable copy of a tourist's membership in a zone (see utils.zone_transitions)"""
+    __tablename__ = 'user_zone_states'
+    __table_args__ = (db.UniqueConstraint('user_id', 'geofence_id', name='uq_user_zone_state'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    geofence_id = db.Column(db.Integer, nullable=False)
+    inside = db.Column(db.Boolean, default=False)            # last computed membership
+    notified_inside = db.Column(db.Boolean, default=False)   # membership last pushed to the client
+    entered_at = db.Column(db.DateTime)
+    last_event_at = db.Column(db.DateTime)
+    last_dwell_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<UserZoneState user={self.user_id} zone={self.geofence_id} inside={self.inside}>'
+
+@event.listens_for(Geofence, 'before_insert')
+def _geofence_geom_on_insert(mapper, connection, target):
+    """Derive geom from polygon_data for new zones"""
+    if target.geom is None:
+        target.geom = target.get_polygon()
+
+@event.listens_for(Geofence, 'before_update')
+def _geofence_geom_on_update(mapper, connection, target):
+    """Re-derive geom whenever polygon_data changes"""
+    from sqlalchemy import inspect
+    if inspect(target).attrs.polygon_data.history.has_changes():
+        target.geom = target.get_polygon()
@@ -11,6 +11,7 @@ except ImportError:
 class Incident(db.Model):
     """Incident/Emergency model"""
     __tablename__ = 'incidents'
+    __table_args__ = (db.Index('idx_incidents_lat_lon', 'latitude', 'longitude'),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -62,3 +63,22 @@ class Incident(db.Model):
     
     def __repr__(self):
         return f'<Incident {self.id} - {self.type}>'
+
+class IncidentDensityCell(db.Model):
+    """Incident counts per grid cell, hour, type and priority (see utils.incident_density)"""
+    __tablename__ = 'incident_density_cells'
+    __table_args__ = (
+        db.UniqueConstraint('cell_x', 'cell_y', 'hour', 'type', 'priority', name='uq_incident_density_cell'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cell_x = db.Column(db.Integer, nullable=False)   # floor(longitude / cell size)
+    cell_y = db.Column(db.Integer, nullable=False)   # floor(latitude / cell size)
+    hour = db.Column(db.Integer, nullable=False, index=True)  # hours since the Unix epoch (UTC)
+    type = db.Column(db.String(50), nullable=False)
+    priority = db.Column(db.String(20), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)  # incidents reported (false alarms excluded)
+    open = db.Column(db.Integer, nullable=False, default=0)   # of which not yet resolved
+    
+    def __repr__(self):
+        return f'<IncidentDensityCell ({self.cell_x},{self.cell_y}) h={self.hour} {self.type}/{self.priority}>'
@@ -83,7 +83,13 @@ class Itinerary(db.Model):
 class UserLocation(db.Model):
     """Track user locations over time"""
     __tablename__ = 'user_locations'
+    __table_args__ = (
+        # Per-user history reads and keyset pagination
+        db.Index('ix_user_locations_user_timestamp', 'user_id', 'timestamp'),
+    )
     
+    # With LOCATION_PARTITIONING on PostgreSQL the table is created by raw DDL in
+    # utils/location_history.py with primary key (id, timestamp); don't diff it against this model
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     latitude = db.Column(db.Float, nullable=False)
@@ -100,3 +106,36 @@ class UserLocation(db.Model):
             'accuracy': self.accuracy,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
+
+class LocationCompaction(db.Model):
+    """One row per UTC day of user_locations already downsampled (see utils.location_history)"""
+    __tablename__ = 'location_compactions'
+    
+    day = db.Column(db.Date, primary_key=True)
+    fixes_before = db.Column(db.Integer, nullable=False)
+    fixes_after = db.Column(db.Integer, nullable=False)
+    compacted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class UserLatestLocation(db.Model):
+    """Most recent fix per user, upserted on every location write (see utils.latest_location)"""
+    __tablename__ = 'user_latest_locations'
+    __table_args__ = (
+        # Viewport (bbox) reads for the authority map
+        db.Index('ix_user_latest_locations_lat_lon', 'latitude', 'longitude'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    accuracy = db.Column(db.Float)
+    timestamp = db.Column(db.DateTime, nullable=False)          # when the fix was taken
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)  # when the row last changed (for ?since=)
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'accuracy': self.accuracy,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None
+        }
@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extensions import db
 from models.geofence import Geofence
-from geoalchemy2.shape import to_shape, from_shape
-from shapely.geometry import Point, Polygon
+from utils.spatial import zones_containing, nearest_zones
+from utils.geofence_index import geofence_index, tolerance_for_zoom
+from utils.zone_dedup import find_duplicate, merge_into
+from utils.geofence_import import iter_features, import_geofences, GeoJSONStreamError
+from models.user import User
+import numpy as np
 import os
 import requests
 import json
@@ -27,32 +31,158 @@ else:
     GEMINI_API_URL = None
     print(f"[STARTUP] Geofence blueprint loaded. Gemini API Key: ❌ MISSING - Zone generation will not work!")
 
+# Serialized /list bodies for the current zone-set version, keyed by (bbox, zoom)
+_list_cache = {}
+_list_cache_version = None
+LIST_CACHE_MAX_ENTRIES = 256
+
+def parse_bbox(value):
+    """Parse 'minLon,minLat,maxLon,maxLat' into a tuple of floats (None if absent)"""
+    if not value:
+        return None
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError('bbox must be minLon,minLat,maxLon,maxLat')
+    return tuple(parts)
+
+def min_visible_degrees(zoom):
+    """Size of one 256px-tile pixel in degrees at the given web-map zoom"""
+    return 360.0 / (256 * 2 ** zoom)
+
 @geofence_bp.route('/list', methods=['GET'])
 def list_geofences():
+    """
+    List geofences. Optional filters (active zones only):
+      bbox=minLon,minLat,maxLon,maxLat  - zones intersecting the viewport
+      zoom=<0-22>                       - drop zones smaller than a pixel at that zoom and
+                                          serve polygons simplified for that zoom
+    Active-zone lists are served from pre-serialized payloads and support
+    If-None-Match, so an unchanged list costs a 304 with no DB or JSON work.
+    """
+    global _list_cache_version
     active_only = request.args.get('active', 'true').lower() == 'true'
-    query = Geofence.query
-    if active_only:
-        query = query.filter_by(active=True)
-    geofences = query.all()
-    return jsonify({'geofences': [gf.to_dict() for gf in geofences], 'count': len(geofences)}), 200
+    if not active_only:
+        geofences = Geofence.query.all()
+        return jsonify({'geofences': [gf.to_dict() for gf in geofences], 'count': len(geofences)}), 200
+    
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = request.args.get('zoom', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if zoom is not None:
+        zoom = max(0, min(zoom, 22))
+    
+    etag = geofence_index.etag
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    if _list_cache_version != etag:
+        _list_cache.clear()
+        _list_cache_version = etag
+    cache_key = (bbox, zoom)
+    body = _list_cache.get(cache_key)
+    if body is None:
+        entries = geofence_index.query_bbox(*bbox) if bbox else geofence_index.all_zones()
+        if zoom is not None:
+            min_size = min_visible_degrees(zoom)
+            entries = [
+                entry for entry in entries
+                if max(entry.geometry.bounds[2] - entry.geometry.bounds[0],
+                       entry.geometry.bounds[3] - entry.geometry.bounds[1]) >= min_size
+            ]
+        tolerance = tolerance_for_zoom(zoom)
+        payloads = [entry.simplified(tolerance)[1] for entry in entries]
+        body = '{"geofences":[' + ','.join(payloads) + '],"count":' + str(len(payloads)) + '}'
+        if len(_list_cache) >= LIST_CACHE_MAX_ENTRIES:
+            _list_cache.pop(next(iter(_list_cache)))
+        _list_cache[cache_key] = body
+    
+    response = current_app.response_class(body, status=200, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @geofence_bp.route('/check', methods=['POST'])
 def check_geofence():
     data = request.get_json()
     if 'latitude' not in data or 'longitude' not in data:
         return jsonify({'error': 'Latitude and longitude are required'}), 400
-    point = Point(data['longitude'], data['latitude'])
-    inside_geofences = []
-    active_geofences = Geofence.query.filter_by(active=True).all()
-    for geofence in active_geofences:
-        try:
-            polygon = to_shape(geofence.polygon)
-            if polygon.contains(point):
-                inside_geofences.append(geofence.to_dict())
-        except:
-            pass
+    try:
+        inside_geofences = zones_containing(data['longitude'], data['latitude'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Latitude and longitude must be numbers'}), 400
     return jsonify({'inside_geofences': inside_geofences, 'count': len(inside_geofences)}), 200
 
+@geofence_bp.route('/check-batch', methods=['POST'])
+def check_geofence_batch():
+    """
+    Check many points against active zones in one request.
+    Body: {"points": [...]} where each point is [lat, lon] or {"latitude": .., "longitude": ..}
+    (formats may be mixed).
+    Returns zone ids per point (aligned with the input) plus each hit zone once.
+    """
+    data = request.get_json(silent=True) or {}
+    points = data.get('points')
+    if not isinstance(points, list) or not points:
+        return jsonify({'error': 'points must be a non-empty list'}), 400
+    max_points = current_app.config.get('GEOFENCE_BATCH_MAX_POINTS', 10000)
+    if len(points) > max_points:
+        return jsonify({'error': f'At most {max_points} points per request'}), 413
+    coords = np.empty((len(points), 2))
+    for i, point in enumerate(points):
+        # Each point may be a [lat, lon] pair or a {"latitude", "longitude"} object
+        try:
+            if isinstance(point, dict):
+                coords[i] = (float(point['latitude']), float(point['longitude']))
+            else:
+                coords[i] = (float(point[0]), float(point[1]))
+        except (KeyError, IndexError, TypeError, ValueError):
+            return jsonify({
+                'error': f'Point {i} needs a latitude and longitude, as [lat, lon] or {{"latitude", "longitude"}}'
+            }), 400
+    if not np.isfinite(coords).all():
+        return jsonify({'error': 'Coordinates must be finite numbers'}), 400
+    
+    results = geofence_index.query_points(coords[:, 1], coords[:, 0])
+    zones = {}
+    for hits in results:
+        for entry in hits:
+            zones[entry.id] = entry.zone
+    return jsonify({
+        'results': [[entry.id for entry in hits] for hits in results],
+        'zones': list(zones.values()),
+        'count': len(results),
+        'points_inside': sum(1 for hits in results if hits)
+    }), 200
+
+@geofence_bp.route('/nearest', methods=['GET'])
+def nearest_geofences():
+    """
+    k nearest active zones to a point, nearest first, with geodesic distances.
+    Query params: latitude, longitude (required), k (default 10),
+    max_distance_m (default 50000), zone_type / risk_level (comma-separated).
+    """
+    latitude = request.args.get('latitude', type=float)
+    longitude = request.args.get('longitude', type=float)
+    if latitude is None or longitude is None:
+        return jsonify({'error': 'Latitude and longitude are required'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'error': 'Coordinates out of range'}), 400
+    
+    k = request.args.get('k', 10, type=int)
+    max_distance_m = request.args.get('max_distance_m', 50000, type=float)
+    k = max(1, min(k, current_app.config.get('GEOFENCE_NEAREST_MAX_RESULTS', 100)))
+    max_distance_m = max(0.0, min(max_distance_m, current_app.config.get('GEOFENCE_NEAREST_MAX_DISTANCE_M', 200000)))
+    zone_types = [t for t in request.args.get('zone_type', '').split(',') if t]
+    risk_levels = [r for r in request.args.get('risk_level', '').split(',') if r]
+    
+    zones = nearest_zones(longitude, latitude, k=k, max_distance_m=max_distance_m,
+                          zone_types=zone_types, risk_levels=risk_levels)
+    return jsonify({'zones': zones, 'count': len(zones), 'max_distance_m': max_distance_m}), 200
+
 
 @geofence_bp.route('/generate-nearby', methods=['POST'])
 def generate_nearby_zones():
@@ -201,8 +331,12 @@ Return ONLY the JSON array, no markdown, no explanation."""
         # Parse JSON
         zones_data = json.loads(text_response)
         
-        # Save zones to database
+        # Save zones to database, merging near-duplicates of existing zones
+        iou_threshold = current_app.config.get('GEOFENCE_DEDUP_IOU_THRESHOLD', 0.6)
         generated_zones = []
+        updated_zones = []
+        skipped_zones = []
+        accepted = []  # (name, geometry) for zones added from this response
         for zone_data in zones_data:
             try:
                 coords = zone_data['coordinates']
@@ -225,7 +359,24 @@ Return ONLY the JSON array, no markdown, no explanation."""
                     description=zone_data.get('description', 'Dynamically generated zone'),
                     active=True
                 )
+                geometry = geofence.get_shape()
+                if geometry is None:
+                    print(f"[Geofence] Skipping zone with invalid polygon: {zone_data['name']}")
+                    continue
+                
+                match, score = find_duplicate(geometry, iou_threshold, extra=accepted)
+                if match is not None:
+                    existing = Geofence.query.get(match.id) if hasattr(match, 'id') else None
+                    if existing is not None and merge_into(existing, zone_data):
+                        updated_zones.append(existing.name)
+                        print(f"[Geofence] Updated existing zone {existing.name} (IoU {score:.2f})")
+                    else:
+                        skipped_zones.append(zone_data['name'])
+                        print(f"[Geofence] Skipped duplicate: {zone_data['name']} (IoU {score:.2f})")
+                    continue
+                
                 db.session.add(geofence)
+                accepted.append((zone_data['name'], geometry))
                 generated_zones.append(zone_data['name'])
                 print(f"[Geofence] Generated: {zone_data['name']}")
             except Exception as e:
@@ -242,6 +393,8 @@ Return ONLY the JSON array, no markdown, no explanation."""
             'success': True,
             'message': f'Generated {len(generated_zones)} safety zones',
             'zones': generated_zones,
+            'updated_zones': updated_zones,
+            'skipped_duplicates': len(skipped_zones),
             'location': {'latitude': latitude, 'longitude': longitude}
         }), 200
         
@@ -306,3 +459,41 @@ def create_bangalore_zones():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+
+@geofence_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_geofence_file():
+    """
+    Bulk-import zones from a GeoJSON FeatureCollection or NDJSON features
+    (authorities only). Send the document as the raw body (e.g.
+    Content-Type: application/x-ndjson) or as a multipart 'file' field;
+    it is parsed as a stream. Query params: batch_size, dry_run.
+    """
+    user = User.query.get(int(get_jwt_identity()))
+    if not user or user.role != 'authority':
+        return jsonify({'error': 'Only authorities can import geofences'}), 403
+    
+    batch_size = max(1, min(request.args.get('batch_size', 1000, type=int), 10000))
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    
+    try:
+        stats = import_geofences(
+            iter_features(stream),
+            batch_size=batch_size,
+            dry_run=dry_run,
+            progress=lambda s: print(f"[Geofence] Import progress: {s['imported']} zones from {s['features']} features ({s['seconds']}s)")
+        )
+    except GeoJSONStreamError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Geofence] Import failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Import failed', 'details': str(e)}), 500
+    
+    print(f"[Geofence] ✅ Imported {stats['imported']} zones in {stats['seconds']}s")
+    return jsonify(dict(stats, success=True, dry_run=dry_run)), 200
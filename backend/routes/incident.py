@@ -4,6 +4,10 @@ from extensions import db
 from models.user import User
 from models.incident import Incident
 from utils.notification import send_emergency_alert, send_sms
+from utils.incident_density import density_grid
+from utils.report_interval import report_interval
+from utils.ndjson import wants_ndjson, ndjson_response
+from routes.geofence import parse_bbox
 from datetime import datetime
 import logging
 import traceback
@@ -79,6 +83,7 @@ def trigger_panic():
         )
         db.session.add(incident)
         db.session.commit()
+        report_interval.invalidate_incidents()
         
         print(f"🚨 Panic alert created: Incident #{incident.id} by user {user.name}")
         
@@ -131,9 +136,28 @@ def trigger_panic():
         db.session.rollback()
         return jsonify({'error': 'Failed to create incident', 'details': str(e)}), 500
 
+def stream_incidents(query, with_user):
+    """Incident dicts for `query` read through a server-side cursor, reporting user joined in"""
+    if with_user:
+        query = query.outerjoin(User, User.id == Incident.user_id).add_entity(User)
+    query = query.order_by(Incident.created_at.desc()).yield_per(current_app.config['NDJSON_CHUNK_ROWS'])
+    for row in query:
+        if not with_user:
+            yield row.to_dict()
+            continue
+        incident, incident_user = row
+        incident_dict = incident.to_dict()
+        incident_dict['user'] = incident_user.to_dict() if incident_user else None
+        yield incident_dict
+
 @incident_bp.route('/list', methods=['GET'])
 @jwt_required()
 def list_incidents():
+    """
+    Incidents, newest first - all of them for authorities (with the reporting
+    user), otherwise the caller's own. `Accept: application/x-ndjson` streams
+    one incident per line instead of a single JSON document.
+    """
     user_id = int(get_jwt_identity())  # Convert string back to int
     user = User.query.get(user_id)
     query = Incident.query
@@ -142,6 +166,8 @@ def list_incidents():
     status = request.args.get('status')
     if status:
         query = query.filter_by(status=status)
+    if wants_ndjson():
+        return ndjson_response(stream_incidents(query, user.role == 'authority'))
     incidents = query.order_by(Incident.created_at.desc()).all()
     incidents_data = []
     for incident in incidents:
@@ -152,6 +178,42 @@ def list_incidents():
         incidents_data.append(incident_dict)
     return jsonify({'incidents': incidents_data, 'count': len(incidents_data)}), 200
 
+@incident_bp.route('/heatmap', methods=['GET'])
+@jwt_required()
+def incident_heatmap():
+    """
+    Incident density per grid cell for the authority heatmap (served from the
+    precomputed grid, never the incident table).
+    Query params: hours (default 24), bbox=minLon,minLat,maxLon,maxLat,
+    type / priority (comma-separated), open_only, aggregate (merge n x n cells),
+    split=type|priority.
+    """
+    user_id = int(get_jwt_identity())
+    user = User.query.get(user_id)
+    if not user or user.role != 'authority':
+        return jsonify({'error': 'Unauthorized - Authority access required'}), 403
+    
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    split = request.args.get('split')
+    if split not in (None, 'type', 'priority'):
+        return jsonify({'error': 'split must be type or priority'}), 400
+    hours = max(1, min(request.args.get('hours', 24, type=int), 24 * 365))
+    aggregate = max(1, min(request.args.get('aggregate', 1, type=int), 100))
+    
+    grid = density_grid(
+        hours=hours,
+        bbox=bbox,
+        types=[t for t in request.args.get('type', '').split(',') if t],
+        priorities=[p for p in request.args.get('priority', '').split(',') if p],
+        open_only=request.args.get('open_only', 'false').lower() == 'true',
+        aggregate=aggregate,
+        split=split
+    )
+    return jsonify(grid), 200
+
 @incident_bp.route('/<int:incident_id>/respond', methods=['POST'])
 @jwt_required()
 def respond_to_incident(incident_id):
@@ -175,6 +237,7 @@ def respond_to_incident(incident_id):
         incident.updated_at = datetime.now()
     
     db.session.commit()
+    report_interval.invalidate_incidents()
     
     # Get tourist information for notifications
     tourist = User.query.get(incident.user_id)
@@ -1,10 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extensions import db
-from models.user import User, UserLocation
-from models.geofence import Geofence
-from geoalchemy2.shape import from_shape, to_shape
-from shapely.geometry import Point
+from models.user import User, UserLatestLocation
+from utils.zone_transitions import emit_zone_transitions
+from utils.safety_score import safety_score
+from utils.location_ingest import parse_fix, parse_timestamp, parse_speed, ingest_batch, ingest_fix
+from utils.latest_location import tourist_positions, cluster_tourists, in_bbox, CURSOR_OVERLAP
+from utils.location_history import history_page, history_stream
+from utils.ndjson import wants_ndjson, ndjson_response
+from utils.location_export import check_format, export_chunks, export_filename, MIMETYPES
+from utils.position_feed import position_feed
+from routes.geofence import parse_bbox
 from datetime import datetime, timedelta
 
 location_bp = Blueprint('location', __name__)
@@ -23,52 +29,157 @@ def update_location():
     except:
         print("[Location] JWT error, using default user")
         user_id = 1
-    data = request.get_json()
-    if 'latitude' not in data or 'longitude' not in data:
-        return jsonify({'error': 'Latitude and longitude are required'}), 400
-    location = UserLocation(
-        user_id=user_id,
-        latitude=data['latitude'],
-        longitude=data['longitude'],
-        accuracy=data.get('accuracy')
-    )
-    db.session.add(location)
-    db.session.commit()
-    point = Point(data['longitude'], data['latitude'])
-    geofence_alerts = []
-    active_geofences = Geofence.query.filter_by(active=True).all()
-    for geofence in active_geofences:
+    data = request.get_json(silent=True) or {}
+    try:
+        # Server time, as on the socket path - live updates are stamped on arrival
+        fix = parse_fix({key: data[key] for key in ('latitude', 'longitude', 'accuracy') if key in data}, datetime.utcnow())
+        speed = parse_speed(data.get('speed'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        result = ingest_fix(user_id, fix, speed)
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Location] Update failed for user {user_id}: {e}")
+        return jsonify({'error': 'Failed to store location'}), 500
+    return jsonify(dict(result, message='Location updated successfully')), 200
+
+@location_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def upload_location_batch():
+    """
+    Upload buffered fixes in one request.
+    Body: {"fixes": [{"latitude": .., "longitude": .., "accuracy": .., "timestamp": ..}, ...]}
+    timestamp is epoch ms/seconds or ISO 8601. All fixes are stored with one
+    bulk insert; transitions are evaluated over the batch in time order.
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    fixes = data.get('fixes')
+    if not isinstance(fixes, list) or not fixes:
+        return jsonify({'error': 'fixes must be a non-empty list'}), 400
+    max_fixes = current_app.config.get('LOCATION_BATCH_MAX_FIXES', 1000)
+    if len(fixes) > max_fixes:
+        return jsonify({'error': f'At most {max_fixes} fixes per request'}), 413
+    
+    now = datetime.utcnow()
+    parsed = []
+    for i, fix in enumerate(fixes):
         try:
-            polygon = to_shape(geofence.polygon)
-            if polygon.contains(point):
-                geofence_alerts.append({
-                    'id': geofence.id,
-                    'name': geofence.name,
-                    'zone_type': geofence.zone_type,
-                    'risk_level': geofence.risk_level,
-                    'warning_message': geofence.warning_message or f'You are entering {geofence.name}',
-                    'description': geofence.description
-                })
-        except:
-            pass
-    return jsonify({'message': 'Location updated successfully', 'location_id': location.id, 'geofence_alerts': geofence_alerts}), 200
+            parsed.append(parse_fix(fix, now))
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid fix at index {i}: {e}'}), 400
+    
+    try:
+        transitions, zones, stored = ingest_batch(user_id, parsed)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Location] Batch upload failed for user {user_id}: {e}")
+        return jsonify({'error': 'Failed to store locations', 'details': str(e)}), 500
+    print(f"[Location] User {user_id} uploaded {len(parsed)} fixes, {len(transitions)} transition(s)")
+    emit_zone_transitions(user_id, transitions)
+    
+    newest = max(parsed, key=lambda fix: fix['timestamp'])
+    position_feed.publish(user_id, newest)
+    return jsonify({
+        'message': 'Locations stored successfully',
+        'received': len(parsed),
+        'stored': stored,
+        'geofence_alerts': [
+            {key: t[key] for key in ('id', 'name', 'zone_type', 'risk_level', 'warning_message', 'description')}
+            for t in transitions if t['event'] == 'enter'
+        ],
+        'geofence_transitions': transitions,
+        'inside_zone_ids': [zone['id'] for zone in zones],
+        'safety_score': safety_score(newest['latitude'], newest['longitude'])
+    }), 200
 
 @location_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_location_history():
+    """
+    Own location history, newest first, paginated by `limit`/`cursor`.
+    `tolerance` (metres) simplifies each page's track server-side.
+    With `Accept: application/x-ndjson` the whole range (or the first
+    `limit` fixes) is streamed one fix per line instead of paged.
+    """
     user_id = int(get_jwt_identity())  # Convert string back to int
     hours = request.args.get('hours', 24, type=int)
     since = datetime.utcnow() - timedelta(hours=hours)
-    locations = UserLocation.query.filter(
-        UserLocation.user_id == user_id,
-        UserLocation.timestamp >= since
-    ).order_by(UserLocation.timestamp.desc()).all()
-    return jsonify({'locations': [loc.to_dict() for loc in locations], 'count': len(locations)}), 200
+    tolerance = request.args.get('tolerance', type=float)
+    if wants_ndjson():
+        if tolerance is not None:
+            return jsonify({'error': 'tolerance is not supported for streamed history'}), 400
+        try:
+            fixes = history_stream(
+                user_id, since, cursor=request.args.get('cursor'), limit=request.args.get('limit', type=int),
+                chunk_rows=current_app.config['NDJSON_CHUNK_ROWS']
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        return ndjson_response(fixes)
+    
+    limit = request.args.get('limit', current_app.config['LOCATION_HISTORY_DEFAULT_LIMIT'], type=int)
+    limit = max(1, min(limit, current_app.config['LOCATION_HISTORY_MAX_LIMIT']))
+    if tolerance is not None and tolerance < 0:
+        return jsonify({'error': 'tolerance must be a non-negative distance in metres'}), 400
+    try:
+        locations, next_cursor, scanned = history_page(
+            user_id, since, limit, cursor=request.args.get('cursor'), tolerance_m=tolerance
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({
+        'locations': locations,
+        'count': len(locations),
+        'scanned': scanned,
+        'next_cursor': next_cursor
+    }), 200
+
+@location_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_location_history():
+    """
+    Stream all fixes in [start, end) as a columnar file (authorities only).
+    format=parquet|arrow|npz (default parquet); start/end are ISO 8601 or
+    epoch timestamps (default: the last 24 hours); user_id=1,2 restricts
+    the export to some tourists.
+    """
+    user = User.query.get(int(get_jwt_identity()))
+    if user.role != 'authority':
+        return jsonify({'error': 'Unauthorized - Authority access required'}), 403
+    
+    fmt = request.args.get('format', 'parquet')
+    now = datetime.utcnow()
+    try:
+        check_format(fmt)
+        end = parse_timestamp(request.args.get('end'), now)
+        start = parse_timestamp(request.args['start'], now) if request.args.get('start') else end - timedelta(hours=24)
+        user_ids = [int(value) for value in request.args.get('user_id', '').split(',') if value.strip()]
+    except (TypeError, ValueError, OverflowError) as e:
+        return jsonify({'error': str(e)}), 400
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+    if end - start > timedelta(days=current_app.config['LOCATION_EXPORT_MAX_DAYS']):
+        return jsonify({'error': f"range is limited to {current_app.config['LOCATION_EXPORT_MAX_DAYS']} days; use export_locations.py for more"}), 400
+    
+    chunks = export_chunks(fmt, start, end, user_ids, chunk_rows=current_app.config['LOCATION_EXPORT_CHUNK_ROWS'])
+    print(f"[Location] Authority {user.id} exporting fixes {start.isoformat()} - {end.isoformat()} as {fmt}")
+    return Response(stream_with_context(chunks), mimetype=MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{export_filename(fmt, start, end)}"'
+    })
 
 @location_bp.route('/all-tourists', methods=['GET'])
 @jwt_required()
 def get_all_tourist_locations():
-    """Get real-time locations of all active tourists (authorities only)"""
+    """
+    Get real-time locations of all active tourists (authorities only).
+    Optional: bbox=minLon,minLat,maxLon,maxLat limits results to the map
+    viewport; zoom=<0-22> below TOURIST_CLUSTER_MAX_ZOOM returns grid
+    clusters (plus lone tourists) instead of every tourist; since= returns
+    only tourists who moved since the previous poll's cursor.
+    """
     user_id = int(get_jwt_identity())
     user = User.query.get(user_id)
     
@@ -76,45 +187,57 @@ def get_all_tourist_locations():
     if user.role != 'authority':
         return jsonify({'error': 'Unauthorized - Authority access required'}), 403
     
-    # Get latest location for each tourist
-    # Get all tourists
-    tourists = User.query.filter_by(role='tourist').all()
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    zoom = request.args.get('zoom', type=int)
     
-    tourist_locations = []
-    for tourist in tourists:
-        # Get most recent location
-        latest_location = UserLocation.query.filter_by(user_id=tourist.id).order_by(UserLocation.timestamp.desc()).first()
-        
-        if latest_location:
-            tourist_locations.append({
-                'user_id': tourist.id,
-                'user_name': tourist.name,
-                'user_email': tourist.email,
-                'user_phone': tourist.phone,
-                'latitude': latest_location.latitude,
-                'longitude': latest_location.longitude,
-                'accuracy': latest_location.accuracy,
-                'timestamp': latest_location.timestamp.isoformat(),
-                'last_seen': get_time_ago(latest_location.timestamp)
-            })
+    # Optional incremental polling: only tourists whose position changed since `since`
+    since = request.args.get('since')
+    now = datetime.utcnow()
+    if since:
+        try:
+            since = parse_timestamp(since, now)
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'since must be an ISO 8601 timestamp or epoch milliseconds'}), 400
+    
+    # Latest position of every tourist in one indexed read
+    query = db.session.query(User, UserLatestLocation).join(
+        UserLatestLocation, UserLatestLocation.user_id == User.id
+    ).filter(User.role == 'tourist')
+    
+    if zoom is not None and zoom < current_app.config['TOURIST_CLUSTER_MAX_ZOOM']:
+        # Zoomed out: counts per cluster, full details only for lone tourists
+        clusters, singles = cluster_tourists(bbox, max(zoom, 0), current_app.config['TOURIST_CLUSTER_RADIUS_PX'])
+        rows = query.filter(User.id.in_(singles)).all() if singles else []
+        tourist_locations = tourist_positions([
+            (tourist, latest.latitude, latest.longitude, latest.accuracy, latest.timestamp)
+            for tourist, latest in rows
+        ])
+        return jsonify({
+            'mode': 'clusters',
+            'clusters': clusters,
+            'locations': tourist_locations,
+            'count': len(tourist_locations) + sum(cluster['count'] for cluster in clusters),
+            'timestamp': datetime.now().isoformat()
+        }), 200
+    
+    query = in_bbox(query, bbox)
+    if since:
+        query = query.filter(UserLatestLocation.updated_at > since)
+    
+    tourist_locations = tourist_positions([
+        (tourist, latest.latitude, latest.longitude, latest.accuracy, latest.timestamp)
+        for tourist, latest in query.all()
+    ])
     
     return jsonify({
+        'mode': 'tourists',
         'locations': tourist_locations,
         'count': len(tourist_locations),
+        'incremental': bool(since),
+        # Pass back as `since` on the next poll
+        'cursor': (now - CURSOR_OVERLAP).isoformat(),
         'timestamp': datetime.now().isoformat()
     }), 200
-
-def get_time_ago(timestamp):
-    """Get human-readable time difference"""
-    now = datetime.now()
-    diff = now - timestamp
-    
-    seconds = diff.total_seconds()
-    if seconds < 60:
-        return f"{int(seconds)}s ago"
-    elif seconds < 3600:
-        return f"{int(seconds/60)}m ago"
-    elif seconds < 86400:
-        return f"{int(seconds/3600)}h ago"
-    else:
-        return f"{int(seconds/86400)}d ago"
@@ -0,0 +1,138 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import text
+import shapely
+from extensions import db
+from models.user import User
+from models.incident import Incident
+from utils import mvt
+from utils.geofence_index import geofence_index, tolerance_for_zoom
+from utils.spatial import using_postgis
+from utils.tile_cache import tile_cache
+
+tiles_bp = Blueprint('tiles', __name__)
+
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+MAX_ZOOM = 22
+
+GEOFENCE_TILE_SQL = text("""
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS env,
+               ST_TileEnvelope(:z, :x, :y, margin => :margin) AS search_env
+    )
+    SELECT ST_AsMVT(tile.*, 'geofences', :extent, 'geom', 'id') FROM (
+        SELECT ST_AsMVTGeom(
+                   ST_Transform(CASE WHEN :tolerance > 0
+                                     THEN ST_SimplifyPreserveTopology(g.geom, :tolerance)
+                                     ELSE g.geom END, 3857),
+                   bounds.env, :extent, :buffer, true) AS geom,
+               g.id, g.name, g.zone_type, g.risk_level
+        FROM geofences g, bounds
+        WHERE g.active AND g.geom && ST_Transform(bounds.search_env, 4326)
+    ) AS tile WHERE tile.geom IS NOT NULL
+""")
+
+INCIDENT_TILE_SQL = """
+    WITH bounds AS (SELECT ST_TileEnvelope(:z, :x, :y) AS env)
+    SELECT ST_AsMVT(tile.*, 'incidents', :extent, 'geom', 'id') FROM (
+        SELECT ST_AsMVTGeom(
+                   ST_Transform(ST_SetSRID(ST_MakePoint(i.longitude, i.latitude), 4326), 3857),
+                   bounds.env, :extent, :buffer, true) AS geom,
+               i.id, i.type, i.priority, i.status, to_char(i.created_at, 'YYYY-MM-DD"T"HH24:MI:SS') AS created_at
+        FROM incidents i, bounds
+        WHERE i.latitude BETWEEN :min_lat AND :max_lat
+          AND i.longitude BETWEEN :min_lon AND :max_lon
+          {status_filter}
+    ) AS tile WHERE tile.geom IS NOT NULL
+"""
+
+
+def _geofence_tile(z, x, y, bounds):
+    tolerance = tolerance_for_zoom(z)
+    if using_postgis():
+        try:
+            row = db.session.execute(GEOFENCE_TILE_SQL, {
+                'z': z, 'x': x, 'y': y, 'extent': mvt.EXTENT, 'buffer': mvt.BUFFER,
+                'margin': mvt.BUFFER / mvt.EXTENT, 'tolerance': tolerance or 0
+            }).first()
+            return bytes(row[0]) if row and row[0] else b''
+        except Exception as e:
+            print(f"[Tiles] ST_AsMVT failed for geofences, using Python encoder: {e}")
+            db.session.rollback()
+    features = (
+        (entry.id, mvt.to_tile_geometry(entry.simplified(tolerance)[0], z, x, y), {
+            'name': entry.zone['name'],
+            'zone_type': entry.zone['zone_type'],
+            'risk_level': entry.zone['risk_level']
+        })
+        for entry in geofence_index.query_bbox(*bounds)
+    )
+    return mvt.encode_layer('geofences', features)
+
+
+def _incident_tile(z, x, y, bounds, status):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    if using_postgis():
+        try:
+            sql = text(INCIDENT_TILE_SQL.format(status_filter='AND i.status = :status' if status else ''))
+            row = db.session.execute(sql, {
+                'z': z, 'x': x, 'y': y, 'extent': mvt.EXTENT, 'buffer': mvt.BUFFER,
+                'min_lon': min_lon, 'min_lat': min_lat, 'max_lon': max_lon, 'max_lat': max_lat,
+                'status': status
+            }).first()
+            return bytes(row[0]) if row and row[0] else b''
+        except Exception as e:
+            print(f"[Tiles] ST_AsMVT failed for incidents, using Python encoder: {e}")
+            db.session.rollback()
+    query = Incident.query.filter(
+        Incident.latitude.between(min_lat, max_lat),
+        Incident.longitude.between(min_lon, max_lon)
+    )
+    if status:
+        query = query.filter_by(status=status)
+    features = (
+        (incident.id, mvt.to_tile_geometry(shapely.Point(incident.longitude, incident.latitude), z, x, y), {
+            'type': incident.type,
+            'priority': incident.priority,
+            'status': incident.status,
+            'created_at': incident.created_at.isoformat() if incident.created_at else None
+        })
+        for incident in query.all()
+    )
+    return mvt.encode_layer('incidents', features)
+
+
+@tiles_bp.route('/<layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+@jwt_required(optional=True)
+def get_tile(layer, z, x, y):
+    """
+    Mapbox Vector Tile for the geofences or incidents layer.
+    Incidents are authority-only and accept ?status= to filter.
+    """
+    if layer not in ('geofences', 'incidents'):
+        return jsonify({'error': f'Unknown layer: {layer}'}), 404
+    if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': 'Tile out of range'}), 400
+
+    status = None
+    if layer == 'incidents':
+        user_id = get_jwt_identity()
+        user = User.query.get(int(user_id)) if user_id else None
+        if not user or user.role != 'authority':
+            return jsonify({'error': 'Unauthorized - Authority access required'}), 403
+        status = request.args.get('status')
+
+    cache_key = (layer, z, x, y, status)
+    data = tile_cache.get(cache_key)
+    if data is None:
+        bounds = mvt.buffered_tile_bounds(z, x, y)
+        if layer == 'geofences':
+            data = _geofence_tile(z, x, y, bounds)
+        else:
+            data = _incident_tile(z, x, y, bounds, status)
+        tile_cache.put(cache_key, layer, bounds, data)
+
+    response = current_app.response_class(data, status=200, mimetype=MVT_MIMETYPE)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache' if layer == 'geofences' else 'private, no-cache'
+    return response.make_conditional(request)
@@ -88,12 +88,21 @@ def delete_account():
         
         # Delete all associated data (cascade should handle this, but being explicit)
         # Delete user locations
-        from models.user import UserLocation
+        from models.user import UserLocation, UserLatestLocation
         UserLocation.query.filter_by(user_id=user_id).delete()
+        UserLatestLocation.query.filter_by(user_id=user_id).delete()
         
         # Delete itineraries
         Itinerary.query.filter_by(user_id=user_id).delete()
         
+        # Delete geofence membership state
+        from models.geofence import UserZoneState
+        from utils.zone_transitions import zone_tracker
+        UserZoneState.query.filter_by(user_id=user_id).delete()
+        zone_tracker.forget(user_id)
+        from utils.fix_filter import fix_filter
+        fix_filter.forget(user_id)
+        
         # Delete incidents reported by user (correct field name is user_id)
         from models.incident import Incident
         Incident.query.filter_by(user_id=user_id).delete()
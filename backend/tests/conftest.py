@@ -0,0 +1,48 @@
+"""
+Shared fixtures. The app module builds its Flask app at import time, so
+FLASK_ENV must be set first; TestingConfig uses an in-memory SQLite
+database that lives for the whole session (with the sample zones and
+accounts seeded by initialize_sample_data).
+"""
+import itertools
+import os
+import sys
+
+import pytest
+
+os.environ['FLASK_ENV'] = 'testing'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_emails = itertools.count()
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def tourist(app):
+    """(user_id, auth headers) for a fresh tourist account"""
+    from flask_jwt_extended import create_access_token
+    from extensions import db
+    from models.user import User
+    with app.app_context():
+        user = User(email=f'tourist{next(_emails)}@example.com', name='Test Tourist',
+                    phone='+910000000000', role='tourist', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+        return user.id, {'Authorization': f'Bearer {token}'}
@@ -0,0 +1,81 @@
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from utils.fix_filter import fix_filter, STORE, MERGE, DROP
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+# ~11 m per 0.0001 degrees of latitude
+STEP = 0.0001
+_user_ids = itertools.count(900000)
+
+
+@pytest.fixture
+def user_id(app_context):
+    return next(_user_ids)
+
+
+def fix(seconds, north=0.0, accuracy=5.0):
+    return {'latitude': 26.92 + north, 'longitude': 75.82, 'accuracy': accuracy,
+            'timestamp': T0 + timedelta(seconds=seconds)}
+
+
+def accept(user_id, f, zones=()):
+    """Classify f and report it back the way ingest_fix does, then commit"""
+    decision, _ = fix_filter.classify(user_id, f)
+    if decision == STORE:
+        fix_filter.stored(user_id, f, list(zones))
+    elif decision == MERGE:
+        fix_filter.merged(user_id, f)
+    db.session.commit()
+    return decision
+
+
+def test_first_fix_is_stored(user_id):
+    assert accept(user_id, fix(0)) == STORE
+
+
+def test_jitter_is_dropped_then_merged(user_id):
+    accept(user_id, fix(0))
+    assert accept(user_id, fix(5, north=STEP / 4)) == DROP
+    assert accept(user_id, fix(15, north=STEP / 4)) == MERGE
+    # The merge moved the last accepted time forward
+    assert accept(user_id, fix(20)) == DROP
+
+
+def test_movement_is_stored(user_id):
+    accept(user_id, fix(0))
+    assert accept(user_id, fix(5, north=3 * STEP)) == STORE
+
+
+def test_poor_accuracy_widens_the_noise_radius(user_id):
+    accept(user_id, fix(0))
+    assert accept(user_id, fix(15, north=3 * STEP, accuracy=100.0)) == MERGE
+
+
+def test_heartbeat_stores_a_parked_phone(user_id):
+    accept(user_id, fix(0))
+    assert accept(user_id, fix(fix_filter.heartbeat.total_seconds())) == STORE
+
+
+def test_merged_zones_come_from_the_stored_fix(user_id):
+    zones = [{'id': 1, 'risk_level': 'high'}]
+    accept(user_id, fix(0), zones)
+    assert fix_filter.classify(user_id, fix(15)) == (MERGE, zones)
+
+
+def test_classify_changes_nothing_until_commit(user_id):
+    accept(user_id, fix(0))
+    decision, _ = fix_filter.classify(user_id, fix(15))
+    assert decision == MERGE
+    fix_filter.merged(user_id, fix(15))
+    db.session.rollback()
+    # The rolled back merge did not count as accepted
+    assert fix_filter.classify(user_id, fix(16))[0] == MERGE
+
+    decision, _ = fix_filter.classify(user_id, fix(60, north=3 * STEP))
+    fix_filter.stored(user_id, fix(60, north=3 * STEP), [])
+    db.session.rollback()
+    assert fix_filter.speed(user_id, fix(60, north=3 * STEP)) > 0
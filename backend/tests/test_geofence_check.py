@@ -0,0 +1,35 @@
+import numpy as np
+
+
+def test_check_batch_matches_single_checks(client):
+    rng = np.random.default_rng(11)
+    # Around the seeded Jaipur zone, half of them inside
+    points = np.column_stack((rng.uniform(26.917, 26.925, 60), rng.uniform(75.821, 75.829, 60))).tolist()
+    # Both point formats, mixed
+    body = [point if i % 2 else {'latitude': point[0], 'longitude': point[1]} for i, point in enumerate(points)]
+
+    response = client.post('/api/geofence/check-batch', json={'points': body})
+    assert response.status_code == 200
+    batch = response.json
+    assert batch['count'] == len(points)
+
+    expected = []
+    for latitude, longitude in points:
+        single = client.post('/api/geofence/check', json={'latitude': latitude, 'longitude': longitude})
+        assert single.status_code == 200
+        expected.append(sorted(zone['id'] for zone in single.json['inside_geofences']))
+    assert [sorted(ids) for ids in batch['results']] == expected
+    assert batch['points_inside'] == sum(1 for ids in expected if ids)
+    assert 0 < batch['points_inside'] < len(points)
+    assert sorted(zone['id'] for zone in batch['zones']) == sorted({i for ids in expected for i in ids})
+
+
+def test_check_batch_rejects_a_malformed_point(client):
+    response = client.post('/api/geofence/check-batch', json={'points': [[26.92, 75.82], {'latitude': 26.92}]})
+    assert response.status_code == 400
+    assert response.json['error'].startswith('Point 1 ')
+
+
+def test_check_rejects_non_numeric_coordinates(client):
+    response = client.post('/api/geofence/check', json={'latitude': 'north', 'longitude': 75.82})
+    assert response.status_code == 400
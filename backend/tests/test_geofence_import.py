@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from utils import geofence_import
+from utils.geofence_import import GeoJSONStreamError, iter_features
+
+
+def square(lon, lat, size=0.001):
+    return [[[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]]
+
+
+def feature(i, name=None):
+    return {
+        'type': 'Feature',
+        'properties': {'name': name or f'Zone {i}', 'risk_level': 'high'},
+        'geometry': {'type': 'Polygon', 'coordinates': square(75.0 + i * 0.01, 26.0)}
+    }
+
+
+def test_feature_collection():
+    doc = {'type': 'FeatureCollection', 'features': [feature(i) for i in range(3)]}
+    features = list(iter_features(io.BytesIO(json.dumps(doc).encode())))
+    assert [f['properties']['name'] for f in features] == ['Zone 0', 'Zone 1', 'Zone 2']
+
+
+def test_pretty_printed_collection_with_features_first():
+    # More than the 4 KB sniff window of features before "type"
+    doc = {'features': [feature(i) for i in range(200)], 'type': 'FeatureCollection'}
+    text = json.dumps(doc, indent=2)
+    assert text.index('"type": "FeatureCollection"') > 4096
+    features = list(iter_features(io.BytesIO(text.encode())))
+    assert len(features) == 200
+    assert all(f['type'] == 'Feature' for f in features)
+
+
+def test_ndjson():
+    text = '\n'.join(json.dumps(feature(i)) for i in range(5)) + '\n'
+    features = list(iter_features(io.BytesIO(text.encode())))
+    assert len(features) == 5
+
+
+def test_multibyte_names_across_chunk_boundaries(monkeypatch):
+    monkeypatch.setattr(geofence_import, 'CHUNK_SIZE', 40)
+    names = ['जयपुर पुराना शहर', 'दिल्ली प्रतिबंधित क्षेत्र', 'गेटवे ऑफ इंडिया']
+    doc = {'type': 'FeatureCollection', 'features': [feature(i, name) for i, name in enumerate(names)]}
+    data = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+    features = list(iter_features(io.BytesIO(data)))
+    assert [f['properties']['name'] for f in features] == names
+
+
+def test_invalid_utf8_is_a_stream_error():
+    data = b'{"type": "FeatureCollection", "features": [{"name": "\xff\xfe"}]}'
+    with pytest.raises(GeoJSONStreamError):
+        list(iter_features(io.BytesIO(data)))
+
+
+def test_truncated_multibyte_character_is_a_stream_error():
+    data = '{"name": "जय'.encode('utf-8')[:-1]
+    with pytest.raises(GeoJSONStreamError):
+        list(iter_features(io.BytesIO(data)))
+
+
+def test_empty_input_yields_nothing():
+    assert list(iter_features(io.BytesIO(b'  \n'))) == []
@@ -0,0 +1,96 @@
+import json
+import re
+
+import numpy as np
+import pytest
+import shapely
+
+from extensions import db
+from models.geofence import Geofence
+from utils.geofence_index import GeofenceIndex, IndexedZone, SIMPLIFY_TOLERANCES, geofence_index
+
+
+def test_simplified_payload_has_no_float_noise():
+    circle = shapely.buffer(shapely.Point(75.8234567, 26.9212345), 0.01, quad_segs=64)
+    zone = IndexedZone(1, circle, {'id': 1, 'name': 'Circle'})
+    sizes = []
+    for tolerance in SIMPLIFY_TOLERANCES:
+        geometry, payload = zone.simplified(tolerance)
+        assert geometry.is_valid
+        numbers = re.findall(r'-?\d+\.\d+', json.dumps(json.loads(payload)['polygon']))
+        assert max(len(number.split('.')[1]) for number in numbers) <= 6
+        sizes.append(len(payload))
+    assert sizes == sorted(sizes, reverse=True)
+    assert zone.simplified(None)[0] is circle
+
+
+def zone_entry(zone_id, lon, lat, size=0.01):
+    polygon = shapely.box(lon, lat, lon + size, lat + size)
+    shapely.prepare(polygon)
+    return IndexedZone(zone_id, polygon, {'id': zone_id, 'name': f'Zone {zone_id}', 'risk_level': 'low'})
+
+
+def ids(entries):
+    return sorted(entry.id for entry in entries)
+
+
+@pytest.fixture
+def index(app_context):
+    """A private index loaded with the seeded zones that rebuilds once two zones are patched"""
+    index = GeofenceIndex(rebuild_threshold=1)
+    index.load()
+    return index
+
+
+def test_containment(index):
+    jaipur = index.query_point(75.825, 26.921)
+    assert [entry.zone['name'] for entry in jaipur] == ['Jaipur Old City - High Tourist Zone']
+    assert index.query_point(75.0, 26.0) == []
+    # Numeric strings are accepted, like JSON bodies from older clients
+    assert ids(index.query_point('75.825', '26.921')) == ids(jaipur)
+    with pytest.raises(ValueError):
+        index.query_point('east', 26.921)
+
+
+def test_patching_through_overlay_and_rebuild(index):
+    index.apply(-1, zone_entry(-1, 10.0, 10.0))
+    assert ids(index.query_point(10.005, 10.005)) == [-1]
+
+    # Moving a zone hides its old position even before the tree is rebuilt
+    index.apply(-1, zone_entry(-1, 20.0, 20.0))
+    assert index.query_point(10.005, 10.005) == []
+    assert ids(index.query_point(20.005, 20.005)) == [-1]
+
+    index.apply(-2, zone_entry(-2, 20.0, 20.0))  # past the threshold: rebuilt
+    assert index._overlay == {}
+    assert ids(index.query_point(20.005, 20.005)) == [-2, -1]
+
+    index.remove(-1)
+    assert ids(index.query_point(20.005, 20.005)) == [-2]
+    index.remove(-2)
+    assert index.query_point(20.005, 20.005) == []
+
+
+def test_vectorised_queries_match_single_point_queries(index):
+    index.apply(-3, zone_entry(-3, 75.82, 26.915))  # overlaps Jaipur
+    rng = np.random.default_rng(7)
+    lons = rng.uniform(75.81, 75.84, 200)
+    lats = rng.uniform(26.91, 26.93, 200)
+    batched = index.query_points(lons, lats)
+    assert [ids(hits) for hits in batched] == [ids(index.query_point(lon, lat)) for lon, lat in zip(lons, lats)]
+    assert any(len(hits) == 2 for hits in batched)
+
+
+def test_committed_geofence_changes_patch_the_shared_index(app_context):
+    zone = Geofence(name='Test Square', zone_type='restricted', risk_level='high',
+                    polygon_data=json.dumps(shapely.geometry.mapping(shapely.box(30.0, 30.0, 30.01, 30.01))))
+    db.session.add(zone)
+    db.session.commit()
+    try:
+        assert ids(geofence_index.query_point(30.005, 30.005)) == [zone.id]
+        zone.active = False
+        db.session.commit()
+        assert geofence_index.query_point(30.005, 30.005) == []
+    finally:
+        db.session.delete(zone)
+        db.session.commit()
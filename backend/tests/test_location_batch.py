@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+
+from models.user import UserLocation
+
+# Inside the seeded Jaipur zone (medium risk)
+JAIPUR = {'latitude': 26.921, 'longitude': 75.825}
+
+
+def epoch_ms(when):
+    return int((when - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def test_parked_batch_keeps_every_fix(client, tourist, app_context):
+    user_id, headers = tourist
+    start = datetime.utcnow() - timedelta(minutes=2)
+    # One fix every 2 s from a parked phone: the filter would drop most of them
+    fixes = [dict(JAIPUR, accuracy=5, timestamp=epoch_ms(start + timedelta(seconds=2 * i))) for i in range(30)]
+
+    response = client.post('/api/location/batch', json={'fixes': fixes}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json['received'] == response.json['stored'] == 30
+    assert UserLocation.query.filter_by(user_id=user_id).count() == 30
+    assert [t['event'] for t in response.json['geofence_transitions']] == ['enter']
+    assert len(response.json['inside_zone_ids']) == 1
@@ -0,0 +1,129 @@
+import struct
+
+import shapely
+
+from utils import mvt
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_message(data):
+    """[(field number, value)] of a protobuf message; length-delimited values stay bytes"""
+    fields, pos = [], 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack('<d', data[pos:pos + 8])[0], pos + 8
+        else:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        fields.append((number, value))
+    return fields
+
+
+def packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_layer(tile):
+    (number, layer), = read_message(tile)
+    assert number == 3
+    fields = read_message(layer)
+    layer = {'features': [], 'keys': [], 'values': []}
+    for number, value in fields:
+        if number == 1:
+            layer['name'] = value.decode()
+        elif number == 2:
+            layer['features'].append(dict(
+                (n, packed(v) if n in (2, 4) else v) for n, v in read_message(value)
+            ))
+        elif number == 3:
+            layer['keys'].append(value.decode())
+        elif number == 4:
+            (kind, raw), = read_message(value)
+            layer['values'].append(raw.decode() if kind == 1 else raw)
+        elif number == 5:
+            layer['extent'] = value
+        elif number == 15:
+            layer['version'] = value
+    return layer
+
+
+def test_polygon_layer_round_trip():
+    z, x, y = 14, 11642, 6919  # central Jaipur
+    min_lon, min_lat, max_lon, max_lat = mvt.tile_bounds(z, x, y)
+    # A square covering the middle of the tile
+    square = shapely.box(min_lon + (max_lon - min_lon) / 4, min_lat + (max_lat - min_lat) / 4,
+                         max_lon - (max_lon - min_lon) / 4, max_lat - (max_lat - min_lat) / 4)
+    geometry = mvt.to_tile_geometry(square, z, x, y)
+    layer = decode_layer(mvt.encode_layer('geofences', [
+        (7, geometry, {'name': 'Test', 'risk_level': 'high', 'score': 3, 'description': None})
+    ]))
+
+    assert (layer['name'], layer['version'], layer['extent']) == ('geofences', 2, mvt.EXTENT)
+    (feature,) = layer['features']
+    assert feature[1] == 7
+    assert feature[3] == mvt.GEOM_POLYGON
+    tags = feature[2]
+    properties = {layer['keys'][k]: layer['values'][v] for k, v in zip(tags[::2], tags[1::2])}
+    assert properties == {'name': 'Test', 'risk_level': 'high', 'score': 3}
+
+    commands = feature[4]
+    assert commands[0] == mvt._command(mvt.CMD_MOVE_TO, 1)
+    assert commands[3] == mvt._command(mvt.CMD_LINE_TO, 3)
+    assert commands[-1] == mvt._command(mvt.CMD_CLOSE_PATH, 1)
+    x0, y0 = unzigzag(commands[1]), unzigzag(commands[2])
+    points = [(x0, y0)]
+    for dx, dy in zip(commands[4:-1:2], commands[5:-1:2]):
+        points.append((points[-1][0] + unzigzag(dx), points[-1][1] + unzigzag(dy)))
+    # Square in the middle quarter of the tile; Mercator stretches y slightly
+    assert sorted({px for px, _ in points}) == [1024, 3072]
+    assert all(abs(py - 1024) <= 2 or abs(py - 3072) <= 2 for _, py in points)
+    # Exterior rings wind clockwise in tile space (positive shoelace area, y down)
+    area = sum(ax * by - bx * ay for (ax, ay), (bx, by) in zip(points, points[1:] + points[:1]))
+    assert area > 0
+
+
+def test_geometry_outside_the_tile_is_dropped():
+    assert mvt.to_tile_geometry(shapely.box(0, 0, 1, 1), 14, 11642, 6919) is None
+    assert mvt.encode_layer('geofences', [(1, None, {})]) == b''
+
+
+def test_points_layer():
+    z, x, y = 14, 11642, 6919
+    min_lon, min_lat, max_lon, max_lat = mvt.tile_bounds(z, x, y)
+    point = mvt.to_tile_geometry(shapely.Point(min_lon, max_lat), z, x, y)
+    layer = decode_layer(mvt.encode_layer('incidents', [(1, point, {'status': 'active'})]))
+    (feature,) = layer['features']
+    assert feature[3] == mvt.GEOM_POINT
+    assert feature[4] == [mvt._command(mvt.CMD_MOVE_TO, 1), 0, 0]
+
+
+def test_tile_route_serves_the_seeded_zone(client):
+    # The tile holding the Jaipur sample zone
+    response = client.get('/api/tiles/geofences/14/11642/6919.mvt')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.mapbox-vector-tile'
+    layer = decode_layer(response.data)
+    assert layer['name'] == 'geofences' and layer['features']
+    assert client.get('/api/tiles/geofences/1/2/0.mvt').status_code == 400
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models.geofence import Geofence, UserZoneState
+from utils.zone_transitions import zone_tracker
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def zone(app_context):
+    return Geofence.query.filter_by(risk_level='medium').first().to_dict()
+
+
+def events(transitions):
+    return [t['event'] for t in transitions]
+
+
+def test_rolled_back_update_leaves_state_alone(tourist, zone):
+    user_id, _ = tourist
+    assert events(zone_tracker.update(user_id, [zone], now=T0)) == ['enter']
+    db.session.rollback()
+    assert UserZoneState.query.filter_by(user_id=user_id).count() == 0
+
+    # Nothing was committed, so the same fix is still an entry
+    assert events(zone_tracker.update(user_id, [zone], now=T0)) == ['enter']
+    db.session.commit()
+    assert events(zone_tracker.update(user_id, [zone], now=T0 + timedelta(seconds=5))) == []
+    db.session.commit()
+
+
+def test_batch_replay_sees_its_own_uncommitted_state(tourist, zone):
+    user_id, _ = tourist
+    assert events(zone_tracker.update(user_id, [zone], now=T0)) == ['enter']
+    # Same transaction: the entry above is not repeated
+    assert events(zone_tracker.update(user_id, [zone], now=T0 + timedelta(seconds=5))) == []
+    db.session.commit()
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(zone_tracker, 'cooldown', timedelta(seconds=60))
+    monkeypatch.setattr(zone_tracker, 'dwell', timedelta(seconds=600))
+    monkeypatch.setattr(zone_tracker, 'dwell_repeat', None)
+    return zone_tracker
+
+
+def feed(tracker, user_id, zones, seconds):
+    transitions = tracker.update(user_id, zones, now=T0 + timedelta(seconds=seconds))
+    db.session.commit()
+    return transitions
+
+
+def test_enter_dwell_exit(tracker, tourist, zone):
+    user_id, _ = tourist
+    assert events(feed(tracker, user_id, [zone], 0)) == ['enter']
+    assert events(feed(tracker, user_id, [zone], 30)) == []
+    dwell = feed(tracker, user_id, [zone], 600)
+    assert events(dwell) == ['dwell']
+    assert dwell[0]['id'] == zone['id'] and dwell[0]['dwell_seconds'] == 600
+    assert events(feed(tracker, user_id, [zone], 700)) == []  # dwell is not repeated
+    exit_ = feed(tracker, user_id, [], 710)
+    assert events(exit_) == ['exit'] and exit_[0]['dwell_seconds'] == 710
+    assert events(feed(tracker, user_id, [], 800)) == []
+    assert UserZoneState.query.filter_by(user_id=user_id).count() == 0
+
+
+def test_boundary_jitter_is_held_back_by_the_cooldown(tracker, tourist, zone):
+    user_id, _ = tourist
+    assert events(feed(tracker, user_id, [zone], 0)) == ['enter']
+    assert events(feed(tracker, user_id, [], 10)) == []
+    assert events(feed(tracker, user_id, [zone], 20)) == []
+    # Still inside once the cooldown has passed: nothing to report
+    assert events(feed(tracker, user_id, [zone], 90)) == []
+    # Left for good: the exit is reported after the cooldown
+    assert events(feed(tracker, user_id, [], 100)) == ['exit']
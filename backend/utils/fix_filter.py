@@ -0,0 +1,203 @@
+"""
+Movement-aware filtering of incoming location fixes.
+
+A parked phone keeps reporting fixes that differ only by GPS jitter. Each
+live fix is compared with the user's last stored fix and classified:
+
+- store: it moved further than the noise radius (the larger of the two
+  fixes' reported accuracy and FIX_FILTER_MIN_MOVE_M), it is the first fix
+  we know of, or FIX_FILTER_HEARTBEAT_SECONDS have passed since the last
+  stored one - it is written to history and containment is evaluated.
+- merge: it did not move, but enough time has passed to matter - no
+  history row and no containment query; the user's latest position is
+  extended to the new time and zone dwell is advanced using the zones of
+  the stored fix.
+- drop: it did not move and arrived within FIX_FILTER_MIN_INTERVAL_SECONDS
+  of the last accepted fix - nothing is written.
+
+Because "moved" is measured from the last stored fix (not the previous
+one), slow movement still accumulates into stored points, so paths keep
+their shape to within the noise radius.
+
+State is per process, bounded (LRU) and rebuilt from the next fix after a
+restart, which is simply stored. classify() only reads it; stored() and
+merged() stage the new reference on the session, and it replaces the
+per-process one when the session commits (a rollback discards it).
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from utils.geofence_index import haversine_m
+
+STORE = 'stored'
+MERGE = 'merged'
+DROP = 'dropped'
+
+
+class LastFix:
+    """The last stored fix for one user and the zones it was inside"""
+    __slots__ = ('latitude', 'longitude', 'accuracy', 'timestamp', 'accepted_at', 'zones')
+
+    def __init__(self, fix, zones, accepted_at=None):
+        self.latitude = fix['latitude']
+        self.longitude = fix['longitude']
+        self.accuracy = fix.get('accuracy')
+        self.timestamp = fix['timestamp']
+        self.accepted_at = accepted_at or fix['timestamp']
+        self.zones = zones
+
+    def accepted(self, timestamp):
+        """Copy with accepted_at moved to a merged fix's time"""
+        fix = {'latitude': self.latitude, 'longitude': self.longitude,
+               'accuracy': self.accuracy, 'timestamp': self.timestamp}
+        return LastFix(fix, self.zones, accepted_at=timestamp)
+
+
+class FixFilter:
+    """Decides per fix whether to store, merge or drop it"""
+
+    def __init__(self, min_move_m=10.0, min_interval_seconds=10, heartbeat_seconds=300, max_users=10000):
+        self.enabled = True
+        self.min_move_m = min_move_m
+        self.min_interval = timedelta(seconds=min_interval_seconds)
+        self.heartbeat = timedelta(seconds=heartbeat_seconds)
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> LastFix
+        self._stats = {STORE: 0, MERGE: 0, DROP: 0}
+
+    def configure(self, config):
+        self.enabled = bool(config.get('FIX_FILTER_ENABLED', True))
+        self.min_move_m = float(config.get('FIX_FILTER_MIN_MOVE_M', 10))
+        self.min_interval = timedelta(seconds=config.get('FIX_FILTER_MIN_INTERVAL_SECONDS', 10))
+        self.heartbeat = timedelta(seconds=config.get('FIX_FILTER_HEARTBEAT_SECONDS', 300))
+        self.max_users = config.get('FIX_FILTER_MAX_USERS', 10000)
+
+    def _reference(self, user_id):
+        """This transaction's staged reference for the user, else the committed one"""
+        staged = db.session.info.get(_PENDING_KEY)
+        if staged and user_id in staged:
+            return staged[user_id]
+        with self._lock:
+            last = self._users.get(user_id)
+            if last is not None:
+                self._users.move_to_end(user_id)
+        return last
+
+    def _stage(self, user_id, last):
+        _pending(db.session())[user_id] = last
+
+    def classify(self, user_id, fix):
+        """
+        (decision, zones) for a live fix (newest known for the user). For
+        MERGE and DROP, zones are those of the last stored fix; for STORE the
+        caller evaluates containment and reports it back with stored(). A
+        MERGE is reported back with merged(). Changes nothing itself.
+        """
+        if not self.enabled:
+            return STORE, None
+        last = self._reference(user_id)
+        decision, zones = STORE, None
+        if last is not None and fix['timestamp'] >= last.accepted_at:
+            noise = max(self.min_move_m, last.accuracy or 0.0, fix.get('accuracy') or 0.0)
+            moved = haversine_m(last.longitude, last.latitude, fix['longitude'], fix['latitude']) > noise
+            if not moved and fix['timestamp'] - last.timestamp < self.heartbeat:
+                if fix['timestamp'] - last.accepted_at < self.min_interval:
+                    decision, zones = DROP, last.zones
+                else:
+                    decision, zones = MERGE, last.zones
+        with self._lock:
+            self._stats[decision] += 1
+        return decision, zones
+
+    def speed(self, user_id, fix):
+        """Ground speed in m/s from the last stored fix to this one, or None"""
+        last = self._reference(user_id)
+        if last is None:
+            return None
+        seconds = (fix['timestamp'] - last.timestamp).total_seconds()
+        if seconds <= 0:
+            return None
+        return float(haversine_m(last.longitude, last.latitude, fix['longitude'], fix['latitude'])) / seconds
+
+    def stored(self, user_id, fix, zones):
+        """Stage a stored fix (and the zones it is inside) as the new reference"""
+        if self.enabled:
+            self._stage(user_id, LastFix(fix, zones))
+
+    def merged(self, user_id, fix):
+        """Stage a merged fix's time as the user's last accepted time"""
+        if self.enabled:
+            last = self._reference(user_id)
+            if last is not None:
+                self._stage(user_id, last.accepted(fix['timestamp']))
+
+    def apply(self, staged):
+        """Make references staged by a committed session current"""
+        with self._lock:
+            for user_id, last in staged.items():
+                self._users[user_id] = last
+                self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def forget(self, user_id):
+        """Drop state for a user (e.g. account deleted)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._stats)
+            users = len(self._users)
+        total = sum(counts.values())
+        return dict(
+            counts,
+            enabled=self.enabled,
+            users=users,
+            filtered_ratio=round((counts[MERGE] + counts[DROP]) / total, 3) if total else 0.0
+        )
+
+
+fix_filter = FixFilter()
+
+
+# ----------------------------------------------------------------------
+# Make staged references current only when their transaction commits
+# ----------------------------------------------------------------------
+_PENDING_KEY = 'fix_filter_pending'
+
+
+def _pending(session):
+    """Staged references of the session's transaction (begun now, so a rollback clears them)"""
+    if not session.in_transaction():
+        session.begin()
+    return session.info.setdefault(_PENDING_KEY, {})
+
+
+def _after_commit(session):
+    staged = session.info.pop(_PENDING_KEY, None)
+    if staged:
+        fix_filter.apply(staged)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+_listeners_registered = False
+
+
+def init_app(app):
+    global _listeners_registered
+    fix_filter.configure(app.config)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
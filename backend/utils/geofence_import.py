@@ -0,0 +1,303 @@
+"""
+Streaming bulk import of geofences from GeoJSON.
+
+Reads either a GeoJSON FeatureCollection or newline-delimited GeoJSON
+features from a file-like object without loading the whole document,
+validates/normalises each geometry, and writes zones in batches - with
+COPY on PostgreSQL and a single executemany INSERT per batch elsewhere.
+
+Used by import_geofences.py and POST /api/geofence/import.
+"""
+import codecs
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import shapely
+from shapely.geometry import shape, mapping
+from shapely.geometry.polygon import orient
+
+from extensions import db
+from models.geofence import Geofence
+from utils.geofence_index import geofence_index
+
+CHUNK_SIZE = 1 << 20
+RISK_LEVELS = ('low', 'medium', 'high')
+COORD_DECIMALS = 7  # ~1 cm
+
+_decoder = json.JSONDecoder()
+
+
+class GeoJSONStreamError(ValueError):
+    """Malformed input document (individual bad features are skipped instead)"""
+
+
+# ----------------------------------------------------------------------
+# Streaming parsers
+# ----------------------------------------------------------------------
+class _Reader:
+    """Incremental text buffer over a binary or text stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        # Incremental so a multibyte character split across chunks decodes correctly
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def _decode(self, chunk, final=False):
+        if not isinstance(chunk, bytes):
+            return chunk
+        try:
+            return self.decoder.decode(chunk, final=final)
+        except UnicodeDecodeError as e:
+            raise GeoJSONStreamError(f'Input is not valid UTF-8: {e.reason} at byte {e.start}')
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            # Raises for a document that ends inside a multibyte character
+            tail = self._decode(b'', final=True)
+            if not tail:
+                return False
+            chunk = tail
+        else:
+            chunk = self._decode(chunk)
+        # Drop consumed text so memory stays bounded by the largest feature
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (without consuming it), '' at EOF"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise GeoJSONStreamError(f'Expected {char!r} in GeoJSON document')
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if not self.fill():
+                    raise GeoJSONStreamError(f'Invalid JSON: {e}')
+                continue
+            # A number at the end of the buffer may be truncated
+            if end == len(self.buffer) and not self.eof and not isinstance(obj, (dict, list, str)):
+                self.fill()
+                continue
+            self.pos = end
+            return obj
+
+
+def _iter_feature_collection(reader):
+    reader.expect('{')
+    while True:
+        char = reader.peek()
+        if char == '}':
+            return
+        if char == ',':
+            reader.pos += 1
+            continue
+        key = reader.value()
+        reader.expect(':')
+        if key != 'features':
+            reader.value()  # type, name, crs, bbox ...
+            continue
+        reader.expect('[')
+        while True:
+            char = reader.peek()
+            if char == ']':
+                reader.pos += 1
+                break
+            if char == ',':
+                reader.pos += 1
+                continue
+            if char == '':
+                raise GeoJSONStreamError('Unterminated features array')
+            yield reader.value()
+
+
+def _iter_ndjson(reader):
+    while reader.peek():
+        yield reader.value()
+
+
+def iter_features(stream):
+    """
+    Yield GeoJSON feature dicts from a FeatureCollection or NDJSON stream.
+    The format is sniffed: a leading object with "type": "FeatureCollection"
+    is streamed through its features array, anything else is read as one
+    feature per line.
+    """
+    reader = _Reader(stream)
+    if reader.peek() != '{':
+        if reader.peek() == '':
+            return
+        raise GeoJSONStreamError('Input must be a GeoJSON FeatureCollection or NDJSON features')
+    # Sniff the first few KB for a FeatureCollection header
+    while len(reader.buffer) < 4096 and reader.fill():
+        pass
+    # Pretty-printed documents put newlines/indentation between the tokens
+    head = ''.join(reader.buffer[reader.pos:reader.pos + 4096].split())
+    if '"FeatureCollection"' in head or head.startswith('{"features"'):
+        yield from _iter_feature_collection(reader)
+    else:
+        yield from _iter_ndjson(reader)
+
+
+# ----------------------------------------------------------------------
+# Normalisation
+# ----------------------------------------------------------------------
+def _valid_polygons(geometry):
+    if not geometry.is_valid:
+        geometry = shapely.make_valid(geometry)
+    if geometry.geom_type == 'Polygon':
+        parts = [geometry]
+    else:
+        parts = [part for part in getattr(geometry, 'geoms', []) if part.geom_type == 'Polygon']
+    return [orient(part, sign=1.0) for part in parts if not part.is_empty and part.area > 0]
+
+
+def normalize_feature(feature, number):
+    """
+    Turn one GeoJSON feature into Geofence column dicts. Multi-part and
+    self-intersecting inputs are repaired and split into one zone per polygon.
+    Raises ValueError for features that can't be imported.
+    """
+    if not isinstance(feature, dict):
+        raise ValueError('feature is not an object')
+    if feature.get('type') == 'Feature':
+        geometry_json = feature.get('geometry')
+        properties = feature.get('properties') or {}
+    else:
+        geometry_json, properties = feature, {}
+    if not geometry_json or geometry_json.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError('geometry must be a Polygon or MultiPolygon')
+
+    geometry = shapely.force_2d(shape(geometry_json))
+    min_lon, min_lat, max_lon, max_lat = geometry.bounds
+    if min_lon < -180 or max_lon > 180 or min_lat < -90 or max_lat > 90:
+        raise ValueError('coordinates must be longitude/latitude in EPSG:4326')
+    if not geometry.is_valid:
+        geometry = shapely.make_valid(geometry)
+    geometry = shapely.set_precision(geometry, 10 ** -COORD_DECIMALS)
+    polygons = _valid_polygons(geometry)
+    if not polygons:
+        raise ValueError('geometry is empty after repair')
+
+    name = str(properties.get('name') or f'Imported zone {number}')[:200]
+    risk_level = str(properties.get('risk_level') or 'medium').lower()
+    if risk_level not in RISK_LEVELS:
+        risk_level = 'medium'
+    now = datetime.utcnow()
+    rows = []
+    for part_number, polygon in enumerate(polygons, start=1):
+        rows.append({
+            'name': name if len(polygons) == 1 else f'{name} (part {part_number})'[:200],
+            'zone_type': str(properties.get('zone_type') or 'caution_zone')[:50],
+            'risk_level': risk_level,
+            'polygon_data': json.dumps(mapping(polygon), separators=(',', ':')),
+            'description': properties.get('description'),
+            'warning_message': properties.get('warning_message'),
+            'active': bool(properties.get('active', True)),
+            'created_at': now,
+            'updated_at': now,
+            'geom': polygon,
+        })
+    return rows
+
+
+# ----------------------------------------------------------------------
+# Loading
+# ----------------------------------------------------------------------
+COPY_COLUMNS = ('name', 'zone_type', 'risk_level', 'polygon_data', 'description',
+                'warning_message', 'active', 'created_at', 'updated_at', 'geom')
+
+
+def _copy_rows(rows):
+    """COPY a batch into geofences through the session's own connection"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            '\\N' if row[column] is None else
+            f"SRID=4326;{row[column].wkt}" if column == 'geom' else
+            row[column].isoformat() if isinstance(row[column], datetime) else
+            row[column]
+            for column in COPY_COLUMNS
+        ])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY geofences ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_rows(rows):
+    db.session.execute(Geofence.__table__.insert(), rows)
+
+
+def import_geofences(features, batch_size=1000, dry_run=False, progress=None, max_errors=50):
+    """
+    Validate and load features in batches. `progress(stats)` is called after
+    every batch. Returns a stats dict (imported, features, skipped, errors,
+    seconds).
+    """
+    use_copy = db.engine.dialect.name == 'postgresql' and not dry_run
+    stats = {'features': 0, 'imported': 0, 'skipped': 0, 'errors': [], 'seconds': 0.0}
+    started = time.monotonic()
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            if use_copy:
+                _copy_rows(batch)
+            else:
+                _insert_rows(batch)
+            db.session.commit()
+        stats['imported'] += len(batch)
+        batch.clear()
+        stats['seconds'] = round(time.monotonic() - started, 2)
+        if progress:
+            progress(stats)
+
+    try:
+        for feature in features:
+            stats['features'] += 1
+            try:
+                batch.extend(normalize_feature(feature, stats['features']))
+            except (ValueError, TypeError, KeyError, AttributeError, shapely.errors.GEOSException) as e:
+                stats['skipped'] += 1
+                if len(stats['errors']) < max_errors:
+                    stats['errors'].append({'feature': stats['features'], 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        if stats['imported'] and not dry_run:
+            # Bulk writes bypass the ORM events that patch the index
+            geofence_index.invalidate()
+    return stats
@@ -0,0 +1,519 @@
+"""
+In-process spatial index over active geofences.
+
+Point-in-zone lookups used to load every active Geofence row and test each
+polygon in turn. This module keeps a Shapely STRtree of prepared polygons in
+memory instead, so a lookup is a tree search plus a handful of exact tests.
+
+The index loads lazily on first use and is kept in step with the database
+through SQLAlchemy session events: committed inserts/updates/deletes of
+Geofence rows are patched into a small overlay, and the tree is rebuilt once
+the overlay grows past a threshold. A periodic full reload picks up rows
+written by other processes (scripts, other workers).
+"""
+import json
+import math
+import threading
+import time
+import uuid
+
+import numpy as np
+import shapely
+import shapely.geometry
+import shapely.ops
+from shapely.strtree import STRtree
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.geofence import Geofence
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+# Simplification levels in degrees (~5 m, 20 m, 110 m, 550 m at the equator)
+SIMPLIFY_TOLERANCES = (0.00005, 0.0002, 0.001, 0.005)
+
+
+def tolerance_for_zoom(zoom):
+    """Coarsest simplification level still below one pixel at a web-map zoom (None = full detail)"""
+    if zoom is None:
+        return None
+    pixel_degrees = 360.0 / (256 * 2 ** zoom)
+    usable = [tolerance for tolerance in SIMPLIFY_TOLERANCES if tolerance <= pixel_degrees]
+    return max(usable) if usable else None
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """Great-circle distance in metres; accepts scalars or NumPy arrays"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class IndexedZone:
+    """A single active zone held by the index"""
+    __slots__ = ('id', 'geometry', 'zone', 'payload', '_simplified')
+
+    def __init__(self, geofence_id, geometry, zone):
+        self.id = geofence_id
+        self.geometry = geometry
+        self.zone = zone  # Geofence.to_dict() snapshot
+        # Pre-serialized zone JSON, spliced directly into list responses
+        self.payload = json.dumps(zone, separators=(',', ':'))
+        self._simplified = {}     # tolerance -> (geometry, payload)
+
+    def simplified(self, tolerance):
+        """
+        (geometry, payload) at a simplification level, computed once per level.
+        Uses topology-preserving simplification and snaps coordinates to a
+        grid finer than the tolerance so the serialized form shrinks too.
+        Snapped values are rounded to the grid's decimal places, as the
+        snapping itself leaves float noise (75.82300000000001).
+        """
+        if tolerance is None:
+            return self.geometry, self.payload
+        cached = self._simplified.get(tolerance)
+        if cached is None:
+            grid = tolerance / 10
+            geometry = shapely.simplify(self.geometry, tolerance, preserve_topology=True)
+            geometry = shapely.set_precision(geometry, grid)
+            if geometry.is_empty:
+                geometry = self.geometry
+            else:
+                decimals = math.ceil(-math.log10(grid))
+                geometry = shapely.transform(geometry, lambda coords: np.round(coords, decimals))
+            zone = dict(self.zone, polygon=shapely.geometry.mapping(geometry))
+            cached = (geometry, json.dumps(zone, separators=(',', ':')))
+            self._simplified[tolerance] = cached
+        return cached
+
+
+class GeofenceIndex:
+    """STRtree-backed point-in-zone index with incremental patching"""
+
+    def __init__(self, rebuild_threshold=64, max_age_seconds=300):
+        self.rebuild_threshold = rebuild_threshold
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._entries = {}        # id -> IndexedZone, every live zone
+        self._tree = None
+        self._tree_entries = []   # IndexedZone per tree slot
+        self._tree_geoms = None   # prepared geometries aligned with the tree
+        self._tree_ids = None     # zone id per tree slot (numpy, for vectorised filtering)
+        self._overlay = {}        # id -> IndexedZone added since the last build
+        self._stale = set()       # ids whose tree slot is no longer valid
+        self._signature = None
+        # Bumped whenever the active zone set changes; paired with a per-process
+        # nonce so ETags minted before a restart never match afterwards
+        self.version = 0
+        self._instance = uuid.uuid4().hex[:8]
+        self._listeners = []      # called with changed bounds, or None for "everything"
+
+    # ------------------------------------------------------------------
+    # Loading and patching
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _make_entry(geofence):
+        if not geofence.active:
+            return None
+        geometry = geofence.get_shape()
+        if geometry is None:
+            return None
+        shapely.prepare(geometry)
+        return IndexedZone(geofence.id, geometry, geofence.to_dict())
+
+    def load(self):
+        """(Re)load every active zone from the database and rebuild the tree"""
+        geofences = Geofence.query.filter_by(active=True).all()
+        entries = {}
+        for geofence in geofences:
+            entry = self._make_entry(geofence)
+            if entry is not None:
+                entries[entry.id] = entry
+        signature = hash(tuple(sorted((entry.id, entry.payload) for entry in entries.values())))
+        with self._lock:
+            self._entries = entries
+            self._rebuild()
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+            changed = signature != self._signature
+            if changed:
+                self._signature = signature
+                self.version += 1
+        print(f"[GeofenceIndex] Loaded {len(entries)} active zones")
+        if changed:
+            self._notify(None)
+
+    def _rebuild(self):
+        entries = list(self._entries.values())
+        self._tree_entries = entries
+        if entries:
+            geoms = [entry.geometry for entry in entries]
+            self._tree = STRtree(geoms)
+            self._tree_geoms = self._tree.geometries
+            self._tree_ids = np.array([entry.id for entry in entries], dtype=np.int64)
+        else:
+            self._tree = None
+            self._tree_geoms = None
+            self._tree_ids = None
+        self._overlay = {}
+        self._stale = set()
+
+    def invalidate(self):
+        """Force a full reload on the next query"""
+        with self._lock:
+            self._loaded = False
+
+    def upsert(self, geofence):
+        """Patch a created/updated Geofence into the index"""
+        self.apply(geofence.id, self._make_entry(geofence))
+
+    def apply(self, geofence_id, entry):
+        """Install a prebuilt entry for geofence_id (None removes the zone)"""
+        if entry is None:
+            self.remove(geofence_id)
+            return
+        with self._lock:
+            if not self._loaded:
+                previous = None
+            else:
+                previous = self._entries.get(entry.id)
+                if previous is not None and entry.id not in self._overlay:
+                    self._stale.add(entry.id)
+                self._entries[entry.id] = entry
+                self._overlay[entry.id] = entry
+                self._signature = None
+                self.version += 1
+                self._maybe_rebuild()
+            loaded = self._loaded
+        # Without a loaded index the zone's previous extent is unknown
+        self._notify([zone.geometry.bounds for zone in (previous, entry) if zone is not None] if loaded else None)
+
+    def remove(self, geofence_id):
+        """Drop a deleted/deactivated zone from the index"""
+        with self._lock:
+            if not self._loaded:
+                previous = None
+            elif geofence_id in self._entries:
+                previous = self._entries.pop(geofence_id)
+                self._overlay.pop(geofence_id, None)
+                self._stale.add(geofence_id)
+                self._signature = None
+                self.version += 1
+                self._maybe_rebuild()
+            else:
+                return
+        self._notify([previous.geometry.bounds] if previous is not None else None)
+
+    def add_listener(self, callback):
+        """
+        Register callback(bounds_list) for zone-set changes. bounds_list holds
+        the (min_lon, min_lat, max_lon, max_lat) of changed zones, or is None
+        when the whole set may have changed (reloads).
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, bounds_list):
+        for callback in self._listeners:
+            try:
+                callback(bounds_list)
+            except Exception as e:
+                print(f"[GeofenceIndex] Listener failed: {e}")
+
+    def _maybe_rebuild(self):
+        if len(self._overlay) + len(self._stale) > self.rebuild_threshold:
+            self._rebuild()
+
+    def _ensure_loaded(self):
+        expired = self.max_age_seconds and time.monotonic() - self._loaded_at > self.max_age_seconds
+        if not self._loaded or expired:
+            self.load()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def query_point(self, longitude, latitude):
+        """
+        Return the IndexedZones whose polygon contains (longitude, latitude).
+        Coordinates may be numeric strings; anything else that float() rejects
+        raises ValueError/TypeError.
+        """
+        longitude, latitude = float(longitude), float(latitude)
+        self._ensure_loaded()
+        with self._lock:
+            tree, tree_entries, tree_geoms = self._tree, self._tree_entries, self._tree_geoms
+            overlay, stale = list(self._overlay.values()), self._stale
+
+            hits = []
+            if tree is not None:
+                candidates = tree.query(shapely.Point(longitude, latitude))
+                if len(candidates):
+                    inside = shapely.contains_xy(tree_geoms[candidates], longitude, latitude)
+                    for slot in candidates[inside]:
+                        entry = tree_entries[slot]
+                        if entry.id not in stale:
+                            hits.append(entry)
+            for entry in overlay:
+                if shapely.contains_xy(entry.geometry, longitude, latitude):
+                    hits.append(entry)
+
+        hits.sort(key=lambda entry: entry.id)
+        return hits
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """Return IndexedZones whose polygon intersects the bounding box, by id"""
+        self._ensure_loaded()
+        search_box = shapely.box(min_lon, min_lat, max_lon, max_lat)
+        with self._lock:
+            hits = []
+            if self._tree is not None:
+                for slot in self._tree.query(search_box, predicate='intersects'):
+                    entry = self._tree_entries[slot]
+                    if entry.id not in self._stale:
+                        hits.append(entry)
+            for entry in self._overlay.values():
+                if entry.geometry.intersects(search_box):
+                    hits.append(entry)
+        hits.sort(key=lambda entry: entry.id)
+        return hits
+
+    def all_zones(self):
+        """Every active IndexedZone, by id"""
+        self._ensure_loaded()
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda entry: entry.id)
+
+    @property
+    def etag(self):
+        """Opaque token identifying the current zone set"""
+        self._ensure_loaded()
+        return f'{self._instance}-{self.version}'
+
+    def query_points(self, longitudes, latitudes):
+        """
+        Vectorised containment for many points at once.
+
+        Runs one STRtree bulk query for bounding-box candidates and a single
+        contains_xy call over all (point, zone) candidate pairs. Returns a list
+        aligned with the input holding the IndexedZones that contain each point.
+        """
+        self._ensure_loaded()
+        lons = np.asarray(longitudes, dtype=float)
+        lats = np.asarray(latitudes, dtype=float)
+        point_idx = []
+        zone_entries = []
+
+        with self._lock:
+            if self._tree is not None and len(lons):
+                pairs = self._tree.query(shapely.points(lons, lats))
+                pts, slots = pairs[0], pairs[1]
+                if self._stale:
+                    live = ~np.isin(self._tree_ids[slots], list(self._stale))
+                    pts, slots = pts[live], slots[live]
+                inside = shapely.contains_xy(self._tree_geoms[slots], lons[pts], lats[pts])
+                point_idx.append(pts[inside])
+                zone_entries.extend(self._tree_entries[slot] for slot in slots[inside])
+            for entry in self._overlay.values():
+                hits = np.flatnonzero(shapely.contains_xy(entry.geometry, lons, lats))
+                point_idx.append(hits)
+                zone_entries.extend([entry] * len(hits))
+
+        results = [[] for _ in range(len(lons))]
+        if point_idx:
+            for i, entry in zip(np.concatenate(point_idx).tolist(), zone_entries):
+                results[i].append(entry)
+        for hits in results:
+            hits.sort(key=lambda entry: entry.id)
+        return results
+
+    def query_radius(self, longitude, latitude, radius_m):
+        """
+        Return (IndexedZone, distance_m) pairs within radius_m of the point,
+        nearest first. Distances use a local equirectangular projection, which
+        is accurate to well under 1% at city scale.
+        """
+        self._ensure_loaded()
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        dlat = radius_m / METERS_PER_DEGREE
+        dlon = dlat / cos_lat
+        search_box = shapely.box(longitude - dlon, latitude - dlat, longitude + dlon, latitude + dlat)
+
+        with self._lock:
+            candidates = []
+            if self._tree is not None:
+                for slot in self._tree.query(search_box):
+                    entry = self._tree_entries[slot]
+                    if entry.id not in self._stale:
+                        candidates.append(entry)
+            candidates.extend(self._overlay.values())
+
+        def to_local_meters(coords):
+            return (coords - (longitude, latitude)) * (METERS_PER_DEGREE * cos_lat, METERS_PER_DEGREE)
+
+        origin = shapely.Point(0, 0)
+        results = []
+        for entry in candidates:
+            distance = shapely.transform(entry.geometry, to_local_meters).distance(origin)
+            if distance <= radius_m:
+                results.append((entry, distance))
+        results.sort(key=lambda item: (item[1], item[0].id))
+        return results
+
+    def query_points_radius(self, longitudes, latitudes, radius_m):
+        """
+        Vectorised proximity for many points at once. Returns (point_idx,
+        entries, distances_m): one element per (point, zone) pair within
+        radius_m, with the great-circle distance to the zone (0 inside).
+        """
+        self._ensure_loaded()
+        lons = np.asarray(longitudes, dtype=float)
+        lats = np.asarray(latitudes, dtype=float)
+        dlat = radius_m / METERS_PER_DEGREE
+        dlon = dlat / np.maximum(np.cos(np.radians(lats)), 1e-6)
+        boxes = shapely.box(lons - dlon, lats - dlat, lons + dlon, lats + dlat)
+        point_idx, entries, geoms = [], [], []
+
+        with self._lock:
+            if self._tree is not None and len(lons):
+                pts, slots = self._tree.query(boxes)
+                if self._stale:
+                    live = ~np.isin(self._tree_ids[slots], list(self._stale))
+                    pts, slots = pts[live], slots[live]
+                point_idx.append(pts)
+                geoms.append(self._tree_geoms[slots])
+                entries.extend(self._tree_entries[slot] for slot in slots)
+            for entry in self._overlay.values():
+                hits = np.flatnonzero(shapely.intersects(boxes, entry.geometry))
+                point_idx.append(hits)
+                geoms.append(np.full(len(hits), entry.geometry, dtype=object))
+                entries.extend([entry] * len(hits))
+
+        if not entries:
+            return np.empty(0, dtype=np.int64), [], np.empty(0)
+        point_idx = np.concatenate(point_idx)
+        # Closest pair of points per (zone, point); measure it on the sphere
+        lines = shapely.shortest_line(np.concatenate(geoms), shapely.points(lons[point_idx], lats[point_idx]))
+        ends = shapely.get_coordinates(lines).reshape(-1, 2, 2)
+        distances = haversine_m(ends[:, 0, 0], ends[:, 0, 1], ends[:, 1, 0], ends[:, 1, 1])
+        keep = np.flatnonzero(distances <= radius_m)
+        return point_idx[keep], [entries[i] for i in keep], distances[keep]
+
+    def nearest(self, longitude, latitude, k, max_distance_m, predicate=None):
+        """
+        Return up to k (IndexedZone, distance_m) pairs nearest the point, no
+        farther than max_distance_m, optionally filtered by predicate(entry).
+
+        The search radius grows from 1 km until k matches are found, so dense
+        areas never scan the whole index. Candidates are ranked with the
+        projected distance and the final k get great-circle distances to
+        their closest boundary point (0 when the point is inside).
+        """
+        radius = min(1000.0, max_distance_m)
+        while True:
+            hits = [
+                (entry, distance) for entry, distance in self.query_radius(longitude, latitude, radius)
+                if predicate is None or predicate(entry)
+            ]
+            if len(hits) >= k or radius >= max_distance_m:
+                break
+            radius = min(radius * 4, max_distance_m)
+        if not hits:
+            return []
+
+        # Projected distances are within ~1% - re-rank everything that could reach the top k
+        cutoff = hits[min(k, len(hits)) - 1][1] * 1.01 + 1.0
+        cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+        results = []
+        for entry, projected in hits:
+            if projected > cutoff:
+                break
+            if projected == 0:
+                results.append((entry, 0.0))
+                continue
+            local = shapely.transform(entry.geometry, lambda coords: (coords - (longitude, latitude)) * (cos_lat, 1.0))
+            nearest_local = shapely.ops.nearest_points(local, shapely.Point(0, 0))[0]
+            distance = float(haversine_m(longitude, latitude,
+                                         longitude + nearest_local.x / cos_lat, latitude + nearest_local.y))
+            if distance <= max_distance_m:
+                results.append((entry, distance))
+        results.sort(key=lambda item: (item[1], item[0].id))
+        return results[:k]
+
+    def zones_containing(self, longitude, latitude):
+        """Return Geofence.to_dict() payloads for zones containing the point"""
+        return [entry.zone for entry in self.query_point(longitude, latitude)]
+
+    def get(self, geofence_id):
+        """Return the IndexedZone for an active zone id, or None"""
+        self._ensure_loaded()
+        return self._entries.get(geofence_id)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._entries)
+
+
+geofence_index = GeofenceIndex()
+
+
+# ----------------------------------------------------------------------
+# Keep the index in step with committed Geofence changes
+# ----------------------------------------------------------------------
+_PENDING_KEY = 'geofence_index_pending'
+_RELOAD_KEY = 'geofence_index_reload'
+
+
+def _after_flush(session, flush_context):
+    # Snapshot now: instances are expired by the time after_commit fires
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Geofence) and obj.id is not None:
+            try:
+                pending[obj.id] = GeofenceIndex._make_entry(obj)
+            except Exception as e:
+                print(f"[GeofenceIndex] Could not snapshot zone {obj.id}: {e}")
+                session.info[_RELOAD_KEY] = True
+    for obj in session.deleted:
+        if isinstance(obj, Geofence) and obj.id is not None:
+            pending[obj.id] = None
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if session.info.pop(_RELOAD_KEY, False):
+        geofence_index.invalidate()
+        return
+    for geofence_id, entry in (pending or {}).items():
+        geofence_index.apply(geofence_id, entry)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_RELOAD_KEY, None)
+
+
+def _do_orm_execute(orm_execute_state):
+    # query.update()/query.delete() bypass the unit of work entirely
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Geofence:
+            orm_execute_state.session.info[_RELOAD_KEY] = True
+
+
+_listeners_registered = False
+
+
+def init_app(app):
+    """Configure the shared index and hook it into session commits"""
+    global _listeners_registered
+    geofence_index.rebuild_threshold = app.config.get('GEOFENCE_INDEX_REBUILD_THRESHOLD', 64)
+    geofence_index.max_age_seconds = app.config.get('GEOFENCE_INDEX_MAX_AGE_SECONDS', 300)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    _listeners_registered = True
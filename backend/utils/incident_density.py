@@ -0,0 +1,262 @@
+"""
+Incident density grid.
+
+Incidents are counted into fixed-size lat/lon cells per UTC hour, split by
+type and priority, in the incident_density_cells table. The counts are
+maintained incrementally from SQLAlchemy session events inside the same
+transaction that creates, updates or deletes an incident, so the heatmap
+endpoint only ever reads the (much smaller) grid - never the incident table.
+
+rebuild() recomputes the grid from scratch; it runs once at startup when
+the grid is empty and after bulk UPDATEs of incidents.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.incident import Incident, IncidentDensityCell
+
+CELL_DEGREES = 0.01  # ~1.1 km
+# Statuses that no longer count as open / are not counted at all
+CLOSED_STATUSES = ('resolved',)
+EXCLUDED_STATUSES = ('false_alarm',)
+KEY_COLUMNS = ('cell_x', 'cell_y', 'hour', 'type', 'priority')
+TRACKED = ('latitude', 'longitude', 'created_at', 'type', 'priority', 'status')
+EPOCH = datetime(1970, 1, 1)
+
+
+def cell_of(longitude, latitude):
+    """Grid cell (x, y) containing a point"""
+    return math.floor(longitude / CELL_DEGREES), math.floor(latitude / CELL_DEGREES)
+
+
+def hour_of(timestamp):
+    """Hours since the Unix epoch for a naive UTC datetime"""
+    return int((timestamp - EPOCH).total_seconds() // 3600)
+
+
+# ----------------------------------------------------------------------
+# Incremental maintenance
+# ----------------------------------------------------------------------
+def _add(deltas, values, sign):
+    """Add (sign=1) or remove (sign=-1) one incident's contribution"""
+    if values['latitude'] is None or values['longitude'] is None or values['status'] in EXCLUDED_STATUSES:
+        return
+    cell_x, cell_y = cell_of(values['longitude'], values['latitude'])
+    key = (cell_x, cell_y, hour_of(values['created_at'] or datetime.utcnow()),
+           values['type'] or 'unknown', values['priority'] or 'high')
+    delta = deltas[key]
+    delta[0] += sign
+    if values['status'] not in CLOSED_STATUSES:
+        delta[1] += sign
+
+
+def _current_values(incident):
+    return {attr: getattr(incident, attr) for attr in TRACKED}
+
+
+def _previous_values(incident):
+    """Tracked attributes as they were before this flush's pending changes"""
+    state = inspect(incident)
+    values = {}
+    for attr in TRACKED:
+        history = state.attrs[attr].history
+        if history.deleted:
+            values[attr] = history.deleted[0]
+        elif history.added:
+            values[attr] = None  # was unset
+        else:
+            values[attr] = getattr(incident, attr)
+    return values
+
+
+def _changed(incident):
+    state = inspect(incident)
+    return any(state.attrs[attr].history.has_changes() for attr in TRACKED)
+
+
+def _apply(connection, deltas):
+    """Upsert count deltas into the grid"""
+    rows = [
+        dict(zip(KEY_COLUMNS, key), total=total, open=open_count)
+        for key, (total, open_count) in deltas.items() if total or open_count
+    ]
+    if not rows:
+        return
+    table = IncidentDensityCell.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_={'total': table.c.total + stmt.excluded.total, 'open': table.c.open + stmt.excluded.open}
+        )
+        connection.execute(stmt, rows)
+        return
+    for row in rows:
+        match = [table.c[column] == row[column] for column in KEY_COLUMNS]
+        result = connection.execute(
+            table.update().where(*match).values(total=table.c.total + row['total'], open=table.c.open + row['open'])
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), row)
+
+
+def _after_flush(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0])
+    for obj in session.new:
+        if isinstance(obj, Incident):
+            _add(deltas, _current_values(obj), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Incident) and _changed(obj):
+            _add(deltas, _previous_values(obj), -1)
+            _add(deltas, _current_values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Incident):
+            _add(deltas, _previous_values(obj), -1)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+_REBUILD_KEY = 'incident_density_rebuild'
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Incident:
+        return
+    session = orm_execute_state.session
+    if orm_execute_state.is_delete:
+        # Subtract the rows about to be deleted, in the same transaction
+        query = select(*[getattr(Incident, attr) for attr in TRACKED])
+        if orm_execute_state.statement.whereclause is not None:
+            query = query.where(orm_execute_state.statement.whereclause)
+        deltas = defaultdict(lambda: [0, 0])
+        for row in session.connection().execute(query):
+            _add(deltas, row._mapping, -1)
+        _apply(session.connection(), deltas)
+    else:
+        # New values aren't known row by row - recompute before committing
+        session.info[_REBUILD_KEY] = True
+
+
+def _before_commit(session):
+    if session.info.pop(_REBUILD_KEY, False):
+        rebuild(session.connection())
+
+
+def _after_rollback(session):
+    session.info.pop(_REBUILD_KEY, None)
+
+
+def rebuild(connection=None):
+    """Recompute the whole grid from the incident table; returns the number of cells"""
+    connection = connection or db.session.connection()
+    deltas = defaultdict(lambda: [0, 0])
+    result = connection.execute(
+        select(*[getattr(Incident, attr) for attr in TRACKED]),
+        execution_options={'yield_per': 5000}
+    )
+    for row in result:
+        _add(deltas, row._mapping, 1)
+    connection.execute(IncidentDensityCell.__table__.delete())
+    _apply(connection, deltas)
+    return len(deltas)
+
+
+def backfill(app):
+    """Build the grid for databases that have incidents but no cells yet"""
+    try:
+        if db.session.query(IncidentDensityCell.id).first() is None and db.session.query(Incident.id).first() is not None:
+            cells = rebuild()
+            db.session.commit()
+            print(f"[IncidentDensity] Built grid: {cells} cells")
+    except Exception as e:
+        print(f"[IncidentDensity] Backfill failed: {e}")
+        db.session.rollback()
+
+
+_listeners_registered = False
+
+
+def init_app(app):
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+def density_grid(hours=24, bbox=None, types=None, priorities=None, open_only=False,
+                 aggregate=1, split=None, now=None):
+    """
+    Summed incident counts per cell over the last `hours`.
+
+    Returns compact column arrays: {'x': [...], 'y': [...], 'count': [...]}
+    with cell indexes (cell lon = x * cell_degrees). `aggregate` merges
+    n x n cells for coarse zooms; `split` ('type' or 'priority') returns one
+    such grid per value instead.
+    """
+    now = now or datetime.utcnow()
+    value = IncidentDensityCell.open if open_only else IncidentDensityCell.total
+    split_column = getattr(IncidentDensityCell, split) if split else None
+    columns = [IncidentDensityCell.cell_x, IncidentDensityCell.cell_y]
+    if split_column is not None:
+        columns.append(split_column)
+
+    query = db.session.query(*columns, func.sum(value)).filter(
+        IncidentDensityCell.hour > hour_of(now) - hours,
+        value > 0
+    )
+    if bbox:
+        min_x, min_y = cell_of(bbox[0], bbox[1])
+        max_x, max_y = cell_of(bbox[2], bbox[3])
+        query = query.filter(IncidentDensityCell.cell_x.between(min_x, max_x),
+                             IncidentDensityCell.cell_y.between(min_y, max_y))
+    if types:
+        query = query.filter(IncidentDensityCell.type.in_(types))
+    if priorities:
+        query = query.filter(IncidentDensityCell.priority.in_(priorities))
+    rows = query.group_by(*columns).all()
+
+    def to_grid(cells):
+        if not cells:
+            return {'x': [], 'y': [], 'count': [], 'max': 0, 'total': 0}
+        xs = np.array([cell[0] for cell in cells], dtype=np.int64) // aggregate
+        ys = np.array([cell[1] for cell in cells], dtype=np.int64) // aggregate
+        counts = np.array([cell[-1] for cell in cells], dtype=np.int64)
+        merged, inverse = np.unique(np.stack([xs, ys], axis=1), axis=0, return_inverse=True)
+        sums = np.bincount(inverse.ravel(), weights=counts).astype(np.int64)
+        return {
+            'x': merged[:, 0].tolist(),
+            'y': merged[:, 1].tolist(),
+            'count': sums.tolist(),
+            'max': int(sums.max()),
+            'total': int(sums.sum())
+        }
+
+    result = {'cell_degrees': CELL_DEGREES * aggregate, 'hours': hours, 'open_only': open_only}
+    if split_column is None:
+        result.update(to_grid(rows))
+    else:
+        groups = defaultdict(list)
+        for row in rows:
+            groups[row[2]].append(row)
+        result['split'] = split
+        result['layers'] = {key: to_grid(cells) for key, cells in sorted(groups.items())}
+    return result
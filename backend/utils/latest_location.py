@@ -0,0 +1,224 @@
+"""
+Latest position per user.
+
+user_latest_locations holds one row per user with their newest fix. Every
+location write upserts it (in the same transaction as the history insert,
+or in the write-behind flush), so "where is everyone now" is a single
+indexed read instead of one ORDER BY ... LIMIT 1 query per tourist.
+
+The upsert only moves a row forward in time: replaying an older batch
+of fixes leaves the current position alone. updated_at records when the
+row last changed, which lets pollers ask for "who moved since my last
+poll".
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models.user import User, UserLocation, UserLatestLocation
+from utils.safety_score import safety_scores
+
+# updated_at is stamped before the writing transaction commits, so poll
+# cursors are handed out this far in the past to cover in-flight writes
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+
+def newest_per_user(rows):
+    """Reduce UserLocation column dicts to the newest one per user_id"""
+    newest = {}
+    for row in rows:
+        current = newest.get(row['user_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            newest[row['user_id']] = row
+    return newest
+
+
+def upsert_latest(connection, rows):
+    """
+    Upsert the newest of `rows` (UserLocation column dicts with timestamps)
+    per user through a Connection or Session.
+    """
+    now = datetime.utcnow()
+    values = [
+        {
+            'user_id': user_id,
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'accuracy': row.get('accuracy'),
+            'timestamp': row['timestamp'],
+            'updated_at': now
+        }
+        for user_id, row in newest_per_user(rows).items()
+    ]
+    if not values:
+        return
+    table = UserLatestLocation.__table__
+    dialect = connection.get_bind().dialect.name if hasattr(connection, 'get_bind') else connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={column: stmt.excluded[column] for column in ('latitude', 'longitude', 'accuracy', 'timestamp', 'updated_at')},
+            where=table.c.timestamp <= stmt.excluded.timestamp
+        )
+        connection.execute(stmt, values)
+        return
+    for value in values:
+        result = connection.execute(
+            table.update()
+            .where(table.c.user_id == value['user_id'], table.c.timestamp <= value['timestamp'])
+            .values(**value)
+        )
+        if result.rowcount == 0:
+            exists = connection.execute(select(table.c.user_id).where(table.c.user_id == value['user_id'])).first()
+            if exists is None:
+                connection.execute(table.insert(), value)
+
+
+def backfill(app):
+    """Populate user_latest_locations from history for databases that predate it"""
+    try:
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_user_latest_locations_lat_lon ON user_latest_locations (latitude, longitude)"
+        ))
+        db.session.commit()
+        if db.session.query(UserLatestLocation.user_id).first() is not None:
+            return
+        if db.session.query(UserLocation.id).first() is None:
+            return
+        newest = select(UserLocation.user_id, func.max(UserLocation.timestamp).label('timestamp')) \
+            .group_by(UserLocation.user_id).subquery()
+        rows = db.session.query(UserLocation).join(
+            newest,
+            (UserLocation.user_id == newest.c.user_id) & (UserLocation.timestamp == newest.c.timestamp)
+        ).all()
+        upsert_latest(db.session, [
+            {'user_id': row.user_id, 'latitude': row.latitude, 'longitude': row.longitude,
+             'accuracy': row.accuracy, 'timestamp': row.timestamp}
+            for row in rows
+        ])
+        db.session.commit()
+        print(f"[LatestLocation] Backfilled latest positions for {len(rows)} users")
+    except Exception as e:
+        print(f"[LatestLocation] Backfill failed: {e}")
+        db.session.rollback()
+
+
+def get_time_ago(timestamp):
+    """Get human-readable time difference"""
+    now = datetime.now()
+    diff = now - timestamp
+    
+    seconds = diff.total_seconds()
+    if seconds < 60:
+        return f"{int(seconds)}s ago"
+    elif seconds < 3600:
+        return f"{int(seconds/60)}m ago"
+    elif seconds < 86400:
+        return f"{int(seconds/3600)}h ago"
+    else:
+        return f"{int(seconds/86400)}d ago"
+
+
+def tourist_positions(rows):
+    """
+    Authority dashboard entries for (User, latitude, longitude, accuracy,
+    timestamp) rows, with safety scores computed in one vectorised pass.
+    """
+    positions = [
+        {
+            'user_id': user.id,
+            'user_name': user.name,
+            'user_email': user.email,
+            'user_phone': user.phone,
+            'latitude': latitude,
+            'longitude': longitude,
+            'accuracy': accuracy,
+            'timestamp': timestamp.isoformat(),
+            'last_seen': get_time_ago(timestamp)
+        }
+        for user, latitude, longitude, accuracy, timestamp in rows
+    ]
+    scores = safety_scores(
+        [position['latitude'] for position in positions],
+        [position['longitude'] for position in positions]
+    )
+    for position, score in zip(positions, scores):
+        position['safety_score'] = score
+    return positions
+
+
+def all_tourist_positions():
+    """tourist_positions() for every tourist with a known position"""
+    rows = db.session.query(User, UserLatestLocation).join(
+        UserLatestLocation, UserLatestLocation.user_id == User.id
+    ).filter(User.role == 'tourist').all()
+    return tourist_positions([
+        (user, latest.latitude, latest.longitude, latest.accuracy, latest.timestamp)
+        for user, latest in rows
+    ])
+
+
+def in_bbox(query, bbox):
+    """Restrict a query on UserLatestLocation to minLon,minLat,maxLon,maxLat"""
+    if not bbox:
+        return query
+    return query.filter(
+        UserLatestLocation.longitude.between(bbox[0], bbox[2]),
+        UserLatestLocation.latitude.between(bbox[1], bbox[3])
+    )
+
+
+def cluster_cell_degrees(zoom, radius_px):
+    """Grid cell size in degrees that spans radius_px pixels at a web-map zoom"""
+    return radius_px * 360.0 / (256 * 2 ** zoom)
+
+
+def cluster_tourists(bbox, zoom, radius_px):
+    """
+    Grid-cluster tourists' latest positions inside bbox for a zoomed-out map.
+    Returns (clusters, single user_ids): clusters hold count, centroid and
+    the bounds of their members; cells with one tourist are returned as ids
+    so they can be shown as ordinary markers.
+    """
+    query = db.session.query(
+        UserLatestLocation.user_id, UserLatestLocation.longitude, UserLatestLocation.latitude
+    ).join(User, User.id == UserLatestLocation.user_id).filter(User.role == 'tourist')
+    rows = in_bbox(query, bbox).all()
+    if not rows:
+        return [], []
+    user_ids = np.array([row[0] for row in rows])
+    lons = np.array([row[1] for row in rows])
+    lats = np.array([row[2] for row in rows])
+    cell = cluster_cell_degrees(zoom, radius_px)
+    cells = np.stack([np.floor(lons / cell), np.floor(lats / cell)], axis=1)
+    _, inverse, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    groups = len(counts)
+    min_lon = np.full(groups, np.inf)
+    min_lat = np.full(groups, np.inf)
+    max_lon = np.full(groups, -np.inf)
+    max_lat = np.full(groups, -np.inf)
+    np.minimum.at(min_lon, inverse, lons)
+    np.minimum.at(min_lat, inverse, lats)
+    np.maximum.at(max_lon, inverse, lons)
+    np.maximum.at(max_lat, inverse, lats)
+    mean_lon = np.bincount(inverse, weights=lons) / counts
+    mean_lat = np.bincount(inverse, weights=lats) / counts
+
+    clusters = [
+        {
+            'latitude': round(float(mean_lat[i]), 6),
+            'longitude': round(float(mean_lon[i]), 6),
+            'count': int(counts[i]),
+            'bbox': [float(min_lon[i]), float(min_lat[i]), float(max_lon[i]), float(max_lat[i])]
+        }
+        for i in np.flatnonzero(counts > 1)
+    ]
+    singles = user_ids[counts[inverse] == 1].tolist()
+    return clusters, singles
@@ -0,0 +1,241 @@
+"""
+Optional write-behind buffer for UserLocation rows.
+
+With LOCATION_WRITE_BEHIND enabled, location endpoints append fixes to a
+bounded in-process buffer and answer immediately; a background task (a
+greenlet under the gevent worker) writes them with multi-row INSERTs every
+LOCATION_BUFFER_FLUSH_MS or as soon as LOCATION_BUFFER_FLUSH_ROWS are
+waiting. Request latency then no longer depends on the database commit
+rate. If the buffer reaches LOCATION_BUFFER_MAX_ROWS the writing request
+flushes synchronously (backpressure) rather than dropping fixes.
+
+Trade-off: a fix is visible to readers (history, all-tourists) only after
+the next flush, and fixes still buffered when the process is killed
+without a clean shutdown are lost. The buffer is drained when the worker
+shuts down (gunicorn's worker_exit hook in gunicorn.conf.py, or when
+socketio.run returns under python app.py), and again at interpreter exit
+as a fallback.
+
+With write-behind disabled (the default) write() inserts through the
+request's session and the caller commits, exactly as before.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models.user import UserLocation
+from utils.latest_location import upsert_latest
+
+
+class LocationWriteBuffer:
+    """Bounded FIFO of pending UserLocation rows with batched flushing"""
+
+    def __init__(self, flush_interval_ms=200, flush_rows=500, max_rows=10000):
+        self.enabled = False
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self._rows = deque()               # (enqueued_at, row)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one writer at a time keeps rows in order
+        self._app = None
+        self._socketio = None
+        self._worker_started = False
+        self._stopping = False
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'sync_flushes': 0,
+            'dropped': 0,
+            'max_depth': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def configure(self, app, socketio=None):
+        self._app = app
+        self._socketio = socketio
+        self.enabled = bool(app.config.get('LOCATION_WRITE_BEHIND', False))
+        self.flush_interval = app.config.get('LOCATION_BUFFER_FLUSH_MS', 200) / 1000.0
+        self.flush_rows = app.config.get('LOCATION_BUFFER_FLUSH_ROWS', 500)
+        self.max_rows = app.config.get('LOCATION_BUFFER_MAX_ROWS', 10000)
+        # A new app (e.g. after a drain in tests or a re-init) starts accepting again
+        self._stopping = False
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def write(self, rows):
+        """
+        Store UserLocation column dicts. Returns True when they were buffered,
+        False when they were added to the current session (caller commits).
+        """
+        if not rows:
+            return self.enabled
+        if not self.enabled:
+            db.session.execute(insert(UserLocation), rows)
+            upsert_latest(db.session, rows)
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._rows.extend((now, row) for row in rows)
+            depth = len(self._rows)
+            self._stats['enqueued'] += len(rows)
+            self._stats['max_depth'] = max(self._stats['max_depth'], depth)
+        self._ensure_worker()
+        if depth >= self.max_rows or self._stopping:
+            # Backpressure, or the background task is gone during shutdown
+            with self._lock:
+                self._stats['sync_flushes'] += 1
+            self.flush()
+        return True
+
+    def _take(self, limit):
+        with self._lock:
+            count = min(limit, len(self._rows))
+            return [self._rows.popleft()[1] for _ in range(count)]
+
+    def _requeue(self, rows):
+        with self._lock:
+            self._rows.extendleft((time.monotonic(), row) for row in reversed(rows))
+
+    @staticmethod
+    def _write(rows):
+        with db.engine.begin() as connection:
+            connection.execute(insert(UserLocation.__table__), rows)
+            upsert_latest(connection, rows)
+
+    def _write_rows_individually(self, rows):
+        written = []
+        with self._app.app_context():
+            for row in rows:
+                try:
+                    self._write([row])
+                    written.append(row)
+                except IntegrityError as e:
+                    with self._lock:
+                        self._stats['dropped'] += 1
+                    print(f"[LocationBuffer] Dropping fix for user {row.get('user_id')}: {e.orig}")
+        return written
+
+    def flush(self, limit=None):
+        """Write buffered rows in batches of flush_rows; returns rows written"""
+        written = 0
+        with self._flush_lock:
+            while self._rows and (limit is None or written < limit):
+                batch = self._take(self.flush_rows)
+                started = time.perf_counter()
+                try:
+                    with self._app.app_context():
+                        self._write(batch)
+                except IntegrityError:
+                    # e.g. a user deleted while their fixes were buffered - keep the rest
+                    batch = self._write_rows_individually(batch)
+                except Exception as e:
+                    with self._lock:
+                        self._stats['failed_flushes'] += 1
+                    print(f"[LocationBuffer] Flush of {len(batch)} rows failed, will retry: {e}")
+                    self._requeue(batch)
+                    break
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                written += len(batch)
+                with self._lock:
+                    self._stats['flushed'] += len(batch)
+                    self._stats['flushes'] += 1
+                    self._stats['last_flush_ms'] = round(elapsed_ms, 2)
+                    self._stats['max_flush_ms'] = round(max(self._stats['max_flush_ms'], elapsed_ms), 2)
+                    self._stats['total_flush_ms'] += elapsed_ms
+        return written
+
+    # ------------------------------------------------------------------
+    # Background flushing
+    # ------------------------------------------------------------------
+    def _ensure_worker(self):
+        if self._worker_started:
+            return
+        with self._lock:
+            if self._worker_started or self._stopping:
+                return
+            self._worker_started = True
+        if self._socketio is not None:
+            self._socketio.start_background_task(self._run)
+        else:
+            threading.Thread(target=self._run, name='location-buffer', daemon=True).start()
+        print(f"[LocationBuffer] Write-behind enabled (every {int(self.flush_interval * 1000)} ms "
+              f"or {self.flush_rows} rows, max {self.max_rows} buffered)")
+
+    def _sleep(self, seconds):
+        if self._socketio is not None:
+            self._socketio.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _run(self):
+        waited = 0.0
+        tick = min(self.flush_interval, 0.05)
+        try:
+            while not self._stopping:
+                self._sleep(tick)
+                waited += tick
+                if len(self._rows) >= self.flush_rows or (self._rows and waited >= self.flush_interval):
+                    self.flush()
+                    waited = 0.0
+        finally:
+            with self._lock:
+                self._worker_started = False
+
+    def drain(self):
+        """
+        Stop the background task and write everything still buffered. Called
+        on worker shutdown; later writes flush synchronously until the buffer
+        is configured again.
+        """
+        self._stopping = True
+        if self._rows and self._app is not None:
+            pending = len(self._rows)
+            written = self.flush()
+            print(f"[LocationBuffer] Drained {written}/{pending} buffered fixes on shutdown")
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+    def depth(self):
+        """Fixes currently waiting to be written"""
+        return len(self._rows)
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._rows)
+            oldest = self._rows[0][0] if depth else None
+            stats = dict(self._stats)
+        flushes = stats.pop('flushes')
+        total_ms = stats.pop('total_flush_ms')
+        stats.update({
+            'enabled': self.enabled,
+            'depth': depth,
+            'capacity': self.max_rows,
+            'oldest_age_ms': round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0.0,
+            'flushes': flushes,
+            'avg_flush_ms': round(total_ms / flushes, 2) if flushes else 0.0,
+        })
+        return stats
+
+
+location_buffer = LocationWriteBuffer()
+_atexit_registered = False
+
+
+def init_app(app, socketio=None):
+    global _atexit_registered
+    location_buffer.configure(app, socketio)
+    if not _atexit_registered:
+        atexit.register(location_buffer.drain)
+        _atexit_registered = True
@@ -0,0 +1,200 @@
+"""
+Columnar bulk export of location history.
+
+export_chunks() streams user_locations rows for a time range through a
+server-side cursor (psycopg2 named cursor on PostgreSQL) in blocks of
+LOCATION_EXPORT_CHUNK_ROWS, converts each block straight into column
+arrays - no ORM objects - and yields the encoded file as byte chunks, so
+memory stays bounded by one block whatever the size of the range.
+
+Formats:
+- arrow: Apache Arrow IPC stream, one record batch per block
+- parquet: Parquet file, one row group per block
+- npz: NumPy archive of per-column .npy arrays. Columns are spooled to
+  temporary files while scanning and zipped at the end, as each .npy
+  header needs the final row count.
+
+arrow and parquet need the optional pyarrow package; npz only needs numpy.
+Timestamps are naive UTC (datetime64[us]); a missing accuracy is NaN in
+npz and null in Arrow/Parquet.
+"""
+import tempfile
+import zipfile
+
+import numpy as np
+from sqlalchemy import select
+
+from extensions import db
+from models.user import UserLocation
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+FORMATS = ('parquet', 'arrow', 'npz')
+MIMETYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'npz': 'application/octet-stream'
+}
+COLUMNS = (
+    ('id', np.int64),
+    ('user_id', np.int64),
+    ('timestamp', 'datetime64[us]'),
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('accuracy', np.float64),
+)
+COPY_CHUNK_BYTES = 1 << 20
+
+
+def check_format(fmt):
+    """Raise ValueError unless fmt can be written here"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt != 'npz' and not PYARROW_AVAILABLE:
+        raise ValueError(f"{fmt} export needs pyarrow (pip install pyarrow); use format=npz")
+
+
+def export_query(start, end, user_ids=None):
+    """Core select of user_locations in [start, end), oldest first"""
+    table = UserLocation.__table__
+    stmt = select(*(table.c[name] for name, _ in COLUMNS)).where(
+        table.c.timestamp >= start, table.c.timestamp < end
+    )
+    if user_ids:
+        stmt = stmt.where(table.c.user_id.in_(user_ids))
+    return stmt.order_by(table.c.timestamp, table.c.id)
+
+
+def iter_blocks(start, end, user_ids=None, chunk_rows=50000):
+    """Yield dicts of column arrays, at most chunk_rows rows each"""
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_rows).execute(export_query(start, end, user_ids))
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            yield {
+                name: np.array(values, dtype=dtype)
+                for (name, dtype), values in zip(COLUMNS, columns)
+            }
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('timestamp', pa.timestamp('us')),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('accuracy', pa.float64()),
+    ])
+
+
+def _arrow_batch(block, schema):
+    return pa.record_batch([
+        pa.array(block[name], type=field.type, from_pandas=name == 'accuracy')
+        for name, field in zip(block, schema)
+    ], schema=schema)
+
+
+def _export_arrow(blocks, fmt, stats):
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+    for block in blocks:
+        stats['rows'] += len(block['id'])
+        writer.write_batch(_arrow_batch(block, schema))
+        data = sink.take()
+        if data:
+            yield data
+    writer.close()
+    yield sink.take()
+
+
+def _export_npz(blocks, stats):
+    spools = {name: tempfile.TemporaryFile() for name, _ in COLUMNS}
+    try:
+        for block in blocks:
+            stats['rows'] += len(block['id'])
+            for name, values in block.items():
+                spools[name].write(values.tobytes())
+
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, dtype in COLUMNS:
+                spool = spools[name]
+                spool.seek(0)
+                with archive.open(f'{name}.npy', mode='w', force_zip64=True) as entry:
+                    np.lib.format.write_array_header_1_0(entry, {
+                        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                        'fortran_order': False,
+                        'shape': (stats['rows'],)
+                    })
+                    while True:
+                        data = spool.read(COPY_CHUNK_BYTES)
+                        if not data:
+                            break
+                        entry.write(data)
+                        yield sink.take()
+        yield sink.take()
+    finally:
+        for spool in spools.values():
+            spool.close()
+
+
+def export_chunks(fmt, start, end, user_ids=None, chunk_rows=50000, stats=None):
+    """
+    Yield the export of fixes in [start, end) (optionally only user_ids) as
+    bytes in `fmt`. `stats`, if given, is a dict whose 'rows' is updated as
+    rows are exported. Must run inside an app context.
+    """
+    check_format(fmt)
+    stats = stats if stats is not None else {}
+    stats['rows'] = 0
+    blocks = iter_blocks(start, end, user_ids, chunk_rows)
+    if fmt == 'npz':
+        chunks = _export_npz(blocks, stats)
+    else:
+        chunks = _export_arrow(blocks, fmt, stats)
+    for data in chunks:
+        if data:
+            yield data
+
+
+def export_filename(fmt, start, end):
+    return f"user_locations_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.{fmt}"
@@ -0,0 +1,524 @@
+"""
+Location history storage: partitioning, retention and downsampling.
+
+Partitioning and retention are opt-in. With LOCATION_PARTITIONING on,
+user_locations on PostgreSQL becomes a table partitioned by RANGE
+(timestamp) with one partition per UTC day (user_locations_pYYYYMMDD)
+plus a DEFAULT partition for anything outside the prepared range. Fresh
+(empty) tables are converted on startup; existing ones with data are
+converted once by compact_locations.py --partition. Retention
+(LOCATION_RETENTION_DAYS > 0) then drops whole partitions instead of
+deleting rows. Other databases (SQLite under TestingConfig, or
+partitioning off) keep the single table and expire rows with batched
+range deletes on the timestamp index.
+
+Note that a partitioned table no longer matches the UserLocation model
+exactly: PostgreSQL requires the partition key in the primary key, so the
+table's key is (id, timestamp) and timestamp is NOT NULL, while the model
+still declares id alone (ids stay unique through the shared sequence).
+create_all() never touches an existing table, so this divergence is only
+visible to schema-diff tools - do not autogenerate migrations from the
+model against a partitioned database.
+
+Downsampling: each UTC day older than LOCATION_DOWNSAMPLE_AFTER_DAYS is
+reduced per user to the vertices of a time-aware Douglas-Peucker
+simplification of the track - the error of a fix is its distance from
+where the simplified track puts the user at that fix's time (tolerance in
+metres) - plus at least one fix per LOCATION_DOWNSAMPLE_INTERVAL_SECONDS.
+The interval is a floor on resolution, not a cap: the timeline keeps one
+fix per interval, and turns, pauses and speed changes keep their own
+vertices, so dwell time at a place survives compaction.
+Processed days are recorded in location_compactions and only revisited
+if late fixes arrive for them.
+"""
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, literal, select, text
+
+from extensions import db
+from models.user import LocationCompaction, UserLocation
+from utils.geofence_index import METERS_PER_DEGREE
+
+PARTITION_PREFIX = 'user_locations_p'
+DEFAULT_PARTITION = 'user_locations_default'
+DELETE_BATCH = 5000
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def _partition_name(day):
+    return f'{PARTITION_PREFIX}{day:%Y%m%d}'
+
+
+def _quote(connection, name):
+    """Identifier quoted for DDL that can't take bound parameters"""
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def _literal(connection, value):
+    """SQL literal for a partition bound (DDL can't take bound parameters)"""
+    return str(literal(value).compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+
+
+# ----------------------------------------------------------------------
+# Partitioning (PostgreSQL)
+# ----------------------------------------------------------------------
+def table_kind(connection):
+    """'partitioned', 'plain' or None (missing / not PostgreSQL)"""
+    if connection.dialect.name != 'postgresql':
+        return None
+    relkind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('user_locations')"
+    )).scalar()
+    return {'p': 'partitioned', 'r': 'plain'}.get(relkind)
+
+
+def existing_partitions(connection):
+    """Days that have a partition, sorted"""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('user_locations')"
+    )).scalars()
+    days = []
+    for name in names:
+        if name.startswith(PARTITION_PREFIX):
+            days.append(datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m%d').date())
+    return sorted(days)
+
+
+def create_partition(connection, day):
+    """
+    Attach a partition for one UTC day. Rows for that day that landed in the
+    DEFAULT partition are moved into it first (PostgreSQL refuses to attach
+    otherwise).
+    """
+    name = _quote(connection, _partition_name(day))
+    default = _quote(connection, DEFAULT_PARTITION)
+    start, end = _day_start(day), _day_start(day + timedelta(days=1))
+    connection.execute(text(
+        f"CREATE TABLE {name} (LIKE user_locations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    connection.execute(text(
+        f'WITH moved AS (DELETE FROM {default} WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), {'start': start, 'end': end})
+    connection.execute(text(
+        f"ALTER TABLE user_locations ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ({_literal(connection, start)}) TO ({_literal(connection, end)})"
+    ))
+
+
+def ensure_partitions(connection, first_day, last_day):
+    """Create any missing daily partitions in [first_day, last_day]; returns how many"""
+    existing = set(existing_partitions(connection))
+    created = 0
+    day = first_day
+    while day <= last_day:
+        if day not in existing:
+            create_partition(connection, day)
+            created += 1
+        day += timedelta(days=1)
+    return created
+
+
+def convert_to_partitioned(connection, ahead_days=7):
+    """
+    Turn a plain user_locations table into a daily-partitioned one, copying
+    its rows. Runs in the caller's transaction. Returns the rows copied, or
+    None if the table was already partitioned.
+
+    The new table is raw DDL, not the UserLocation model: its primary key is
+    (id, timestamp) and timestamp is NOT NULL (see the module docstring).
+    """
+    if table_kind(connection) != 'plain':
+        return None
+    connection.execute(text("ALTER TABLE user_locations RENAME TO user_locations_legacy"))
+    connection.execute(text("ALTER TABLE user_locations_legacy RENAME CONSTRAINT user_locations_pkey TO user_locations_legacy_pkey"))
+    connection.execute(text("ALTER INDEX IF EXISTS ix_user_locations_timestamp RENAME TO ix_user_locations_legacy_timestamp"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_user_locations_user_timestamp"))
+    connection.execute(text("ALTER TABLE user_locations_legacy ALTER COLUMN id DROP DEFAULT"))
+    connection.execute(text("CREATE SEQUENCE IF NOT EXISTS user_locations_id_seq"))
+    # The partition key must be part of the primary key; ids stay unique via the sequence
+    connection.execute(text("""
+        CREATE TABLE user_locations (
+            id INTEGER NOT NULL DEFAULT nextval('user_locations_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            accuracy DOUBLE PRECISION,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """))
+    connection.execute(text("ALTER SEQUENCE user_locations_id_seq OWNED BY user_locations.id"))
+    connection.execute(text('CREATE INDEX ix_user_locations_timestamp ON user_locations ("timestamp")'))
+    ensure_indexes(connection)
+    connection.execute(text(f"CREATE TABLE {_quote(connection, DEFAULT_PARTITION)} PARTITION OF user_locations DEFAULT"))
+
+    today = datetime.utcnow().date()
+    oldest = connection.execute(text('SELECT min("timestamp") FROM user_locations_legacy')).scalar()
+    ensure_partitions(connection, min(oldest.date(), today) if oldest else today, today + timedelta(days=ahead_days))
+    copied = connection.execute(text(
+        'INSERT INTO user_locations (id, user_id, latitude, longitude, accuracy, "timestamp") '
+        "SELECT id, user_id, latitude, longitude, accuracy, COALESCE(\"timestamp\", now() AT TIME ZONE 'utc') "
+        'FROM user_locations_legacy'
+    )).rowcount
+    connection.execute(text("DROP TABLE user_locations_legacy"))
+    # Keep the sequence ahead of the copied ids
+    connection.execute(text(
+        "SELECT setval('user_locations_id_seq', GREATEST((SELECT max(id) FROM user_locations), 1))"
+    ))
+    return copied
+
+
+def ensure_indexes(connection):
+    """Composite (user_id, timestamp) index for per-user history reads; idempotent"""
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_user_locations_user_timestamp ON user_locations (user_id, "timestamp")'
+    ))
+
+
+def migrate(app):
+    """
+    Startup hook (after create_all): add history indexes missing from older
+    databases, partition a still-empty user_locations on PostgreSQL and make
+    sure partitions exist for the coming days.
+    """
+    partitioning = app.config.get('LOCATION_PARTITIONING', False)
+    ahead = app.config.get('LOCATION_PARTITIONS_AHEAD_DAYS', 7)
+    with app.app_context():
+        try:
+            with db.engine.begin() as connection:
+                ensure_indexes(connection)
+                kind = table_kind(connection) if partitioning else None
+                if kind == 'plain':
+                    if connection.execute(text("SELECT 1 FROM user_locations LIMIT 1")).first() is not None:
+                        print("[LocationHistory] user_locations has data and is not partitioned - "
+                              "run `python compact_locations.py --partition` to convert it")
+                        return
+                    convert_to_partitioned(connection, ahead)
+                    print("[LocationHistory] Created daily partitions for user_locations")
+                elif kind == 'partitioned':
+                    today = datetime.utcnow().date()
+                    created = ensure_partitions(connection, today, today + timedelta(days=ahead))
+                    if created:
+                        print(f"[LocationHistory] Created {created} upcoming partitions")
+        except Exception as e:
+            print(f"[LocationHistory] History migration failed: {e}")
+
+
+# ----------------------------------------------------------------------
+# Retention
+# ----------------------------------------------------------------------
+def expire(connection, cutoff):
+    """
+    Remove fixes older than `cutoff`: drop whole daily partitions where
+    possible, delete the remaining rows in batches. Returns
+    (partitions dropped, rows deleted).
+    """
+    dropped = 0
+    if table_kind(connection) == 'partitioned':
+        for day in existing_partitions(connection):
+            if _day_start(day + timedelta(days=1)) <= cutoff:
+                connection.execute(text(f"DROP TABLE {_quote(connection, _partition_name(day))}"))
+                dropped += 1
+
+    table = UserLocation.__table__
+    deleted = 0
+    while True:
+        ids = select(table.c.id).where(table.c.timestamp < cutoff).limit(DELETE_BATCH).scalar_subquery()
+        count = connection.execute(table.delete().where(table.c.id.in_(ids), table.c.timestamp < cutoff)).rowcount
+        deleted += count
+        if count < DELETE_BATCH:
+            break
+    connection.execute(LocationCompaction.__table__.delete().where(LocationCompaction.day < cutoff.date()))
+    return dropped, deleted
+
+
+# ----------------------------------------------------------------------
+# Downsampling
+# ----------------------------------------------------------------------
+def simplify_indices(xs, ys, tolerance, ts=None):
+    """
+    Indices of the points kept by Douglas-Peucker simplification (planar
+    coordinates). With `ts` (times, e.g. seconds) the error measure is the
+    synchronized Euclidean distance: each point is compared with where the
+    simplified segment places the user at that point's time, so pauses and
+    speed changes are kept as well as turns.
+    """
+    n = len(xs)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px, py = xs[start + 1:end], ys[start + 1:end]
+        dx, dy = xs[end] - xs[start], ys[end] - ys[start]
+        if ts is not None:
+            duration = ts[end] - ts[start]
+            t = (ts[start + 1:end] - ts[start]) / duration if duration > 0 else np.zeros(len(px))
+        else:
+            length_sq = dx * dx + dy * dy
+            if length_sq == 0:
+                t = np.zeros(len(px))
+            else:
+                t = np.clip(((px - xs[start]) * dx + (py - ys[start]) * dy) / length_sq, 0.0, 1.0)
+        distances = np.hypot(px - (xs[start] + t * dx), py - (ys[start] + t * dy))
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def downsample_track(longitudes, latitudes, seconds, tolerance_m, interval_s):
+    """
+    Indices of the fixes to keep for one time-ordered track: the vertices
+    of a time-aware (synchronized Euclidean distance) simplification, plus
+    the first fix of every `interval_s` bucket that has one, so the
+    timeline keeps at least that resolution. The first and last fix are
+    always kept.
+    """
+    lons = np.asarray(longitudes, dtype=float)
+    lats = np.asarray(latitudes, dtype=float)
+    seconds = np.asarray(seconds, dtype=float)
+    if len(lons) < 3:
+        return np.arange(len(lons))
+    # Local equirectangular projection in metres is plenty for one day's track
+    scale = math.cos(math.radians(float(np.mean(lats))))
+    kept = simplify_indices(lons * scale * METERS_PER_DEGREE, lats * METERS_PER_DEGREE, tolerance_m, ts=seconds)
+    if interval_s > 0:
+        buckets = np.floor(seconds / interval_s)
+        first_in_bucket = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        kept = np.union1d(kept, first_in_bucket)
+    return kept
+
+
+def downsample_day(connection, day, tolerance_m, interval_s, dry_run=False):
+    """Downsample every user's fixes on one UTC day; returns (fixes before, fixes after)"""
+    table = UserLocation.__table__
+    start, end = _day_start(day), _day_start(day + timedelta(days=1))
+    in_day = (table.c.timestamp >= start, table.c.timestamp < end)
+    user_ids = connection.execute(select(table.c.user_id).where(*in_day).distinct()).scalars().all()
+
+    before = after = 0
+    for user_id in user_ids:
+        rows = connection.execute(
+            select(table.c.id, table.c.longitude, table.c.latitude, table.c.timestamp)
+            .where(table.c.user_id == user_id, *in_day)
+            .order_by(table.c.timestamp, table.c.id)
+        ).all()
+        seconds = [(row.timestamp - start).total_seconds() for row in rows]
+        kept = downsample_track([row.longitude for row in rows], [row.latitude for row in rows],
+                                seconds, tolerance_m, interval_s)
+        keep = np.zeros(len(rows), dtype=bool)
+        keep[kept] = True
+        drop = [row.id for row, kept_row in zip(rows, keep) if not kept_row]
+        before += len(rows)
+        after += len(rows) - len(drop)
+        if dry_run:
+            continue
+        for i in range(0, len(drop), DELETE_BATCH):
+            connection.execute(table.delete().where(table.c.id.in_(drop[i:i + DELETE_BATCH]), *in_day))
+
+    if not dry_run:
+        compaction = LocationCompaction.__table__
+        connection.execute(compaction.delete().where(compaction.c.day == day))
+        connection.execute(compaction.insert(), {
+            'day': day, 'fixes_before': before, 'fixes_after': after, 'compacted_at': datetime.utcnow()
+        })
+    return before, after
+
+
+def pending_days(connection, first_day, last_day):
+    """
+    Days in [first_day, last_day] that still need downsampling: never
+    compacted, or with more fixes now than when they were (late uploads).
+    """
+    table = UserLocation.__table__
+    oldest = connection.execute(select(func.min(table.c.timestamp))).scalar()
+    if oldest is None:
+        return []
+    done = dict(connection.execute(
+        select(LocationCompaction.day, LocationCompaction.fixes_after)
+        .where(LocationCompaction.day.between(first_day, last_day))
+    ).all())
+    days = []
+    day = max(first_day, oldest.date())
+    while day <= last_day:
+        count = connection.execute(select(func.count()).select_from(table).where(
+            table.c.timestamp >= _day_start(day), table.c.timestamp < _day_start(day + timedelta(days=1))
+        )).scalar()
+        if count and done.get(day) != count:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def run_maintenance(app, dry_run=False, now=None):
+    """
+    One pass of the history job: prepare upcoming partitions, expire fixes
+    past retention and downsample old days (one transaction per day).
+    Returns a summary dict.
+    """
+    now = now or datetime.utcnow()
+    config = app.config
+    retention_days = config.get('LOCATION_RETENTION_DAYS', 0)
+    downsample_after = config.get('LOCATION_DOWNSAMPLE_AFTER_DAYS', 7)
+    summary = {'partitions_created': 0, 'partitions_dropped': 0, 'expired': 0,
+               'days_downsampled': 0, 'fixes_before': 0, 'fixes_after': 0, 'dry_run': dry_run}
+    started = time.perf_counter()
+
+    with app.app_context():
+        engine = db.engine
+        if dry_run and retention_days > 0:
+            cutoff = _day_start(now.date() - timedelta(days=retention_days))
+            with engine.connect() as connection:
+                summary['expired'] = connection.execute(
+                    select(func.count()).select_from(UserLocation.__table__).where(UserLocation.timestamp < cutoff)
+                ).scalar()
+        if not dry_run:
+            with engine.begin() as connection:
+                if table_kind(connection) == 'partitioned':
+                    today = now.date()
+                    summary['partitions_created'] = ensure_partitions(
+                        connection, today, today + timedelta(days=config.get('LOCATION_PARTITIONS_AHEAD_DAYS', 7))
+                    )
+                if retention_days > 0:
+                    cutoff = _day_start(now.date() - timedelta(days=retention_days))
+                    summary['partitions_dropped'], summary['expired'] = expire(connection, cutoff)
+
+        if downsample_after > 0:
+            last_day = now.date() - timedelta(days=downsample_after + 1)
+            first_day = now.date() - timedelta(days=retention_days) if retention_days > 0 else date.min
+            with engine.connect() as connection:
+                days = pending_days(connection, first_day, last_day)
+            for day in days:
+                with engine.begin() as connection:
+                    before, after = downsample_day(
+                        connection, day,
+                        config.get('LOCATION_DOWNSAMPLE_TOLERANCE_M', 15),
+                        config.get('LOCATION_DOWNSAMPLE_INTERVAL_SECONDS', 60),
+                        dry_run=dry_run
+                    )
+                summary['days_downsampled'] += 1
+                summary['fixes_before'] += before
+                summary['fixes_after'] += after
+
+    summary['elapsed_s'] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def init_app(app, socketio=None):
+    """Start the periodic history job when LOCATION_MAINTENANCE_INTERVAL_HOURS is set"""
+    interval_hours = app.config.get('LOCATION_MAINTENANCE_INTERVAL_HOURS', 0)
+    if not interval_hours or app.config.get('TESTING'):
+        return
+
+    def loop():
+        sleep = socketio.sleep if socketio is not None else time.sleep
+        while True:
+            sleep(interval_hours * 3600)
+            try:
+                summary = run_maintenance(app)
+                print(f"[LocationHistory] Maintenance: {summary}")
+            except Exception as e:
+                print(f"[LocationHistory] Maintenance failed: {e}")
+
+    if socketio is not None:
+        socketio.start_background_task(loop)
+    else:
+        threading.Thread(target=loop, name='location-history', daemon=True).start()
+    print(f"[LocationHistory] Maintenance scheduled every {interval_hours}h")
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+def encode_cursor(timestamp, location_id):
+    return f'{timestamp.isoformat()}_{location_id}'
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a history cursor; raises ValueError if malformed"""
+    timestamp, _, location_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(location_id)
+
+
+def _history_query(user_id, since, cursor=None):
+    """user_id's fixes newer than `since` (and past `cursor`), newest first"""
+    table = UserLocation.__table__
+    query = select(table.c.id, table.c.latitude, table.c.longitude, table.c.accuracy, table.c.timestamp).where(
+        table.c.user_id == user_id,
+        table.c.timestamp >= since
+    )
+    if cursor:
+        timestamp, location_id = decode_cursor(cursor)
+        query = query.where(
+            (table.c.timestamp < timestamp) | ((table.c.timestamp == timestamp) & (table.c.id < location_id))
+        )
+    return query.order_by(table.c.timestamp.desc(), table.c.id.desc())
+
+
+def _fix_dict(row, user_id):
+    return {
+        'id': row.id,
+        'user_id': user_id,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'accuracy': row.accuracy,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None
+    }
+
+
+def history_page(user_id, since, limit, cursor=None, tolerance_m=None):
+    """
+    One page of a user's fixes newer than `since`, newest first, read by
+    keyset on (user_id, timestamp, id). With `tolerance_m` the page's track
+    is simplified (Douglas-Peucker, metres) before it is returned; the page
+    size still counts raw fixes so every page costs the same to read.
+    Returns (fix dicts, next cursor or None, raw fixes read).
+    """
+    rows = db.session.execute(_history_query(user_id, since, cursor).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+    scanned = len(rows)
+    if tolerance_m and scanned > 2:
+        latitudes = np.array([row.latitude for row in rows])
+        scale = math.cos(math.radians(float(latitudes.mean())))
+        kept = simplify_indices(
+            np.array([row.longitude for row in rows]) * scale * METERS_PER_DEGREE,
+            latitudes * METERS_PER_DEGREE,
+            tolerance_m
+        )
+        rows = [rows[i] for i in kept]
+
+    return [_fix_dict(row, user_id) for row in rows], next_cursor, scanned
+
+
+def history_stream(user_id, since, cursor=None, limit=None, chunk_rows=1000):
+    """
+    The same fix dicts as history_page() for the whole range (or the first
+    `limit`), as a generator reading a server-side cursor chunk_rows at a
+    time. A malformed cursor raises ValueError here, before streaming.
+    """
+    query = _history_query(user_id, since, cursor)
+    if limit:
+        query = query.limit(limit)
+    result = db.session.execute(query, execution_options={'yield_per': chunk_rows})
+    return (_fix_dict(row, user_id) for row in result)
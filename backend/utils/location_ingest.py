@@ -0,0 +1,181 @@
+"""
+Location ingestion.
+
+ingest_fix() is the single-fix path shared by POST /api/location/update and
+the 'location_update' Socket.IO event.
+
+Clients that were offline (or simply buffer fixes to save battery) upload
+an ordered array of timestamped fixes in one request. The whole batch is
+written with a single multi-row INSERT and one commit (or handed to the
+write-behind buffer), containment is computed for every fix in one
+vectorised index query, and zone transitions are replayed in timestamp
+order (in memory; state rows are only touched when membership changes).
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from extensions import db
+from models.user import UserLocation, UserLatestLocation
+from utils.fix_filter import fix_filter, STORE, MERGE, DROP
+from utils.geofence_index import geofence_index
+from utils.latest_location import upsert_latest
+from utils.location_buffer import location_buffer
+from utils.position_feed import position_feed
+from utils.report_interval import report_interval
+from utils.safety_score import safety_score
+from utils.spatial import zones_containing
+from utils.zone_transitions import zone_tracker, emit_zone_transitions
+
+# Client clocks may run slightly ahead; anything later is clamped to now
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def parse_timestamp(value, now):
+    """
+    Fix time as a naive UTC datetime. Accepts epoch milliseconds (what the
+    browser geolocation API reports), epoch seconds (also as numeric strings,
+    e.g. from a query string) or ISO 8601 strings; missing values mean "now".
+    """
+    if value is None or value == '':
+        return now
+    if isinstance(value, str) and value.replace('.', '', 1).isdigit():
+        value = float(value)
+    if isinstance(value, bool):
+        raise ValueError('timestamp must be a number or ISO 8601 string')
+    if isinstance(value, (int, float)):
+        seconds = value / 1000.0 if value > 1e11 else float(value)
+        timestamp = datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+    else:
+        timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(timestamp, now + MAX_CLOCK_SKEW)
+
+
+def parse_fix(data, now):
+    """Validate one fix dict; returns column values for UserLocation"""
+    if not isinstance(data, dict):
+        raise ValueError('fix must be an object')
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+    except KeyError:
+        raise ValueError('latitude and longitude are required')
+    except (TypeError, ValueError):
+        raise ValueError('latitude and longitude must be numbers')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('coordinates out of range')
+    accuracy = data.get('accuracy')
+    if accuracy is not None:
+        accuracy = float(accuracy)
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'accuracy': accuracy,
+        'timestamp': parse_timestamp(data.get('timestamp'), now)
+    }
+
+
+def ingest_batch(user_id, fixes):
+    """
+    Store already-parsed fixes for a user and evaluate zone transitions.
+    Every fix is written to history - the client buffered them on purpose.
+    Fixes older than the user's latest stored fix are history only, so
+    replaying a backlog never re-alerts for where the user used to be.
+    Live fixes go through the movement filter for transitions only: merged
+    ones advance dwell with the zones of the last moved-to fix, dropped ones
+    are skipped. Returns (transitions, zones containing the newest fix,
+    fixes stored). The caller commits.
+    """
+    fixes = sorted(fixes, key=lambda fix: fix['timestamp'])
+    latest = db.session.query(UserLatestLocation.timestamp).filter(
+        UserLatestLocation.user_id == user_id
+    ).scalar()
+
+    rows = [dict(fix, user_id=user_id) for fix in fixes]
+    live = [fix for fix in fixes if latest is None or fix['timestamp'] >= latest]
+    transitions = []
+    zones = []
+    if live:
+        hits = geofence_index.query_points(
+            np.array([fix['longitude'] for fix in live]),
+            np.array([fix['latitude'] for fix in live])
+        )
+        for fix, entries in zip(live, hits):
+            zones = [entry.zone for entry in entries]
+            decision, reference_zones = fix_filter.classify(user_id, fix)
+            if decision == STORE:
+                fix_filter.stored(user_id, fix, zones)
+                tracked = zones
+            elif decision == MERGE:
+                fix_filter.merged(user_id, fix)
+                tracked = reference_zones
+            else:
+                continue
+            transitions.extend(zone_tracker.update(user_id, tracked, now=fix['timestamp']))
+
+    # Writes history and moves the latest position to the newest fix
+    location_buffer.write(rows)
+    return transitions, zones, len(rows)
+
+
+def parse_speed(value):
+    """Optional client-reported ground speed in m/s (Geolocation coords.speed)"""
+    if value is None or value == '':
+        return None
+    speed = float(value)
+    if not 0 <= speed <= 150:
+        raise ValueError('speed must be between 0 and 150 m/s')
+    return speed
+
+
+def ingest_fix(user_id, fix, speed=None):
+    """
+    Store one parsed fix, evaluate zone transitions, commit, and notify the
+    tourist's room and the authority position feed. Returns the response
+    payload (also used as the socket ack), including the recommended delay
+    before the next fix. `speed` is the client's own estimate, if any.
+    """
+    report_interval.observe()
+    measured = fix_filter.speed(user_id, fix)
+    if measured is not None:
+        speed = max(speed or 0.0, measured)
+    decision, zones = fix_filter.classify(user_id, fix)
+    row = dict(fix, user_id=user_id)
+    location = None
+    transitions = []
+    if decision == STORE:
+        zones = zones_containing(fix['longitude'], fix['latitude'])
+        fix_filter.stored(user_id, fix, zones)
+        if location_buffer.enabled:
+            location_buffer.write([row])
+        else:
+            location = UserLocation(**row)
+            db.session.add(location)
+            upsert_latest(db.session, [row])
+    elif decision == MERGE:
+        # Same place as the last stored fix: extend the latest position, no history row
+        fix_filter.merged(user_id, fix)
+        upsert_latest(db.session, [row])
+    if decision != DROP:
+        transitions = zone_tracker.update(user_id, zones)
+        db.session.commit()
+        emit_zone_transitions(user_id, transitions)
+        # Merged fixes refresh last-seen too; the feed's per-user rate limit bounds the traffic
+        position_feed.publish(user_id, row)
+    # Alerts only for zones just entered - staying inside a zone doesn't re-alert
+    geofence_alerts = [
+        {key: t[key] for key in ('id', 'name', 'zone_type', 'risk_level', 'warning_message', 'description')}
+        for t in transitions if t['event'] == 'enter'
+    ]
+    next_update_seconds, next_update_reason = report_interval.recommend(user_id, fix, zones, speed)
+    return {
+        'location_id': location.id if location else None,  # None while buffered or not stored
+        'ingest': decision,
+        'geofence_alerts': geofence_alerts,
+        'geofence_transitions': transitions,
+        'inside_zone_ids': [zone['id'] for zone in zones],
+        'safety_score': safety_score(fix['latitude'], fix['longitude']),
+        'next_update_seconds': next_update_seconds,
+        'next_update_reason': next_update_reason
+    }
@@ -0,0 +1,252 @@
+"""
+Minimal Mapbox Vector Tile (MVT 2.1) encoder.
+
+Used for /api/tiles when PostGIS (ST_AsMVT) isn't available. Handles the
+geometry types we serve - points (incidents) and polygons/multipolygons
+(geofences) - and string/number/bool properties. Geometries come in as
+lon/lat Shapely objects and are clipped, projected to Web Mercator tile
+space and quantised here.
+
+Wire format reference: https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+import math
+import struct
+
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+
+EXTENT = 4096
+BUFFER = 64
+
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+
+# ----------------------------------------------------------------------
+# Tile maths
+# ----------------------------------------------------------------------
+def tile_bounds(z, x, y):
+    """(min_lon, min_lat, max_lon, max_lat) of an XYZ tile"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+
+def buffered_tile_bounds(z, x, y, buffer=BUFFER, extent=EXTENT):
+    """Tile bounds grown by `buffer` tile pixels on every side"""
+    n = 2 ** z
+    pad = buffer / extent
+    min_lon = (x - pad) / n * 360.0 - 180.0
+    max_lon = (x + 1 + pad) / n * 360.0 - 180.0
+
+    def lat(row):
+        row = min(max(row, 0), n)
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (max(min_lon, -180.0), lat(y + 1 + pad), min(max_lon, 180.0), lat(y - pad))
+
+
+def _projector(z, x, y, extent=EXTENT):
+    """Return a shapely.transform callback mapping lon/lat to tile pixels"""
+    n = 2 ** z
+
+    def project(coords):
+        lon = coords[:, 0]
+        lat = np.clip(coords[:, 1], -85.05112878, 85.05112878)
+        world_x = (lon + 180.0) / 360.0
+        world_y = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+        return np.column_stack(((world_x * n - x) * extent, (world_y * n - y) * extent))
+
+    return project
+
+
+def to_tile_geometry(geometry, z, x, y, extent=EXTENT, buffer=BUFFER):
+    """Clip a lon/lat geometry to the (buffered) tile and quantise to tile pixels"""
+    clipped = shapely.clip_by_rect(geometry, *buffered_tile_bounds(z, x, y, buffer, extent))
+    if clipped.is_empty:
+        return None
+    projected = shapely.transform(clipped, _projector(z, x, y, extent))
+    quantised = shapely.set_precision(projected, 1.0)
+    if quantised.is_empty:
+        return None
+    return quantised
+
+
+# ----------------------------------------------------------------------
+# Protobuf primitives
+# ----------------------------------------------------------------------
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _length_delimited(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _length_delimited(number, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _field(5, 0) + _varint(value)
+        return _field(6, 0) + _varint((value << 1) ^ (value >> 63))
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack('<d', value)
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+# ----------------------------------------------------------------------
+# Geometry commands
+# ----------------------------------------------------------------------
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+class _Cursor:
+    """Tracks the pen position; MVT coordinates are deltas from the last point"""
+
+    def __init__(self):
+        self.x = 0
+        self.y = 0
+
+    def move(self, px, py):
+        dx, dy = px - self.x, py - self.y
+        self.x, self.y = px, py
+        return _zigzag(dx), _zigzag(dy)
+
+
+def _ring_commands(ring, cursor):
+    coords = np.asarray(ring.coords, dtype=np.int64)[:-1]  # drop closing point
+    if len(coords):
+        # Drop consecutive duplicates left behind by quantisation
+        keep = np.ones(len(coords), dtype=bool)
+        keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+        coords = coords[keep]
+    if len(coords) < 3:
+        return []
+    commands = [_command(CMD_MOVE_TO, 1), *cursor.move(*coords[0])]
+    commands.append(_command(CMD_LINE_TO, len(coords) - 1))
+    for px, py in coords[1:]:
+        commands.extend(cursor.move(px, py))
+    commands.append(_command(CMD_CLOSE_PATH, 1))
+    return commands
+
+
+def _polygon_commands(geometry):
+    cursor = _Cursor()
+    commands = []
+    polygons = geometry.geoms if hasattr(geometry, 'geoms') else [geometry]
+    for polygon in polygons:
+        if polygon.geom_type != 'Polygon' or polygon.is_empty:
+            continue
+        # Exterior rings must have positive (shoelace) area in tile space
+        polygon = orient(polygon, sign=1.0)
+        exterior = _ring_commands(polygon.exterior, cursor)
+        if not exterior:
+            continue
+        commands.extend(exterior)
+        for interior in polygon.interiors:
+            commands.extend(_ring_commands(interior, cursor))
+    return commands
+
+
+def _point_commands(geometry):
+    cursor = _Cursor()
+    points = geometry.geoms if hasattr(geometry, 'geoms') else [geometry]
+    coords = [(int(p.x), int(p.y)) for p in points if not p.is_empty]
+    if not coords:
+        return []
+    commands = [_command(CMD_MOVE_TO, len(coords))]
+    for px, py in coords:
+        commands.extend(cursor.move(px, py))
+    return commands
+
+
+# ----------------------------------------------------------------------
+# Layers and tiles
+# ----------------------------------------------------------------------
+def encode_layer(name, features, extent=EXTENT):
+    """
+    Encode one layer. `features` is an iterable of
+    (feature_id, tile_geometry, properties) with geometries already in
+    tile pixel space (see to_tile_geometry).
+    """
+    keys, key_index = [], {}
+    values, value_index = [], {}
+    encoded_features = []
+
+    for feature_id, geometry, properties in features:
+        if geometry is None or geometry.is_empty:
+            continue
+        if geometry.geom_type in ('Point', 'MultiPoint'):
+            geom_type, commands = GEOM_POINT, _point_commands(geometry)
+        elif geometry.geom_type in ('Polygon', 'MultiPolygon', 'GeometryCollection'):
+            geom_type, commands = GEOM_POLYGON, _polygon_commands(geometry)
+        else:
+            continue
+        if not commands:
+            continue
+
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            value_key = (type(value), value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags.extend((key_index[key], value_index[value_key]))
+
+        feature = b''
+        if feature_id is not None:
+            feature += _field(1, 0) + _varint(int(feature_id))
+        if tags:
+            feature += _packed(2, tags)
+        feature += _field(3, 0) + _varint(geom_type)
+        feature += _packed(4, commands)
+        encoded_features.append(feature)
+
+    if not encoded_features:
+        return b''
+
+    layer = _field(15, 0) + _varint(2)
+    layer += _length_delimited(1, name.encode('utf-8'))
+    for feature in encoded_features:
+        layer += _length_delimited(2, feature)
+    for key in keys:
+        layer += _length_delimited(3, key.encode('utf-8'))
+    for value in values:
+        layer += _length_delimited(4, _encode_value(value))
+    layer += _field(5, 0) + _varint(extent)
+    return _length_delimited(3, layer)
@@ -0,0 +1,142 @@
+"""
+Live tourist positions for the authorities Socket.IO room.
+
+Location endpoints publish each user's newest fix here instead of
+authority dashboards polling /api/location/all-tourists. Fixes are
+coalesced per tourist (only the newest pending one is kept) and a
+background task (a greenlet under the gevent worker) sends everything
+that is due every POSITION_FEED_TICK_MS as one 'tourist_positions'
+event, sending a given tourist at most once per
+POSITION_FEED_MIN_INTERVAL_MS.
+
+Every event carries a sequence number. Authorities get a
+'tourist_snapshot' (all current positions plus the sequence it is valid
+at) when they join; a client that sees a gap in the sequence asks for a
+fresh snapshot with 'request_tourist_snapshot'.
+"""
+import threading
+import time
+
+from extensions import db
+from models.user import User
+from utils.latest_location import all_tourist_positions, tourist_positions
+
+ROOM = 'authorities'
+
+
+class PositionFeed:
+    """Coalescing, rate-limited publisher of tourist position deltas"""
+
+    def __init__(self, tick_ms=250, min_interval_ms=2000):
+        self.enabled = False
+        self.tick = tick_ms / 1000.0
+        self.min_interval = min_interval_ms / 1000.0
+        self.seq = 0
+        self._pending = {}    # user_id -> newest unsent fix
+        self._last_sent = {}  # user_id -> monotonic time of last send
+        self._lock = threading.Lock()
+        self._app = None
+        self._socketio = None
+        self._worker_started = False
+        self._stats = {'published': 0, 'coalesced': 0, 'sent': 0, 'events': 0}
+
+    def configure(self, app, socketio=None):
+        self._app = app
+        self._socketio = socketio
+        self.enabled = socketio is not None and bool(app.config.get('POSITION_FEED_ENABLED', True))
+        self.tick = app.config.get('POSITION_FEED_TICK_MS', 250) / 1000.0
+        self.min_interval = app.config.get('POSITION_FEED_MIN_INTERVAL_MS', 2000) / 1000.0
+
+    def publish(self, user_id, fix):
+        """Queue a user's fix (latitude, longitude, accuracy, timestamp) for the next delta"""
+        if not self.enabled:
+            return
+        with self._lock:
+            current = self._pending.get(user_id)
+            if current is not None:
+                if fix['timestamp'] < current['timestamp']:
+                    return
+                self._stats['coalesced'] += 1
+            self._pending[user_id] = fix
+            self._stats['published'] += 1
+        self._ensure_worker()
+
+    def _take_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = {
+                user_id: fix for user_id, fix in self._pending.items()
+                if now - self._last_sent.get(user_id, 0.0) >= self.min_interval
+            }
+            for user_id in due:
+                del self._pending[user_id]
+                self._last_sent[user_id] = now
+            # Forget send times nobody is rate limited by any more
+            if len(self._last_sent) > 4 * max(len(self._pending), 1024):
+                self._last_sent = {
+                    user_id: sent for user_id, sent in self._last_sent.items()
+                    if now - sent < self.min_interval
+                }
+        return due
+
+    def flush(self):
+        """Send one delta with every tourist that is due; returns how many were sent"""
+        due = self._take_due()
+        if not due:
+            return 0
+        with self._app.app_context():
+            try:
+                users = User.query.filter(User.id.in_(list(due)), User.role == 'tourist').all()
+                positions = tourist_positions([
+                    (user, due[user.id]['latitude'], due[user.id]['longitude'],
+                     due[user.id].get('accuracy'), due[user.id]['timestamp'])
+                    for user in users
+                ])
+            finally:
+                db.session.remove()
+        if not positions:
+            return 0
+        with self._lock:
+            self.seq += 1
+            seq = self.seq
+        self._socketio.emit('tourist_positions', {'seq': seq, 'positions': positions}, room=ROOM)
+        self._stats['sent'] += len(positions)
+        self._stats['events'] += 1
+        return len(positions)
+
+    def snapshot(self):
+        """All current tourist positions and the sequence number they are valid at"""
+        # Read the sequence first: deltas after it may repeat positions in the
+        # snapshot, which clients resolve by timestamp, but none are lost
+        seq = self.seq
+        return {'seq': seq, 'positions': all_tourist_positions()}
+
+    def _ensure_worker(self):
+        if self._worker_started:
+            return
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        self._socketio.start_background_task(self._run)
+        print(f"[PositionFeed] Publishing tourist positions every {int(self.tick * 1000)} ms "
+              f"(each tourist at most every {int(self.min_interval * 1000)} ms)")
+
+    def _run(self):
+        while True:
+            self._socketio.sleep(self.tick)
+            if self._pending:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"[PositionFeed] Could not send positions: {e}")
+
+    def stats(self):
+        return dict(self._stats, enabled=self.enabled, seq=self.seq, pending=len(self._pending))
+
+
+position_feed = PositionFeed()
+
+
+def init_app(app, socketio=None):
+    position_feed.configure(app, socketio)
@@ -0,0 +1,168 @@
+"""
+Server-recommended location reporting interval.
+
+Every single-fix update answers with next_update_seconds: how long the
+client may wait before sending its next fix. It is derived from
+
+- speed: a parked phone reports every REPORT_INTERVAL_IDLE_SECONDS, a
+  moving one roughly every REPORT_INTERVAL_TARGET_DISTANCE_M metres;
+- risky zones: inside a high-risk zone (or near an active incident, or
+  with an open SOS of one's own) the client reports at the minimum
+  interval; approaching a high/medium-risk zone, at least twice before
+  it could reach the boundary;
+- server load: while the fleet sends more than REPORT_INTERVAL_TARGET_RATE
+  fixes per second (or the write-behind buffer is filling up), routine
+  intervals are stretched proportionally; the risk bounds still apply.
+
+The result is clamped to [REPORT_INTERVAL_MIN_SECONDS,
+REPORT_INTERVAL_MAX_SECONDS] and returned with the reason that decided it.
+"""
+import threading
+import time
+
+import numpy as np
+
+from models.incident import Incident
+from utils.geofence_index import haversine_m
+from utils.location_buffer import location_buffer
+from utils.spatial import nearest_zones
+
+# Below this speed (m/s) a phone counts as parked
+STATIONARY_SPEED = 0.5
+# Assumed speed when judging how soon a slow/parked user could reach a zone
+WALKING_SPEED = 1.4
+ACTIVE_INCIDENT_STATUSES = ('active', 'acknowledged', 'en_route')
+RISKY_LEVELS = ('high', 'medium')
+
+
+class ReportIntervalAdvisor:
+    """Recommends per-fix reporting intervals and tracks the fleet's fix rate"""
+
+    def __init__(self):
+        self.enabled = True
+        self.min_seconds = 5
+        self.max_seconds = 300
+        self.default_seconds = 30
+        self.idle_seconds = 120
+        self.target_distance_m = 50.0
+        self.risk_lookahead_m = 2000.0
+        self.incident_radius_m = 1000.0
+        self.target_rate = 200.0
+        self.incident_cache_seconds = 10
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._rate = 0.0
+        self._incidents = None
+        self._incidents_loaded = 0.0
+
+    def configure(self, config):
+        self.enabled = bool(config.get('REPORT_INTERVAL_ENABLED', True))
+        self.min_seconds = config.get('REPORT_INTERVAL_MIN_SECONDS', 5)
+        self.max_seconds = config.get('REPORT_INTERVAL_MAX_SECONDS', 300)
+        self.default_seconds = config.get('REPORT_INTERVAL_DEFAULT_SECONDS', 30)
+        self.idle_seconds = config.get('REPORT_INTERVAL_IDLE_SECONDS', 120)
+        self.target_distance_m = float(config.get('REPORT_INTERVAL_TARGET_DISTANCE_M', 50))
+        self.risk_lookahead_m = float(config.get('REPORT_INTERVAL_RISK_LOOKAHEAD_M', 2000))
+        self.incident_radius_m = float(config.get('REPORT_INTERVAL_INCIDENT_RADIUS_M', 1000))
+        self.target_rate = float(config.get('REPORT_INTERVAL_TARGET_RATE', 200))
+
+    # ------------------------------------------------------------------
+    # Load
+    # ------------------------------------------------------------------
+    def observe(self, count=1):
+        """Count fixes received; the rate is measured over 10 second windows"""
+        with self._lock:
+            self._window_count += count
+            elapsed = time.monotonic() - self._window_start
+            if elapsed >= 10:
+                self._rate = self._window_count / elapsed
+                self._window_start += elapsed
+                self._window_count = 0
+
+    def load_factor(self):
+        """>= 1; how far the fix rate or write-behind backlog exceeds capacity"""
+        factor = self._rate / self.target_rate if self.target_rate else 1.0
+        if location_buffer.enabled and location_buffer.max_rows:
+            # Half-full buffer doubles intervals, a full one quadruples them
+            factor = max(factor, 4 * location_buffer.depth() / location_buffer.max_rows)
+        return max(1.0, factor)
+
+    # ------------------------------------------------------------------
+    # Incidents
+    # ------------------------------------------------------------------
+    def _active_incidents(self):
+        """(user_ids, lons, lats) of open incidents, cached for a few seconds"""
+        now = time.monotonic()
+        if self._incidents is None or now - self._incidents_loaded >= self.incident_cache_seconds:
+            rows = Incident.query.with_entities(Incident.user_id, Incident.longitude, Incident.latitude).filter(
+                Incident.status.in_(ACTIVE_INCIDENT_STATUSES)
+            ).all()
+            self._incidents = (
+                {row[0] for row in rows},
+                np.array([row[1] for row in rows if row[1] is not None and row[2] is not None], dtype=float),
+                np.array([row[2] for row in rows if row[1] is not None and row[2] is not None], dtype=float)
+            )
+            self._incidents_loaded = now
+        return self._incidents
+
+    def invalidate_incidents(self):
+        self._incidents = None
+
+    # ------------------------------------------------------------------
+    # Recommendation
+    # ------------------------------------------------------------------
+    def recommend(self, user_id, fix, zones, speed=None):
+        """
+        (next_update_seconds, reason) for a user at `fix` inside `zones`
+        (zone dicts), moving at `speed` m/s (None when unknown).
+        """
+        if not self.enabled:
+            return self.default_seconds, 'default'
+        longitude, latitude = fix['longitude'], fix['latitude']
+
+        incident_users, inc_lons, inc_lats = self._active_incidents()
+        if user_id in incident_users:
+            return self.min_seconds, 'own_incident'
+        if len(inc_lons) and (haversine_m(longitude, latitude, inc_lons, inc_lats) <= self.incident_radius_m).any():
+            return self.min_seconds, 'nearby_incident'
+        if any(zone.get('risk_level') == 'high' for zone in zones):
+            return self.min_seconds, 'high_risk_zone'
+
+        if speed is None:
+            interval, reason = float(self.default_seconds), 'default'
+        elif speed < STATIONARY_SPEED:
+            interval, reason = float(self.idle_seconds), 'stationary'
+        else:
+            interval, reason = self.target_distance_m / speed, 'moving'
+        # Load stretches the routine cadence only, never the risk bounds below
+        interval = min(interval * self.load_factor(), self.max_seconds)
+
+        if any(zone.get('risk_level') in RISKY_LEVELS for zone in zones):
+            if interval > 3 * self.min_seconds:
+                interval, reason = 3 * self.min_seconds, 'risk_zone'
+        else:
+            # Report at least twice before the user could cross into a risky zone
+            closing_speed = max(speed or 0.0, WALKING_SPEED)
+            lookahead = min(self.risk_lookahead_m, closing_speed * interval * 2)
+            nearest = nearest_zones(longitude, latitude, k=1, max_distance_m=lookahead,
+                                    risk_levels=list(RISKY_LEVELS))
+            if nearest:
+                arrival = nearest[0]['distance_m'] / closing_speed
+                if arrival / 2 < interval:
+                    interval, reason = arrival / 2, 'approaching_risk_zone'
+        return int(round(min(max(interval, self.min_seconds), self.max_seconds))), reason
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'fix_rate': round(self._rate, 2),
+            'load_factor': round(self.load_factor(), 2)
+        }
+
+
+report_interval = ReportIntervalAdvisor()
+
+
+def init_app(app):
+    report_interval.configure(app.config)
@@ -0,0 +1,185 @@
+"""
+Server-side safety score.
+
+Scores a position on a 0-10 scale from the zones it is inside or near,
+the local time of day and recent incidents around it. The dashboard used
+to compute this in the browser from whichever zones it had loaded; doing
+it here gives every client (and the authority view) the same number.
+
+Everything is computed over NumPy arrays, so scoring one tourist on a
+location update and scoring every tourist for the authority dashboard go
+through the same code path.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+from models.incident import Incident
+from utils.geofence_index import geofence_index, haversine_m, METERS_PER_DEGREE
+
+BASE_SCORE = 10.0
+# Local hours (inclusive) considered daytime
+DAY_START_HOUR = 6
+DAY_END_HOUR = 20
+NIGHT_PENALTY = 1.5
+# Penalty per zone the point is inside, by risk level
+RISK_PENALTY = {'high': 3.0, 'medium': 1.5}
+# Being close to (not inside) a high-risk zone
+NEAR_RISK_PENALTY = 0.5
+NEAR_RISK_PENALTY_MAX = 1.0
+# Low-risk zones nearby are places to head for
+SAFE_ZONE_BONUS = 0.5
+SAFE_ZONE_BONUS_MAX = 1.5
+# Recent incidents, weighted by priority and fading out linearly with distance
+INCIDENT_WEIGHT = {'critical': 1.0, 'high': 0.75, 'medium': 0.5, 'low': 0.25}
+INCIDENT_PENALTY_MAX = 3.0
+IGNORED_INCIDENT_STATUSES = ('false_alarm',)
+# Points x incidents handled per distance matrix
+CHUNK_SIZE = 2048
+
+
+def _setting(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+def score_level(score):
+    """Label for a 0-10 score"""
+    if score >= 8:
+        return 'safe'
+    if score >= 5:
+        return 'moderate'
+    return 'unsafe'
+
+
+def _recent_incidents(lons, lats, radius_m, now):
+    """(lons, lats, weights) of recent incidents in the points' bounding box"""
+    window = timedelta(hours=_setting('SAFETY_SCORE_INCIDENT_WINDOW_HOURS', 24))
+    margin = radius_m / METERS_PER_DEGREE
+    lon_margin = margin / max(np.cos(np.radians(np.abs(lats).max())), 1e-6)
+    rows = Incident.query.with_entities(Incident.longitude, Incident.latitude, Incident.priority).filter(
+        Incident.created_at >= now - window,
+        Incident.status.notin_(IGNORED_INCIDENT_STATUSES),
+        Incident.latitude.between(lats.min() - margin, lats.max() + margin),
+        Incident.longitude.between(lons.min() - lon_margin, lons.max() + lon_margin)
+    ).all()
+    if not rows:
+        return np.empty(0), np.empty(0), np.empty(0)
+    inc_lons = np.array([row[0] for row in rows], dtype=float)
+    inc_lats = np.array([row[1] for row in rows], dtype=float)
+    weights = np.array([INCIDENT_WEIGHT.get(row[2], 0.5) for row in rows], dtype=float)
+    return inc_lons, inc_lats, weights
+
+
+def _incident_penalty(lons, lats, radius_m, now):
+    penalty = np.zeros(len(lons))
+    counts = np.zeros(len(lons), dtype=np.int64)
+    inc_lons, inc_lats, weights = _recent_incidents(lons, lats, radius_m, now)
+    if not len(weights):
+        return penalty, counts
+    for start in range(0, len(lons), CHUNK_SIZE):
+        block = slice(start, start + CHUNK_SIZE)
+        distances = haversine_m(lons[block, None], lats[block, None], inc_lons[None, :], inc_lats[None, :])
+        nearby = distances <= radius_m
+        decay = np.where(nearby, 1.0 - distances / radius_m, 0.0)
+        penalty[block] = (decay * weights).sum(axis=1)
+        counts[block] = nearby.sum(axis=1)
+    return np.minimum(penalty, INCIDENT_PENALTY_MAX), counts
+
+
+def score_points(latitudes, longitudes, now=None):
+    """
+    Score many positions at once. Returns a dict of arrays aligned with the
+    input: 'score' plus each factor's contribution and the counts behind it.
+    """
+    lats = np.asarray(latitudes, dtype=float)
+    lons = np.asarray(longitudes, dtype=float)
+    count = len(lats)
+    now = now or datetime.utcnow()
+    proximity_m = _setting('SAFETY_SCORE_ZONE_RADIUS_M', 2000)
+    incident_radius_m = _setting('SAFETY_SCORE_INCIDENT_RADIUS_M', 1000)
+
+    # Time of day (one local clock for the deployment)
+    offset = timedelta(minutes=_setting('SAFETY_SCORE_UTC_OFFSET_MINUTES', 330))
+    local_hour = (now + offset).hour
+    night = np.full(count, NIGHT_PENALTY if not DAY_START_HOUR <= local_hour <= DAY_END_HOUR else 0.0)
+
+    # Zone containment and proximity
+    zone_penalty = np.zeros(count)
+    near_risk = np.zeros(count)
+    safe_nearby = np.zeros(count)
+    inside_high = np.zeros(count, dtype=np.int64)
+    inside_medium = np.zeros(count, dtype=np.int64)
+    if count:
+        point_idx, entries, distances = geofence_index.query_points_radius(lons, lats, proximity_m)
+        if entries:
+            risk = np.array([entry.zone['risk_level'] for entry in entries])
+            inside = distances == 0
+            for level, weight in RISK_PENALTY.items():
+                hits = inside & (risk == level)
+                zone_penalty += weight * np.bincount(point_idx[hits], minlength=count)
+            inside_high = np.bincount(point_idx[inside & (risk == 'high')], minlength=count)
+            inside_medium = np.bincount(point_idx[inside & (risk == 'medium')], minlength=count)
+            near_risk = np.bincount(point_idx[~inside & (risk == 'high')], minlength=count).astype(float)
+            safe_nearby = np.bincount(point_idx[risk == 'low'], minlength=count).astype(float)
+    near_risk_penalty = np.minimum(near_risk * NEAR_RISK_PENALTY, NEAR_RISK_PENALTY_MAX)
+    safe_bonus = np.minimum(safe_nearby * SAFE_ZONE_BONUS, SAFE_ZONE_BONUS_MAX)
+
+    # Recent incidents
+    if count:
+        incident_penalty, incidents_nearby = _incident_penalty(lons, lats, incident_radius_m, now)
+    else:
+        incident_penalty, incidents_nearby = np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    score = BASE_SCORE - night - zone_penalty - near_risk_penalty - incident_penalty + safe_bonus
+    return {
+        'score': np.clip(score, 0.0, 10.0),
+        'night': night,
+        'zone_penalty': zone_penalty,
+        'near_risk_penalty': near_risk_penalty,
+        'incident_penalty': incident_penalty,
+        'safe_zone_bonus': safe_bonus,
+        'inside_high_risk': inside_high,
+        'inside_medium_risk': inside_medium,
+        'safe_zones_nearby': safe_nearby.astype(np.int64),
+        'incidents_nearby': incidents_nearby,
+    }
+
+
+def _penalty(value):
+    return round(-float(value), 2) + 0.0  # no '-0.0' in JSON
+
+
+def _result(scores, i):
+    score = round(float(scores['score'][i]), 1)
+    return {
+        'score': score,
+        'level': score_level(score),
+        'factors': {
+            'time_of_day': _penalty(scores['night'][i]),
+            'zones': _penalty(scores['zone_penalty'][i]),
+            'nearby_risk_zones': _penalty(scores['near_risk_penalty'][i]),
+            'incidents': _penalty(scores['incident_penalty'][i]),
+            'safe_zones_nearby': round(float(scores['safe_zone_bonus'][i]), 2),
+        },
+        'counts': {
+            'inside_high_risk': int(scores['inside_high_risk'][i]),
+            'inside_medium_risk': int(scores['inside_medium_risk'][i]),
+            'safe_zones_nearby': int(scores['safe_zones_nearby'][i]),
+            'incidents_nearby': int(scores['incidents_nearby'][i]),
+        }
+    }
+
+
+def safety_scores(latitudes, longitudes, now=None):
+    """JSON-ready score dicts for many positions"""
+    scores = score_points(latitudes, longitudes, now)
+    return [_result(scores, i) for i in range(len(scores['score']))]
+
+
+def safety_score(latitude, longitude, now=None):
+    """JSON-ready score dict for one position"""
+    return safety_scores([latitude], [longitude], now)[0]
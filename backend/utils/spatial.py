@@ -0,0 +1,198 @@
+"""
+Spatial query layer for geofences.
+
+When the database is PostgreSQL with the PostGIS extension, containment and
+proximity queries are pushed down into SQL (ST_Contains / ST_DWithin against
+the GiST-indexed geofences.geom column). Anywhere else - plain Postgres,
+SQLite under TestingConfig, or if a SQL query fails - the same calls are
+answered from the in-process STRtree in utils.geofence_index.
+"""
+import math
+
+from sqlalchemy import func, inspect, text
+
+from extensions import db
+import models.geofence as geofence_model
+from models.geofence import Geofence
+from utils.geofence_index import geofence_index, METERS_PER_DEGREE
+
+_backend = 'python'
+
+
+def detect_postgis(connection):
+    """Try to enable PostGIS and report whether it is installed"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+    except Exception as e:
+        print(f"[Spatial] Could not create postgis extension: {e}")
+    row = connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).first()
+    return row is not None
+
+
+def ensure_geofence_geometry(connection, postgis, batch_size=500):
+    """
+    Add geofences.geom if missing, backfill it from polygon_data and build the
+    GiST index. Idempotent - safe to run on every startup.
+    """
+    columns = {col['name'] for col in inspect(connection).get_columns('geofences')}
+    if 'geom' not in columns:
+        col_type = 'geometry(Polygon, 4326)' if postgis else 'TEXT'
+        connection.execute(text(f"ALTER TABLE geofences ADD COLUMN geom {col_type}"))
+        print(f"[Spatial] Added geofences.geom ({col_type})")
+    if not postgis:
+        return 0
+
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_geofences_geom ON geofences USING GIST (geom)"
+    ))
+
+    rows = connection.execute(text(
+        "SELECT id, polygon_data FROM geofences WHERE geom IS NULL AND polygon_data IS NOT NULL"
+    )).fetchall()
+    updates = []
+    for row in rows:
+        polygon = Geofence(polygon_data=row.polygon_data).get_polygon()
+        if polygon is not None:
+            updates.append({'id': row.id, 'ewkt': f'SRID=4326;{polygon.wkt}'})
+
+    update_sql = text("UPDATE geofences SET geom = ST_GeomFromEWKT(:ewkt) WHERE id = :id")
+    for start in range(0, len(updates), batch_size):
+        connection.execute(update_sql, updates[start:start + batch_size])
+    if updates:
+        print(f"[Spatial] Backfilled geom for {len(updates)} geofences")
+    return len(updates)
+
+
+def init_app(app):
+    """Probe for PostGIS before create_all() so Geofence.geom gets the right column type"""
+    global _backend
+    preference = app.config.get('SPATIAL_QUERY_BACKEND', 'auto')
+    postgis = False
+    with app.app_context():
+        try:
+            with db.engine.connect() as connection:
+                postgis = detect_postgis(connection)
+                connection.commit()
+        except Exception as e:
+            print(f"[Spatial] PostGIS probe failed: {e}")
+    geofence_model.POSTGIS_ENABLED = postgis
+    _backend = 'postgis' if postgis and preference in ('auto', 'postgis') else 'python'
+    print(f"[Spatial] PostGIS: {'✅ available' if postgis else '❌ not available'} - using {_backend} query path")
+
+
+def migrate(app):
+    """Run ensure_geofence_geometry() against the app's database (after create_all)"""
+    with app.app_context():
+        try:
+            with db.engine.begin() as connection:
+                ensure_geofence_geometry(connection, geofence_model.POSTGIS_ENABLED)
+        except Exception as e:
+            print(f"[Spatial] Geometry migration failed: {e}")
+
+
+def using_postgis():
+    """True when geofence queries are answered by PostGIS rather than the STRtree"""
+    return _backend == 'postgis'
+
+
+def _sql_point(longitude, latitude):
+    return func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
+
+
+def zones_containing(longitude, latitude):
+    """
+    Active zone dicts (Geofence.to_dict()) whose polygon contains the point.
+    Raises ValueError/TypeError for coordinates that are not numbers.
+    """
+    longitude, latitude = float(longitude), float(latitude)
+    if using_postgis():
+        try:
+            geofences = Geofence.query.filter(
+                Geofence.active.is_(True),
+                func.ST_Contains(Geofence.geom, _sql_point(longitude, latitude))
+            ).order_by(Geofence.id).all()
+            return [gf.to_dict() for gf in geofences]
+        except Exception as e:
+            print(f"[Spatial] ST_Contains query failed, using in-memory index: {e}")
+            db.session.rollback()
+    return geofence_index.zones_containing(longitude, latitude)
+
+
+def zones_within(longitude, latitude, radius_m):
+    """
+    Active zone dicts within radius_m metres of the point, nearest first.
+    Each dict carries an extra 'distance_m' (0 when the point is inside).
+    """
+    if using_postgis():
+        try:
+            point_geom = _sql_point(longitude, latitude)
+            point = func.geography(point_geom)
+            zone_geog = func.geography(Geofence.geom)
+            distance = func.ST_Distance(zone_geog, point)
+            # Bounding-box prefilter in degrees so the GiST index on geom is used
+            dlat = radius_m / METERS_PER_DEGREE
+            dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+            rows = db.session.query(Geofence, distance).filter(
+                Geofence.active.is_(True),
+                Geofence.geom.op('&&')(func.ST_Expand(point_geom, dlon, dlat)),
+                func.ST_DWithin(zone_geog, point, radius_m)
+            ).order_by(distance, Geofence.id).all()
+            return [dict(gf.to_dict(), distance_m=round(dist, 1)) for gf, dist in rows]
+        except Exception as e:
+            print(f"[Spatial] ST_DWithin query failed, using in-memory index: {e}")
+            db.session.rollback()
+    return [
+        dict(entry.zone, distance_m=round(dist, 1))
+        for entry, dist in geofence_index.query_radius(longitude, latitude, radius_m)
+    ]
+
+
+
+# Rows fetched by the planar KNN scan before geodesic re-ranking
+KNN_OVERFETCH = 4
+
+
+def nearest_zones(longitude, latitude, k=10, max_distance_m=50000, zone_types=None, risk_levels=None):
+    """
+    Up to k active zone dicts nearest the point (within max_distance_m),
+    nearest first, each with 'distance_m' (geodesic, 0 when inside).
+    zone_types / risk_levels optionally restrict the candidates.
+    """
+    if using_postgis():
+        try:
+            point_geom = _sql_point(longitude, latitude)
+            point = func.geography(point_geom)
+            distance = func.ST_Distance(func.geography(Geofence.geom), point)
+            filters = [Geofence.active.is_(True)]
+            if zone_types:
+                filters.append(Geofence.zone_type.in_(zone_types))
+            if risk_levels:
+                filters.append(Geofence.risk_level.in_(risk_levels))
+            # Index-assisted KNN (<->) orders by planar degrees; over-fetch and
+            # re-rank by true distance so east-west neighbours aren't misordered
+            dlat = max_distance_m / METERS_PER_DEGREE
+            dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+            candidates = db.session.query(Geofence.id).filter(
+                *filters,
+                Geofence.geom.op('&&')(func.ST_Expand(point_geom, dlon, dlat))
+            ).order_by(Geofence.geom.op('<->')(point_geom)).limit(k * KNN_OVERFETCH).subquery()
+            rows = db.session.query(Geofence, distance).filter(
+                Geofence.id.in_(db.select(candidates.c.id)),
+                func.ST_DWithin(func.geography(Geofence.geom), point, max_distance_m)
+            ).order_by(distance, Geofence.id).limit(k).all()
+            return [dict(gf.to_dict(), distance_m=round(dist, 1)) for gf, dist in rows]
+        except Exception as e:
+            print(f"[Spatial] KNN query failed, using in-memory index: {e}")
+            db.session.rollback()
+
+    def matches(entry):
+        return ((not zone_types or entry.zone['zone_type'] in zone_types) and
+                (not risk_levels or entry.zone['risk_level'] in risk_levels))
+
+    return [
+        dict(entry.zone, distance_m=round(distance, 1))
+        for entry, distance in geofence_index.nearest(longitude, latitude, k, max_distance_m, matches)
+    ]
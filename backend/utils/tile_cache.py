@@ -0,0 +1,138 @@
+"""
+Per-tile cache for /api/tiles.
+
+Encoded tiles are kept in a bounded LRU keyed by (layer, z, x, y, variant).
+Writes invalidate only the tiles they touch: the geofence index reports the
+bounds of each changed zone, and committed Incident rows are tracked through
+session events, so editing one zone doesn't throw away every cached tile.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models.incident import Incident
+from utils.geofence_index import geofence_index
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class TileCache:
+    """Bounded LRU of encoded tiles with bounding-box invalidation"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()  # key -> (layer, bounds, data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._tiles.get(key)
+            if item is None:
+                return None
+            self._tiles.move_to_end(key)
+            return item[2]
+
+    def put(self, key, layer, bounds, data):
+        with self._lock:
+            self._tiles[key] = (layer, bounds, data)
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_entries:
+                self._tiles.popitem(last=False)
+
+    def invalidate(self, layer, bounds_list=None):
+        """Drop cached tiles of `layer` overlapping any of bounds_list (None = all)"""
+        with self._lock:
+            stale = [
+                key for key, (tile_layer, tile_bounds, _) in self._tiles.items()
+                if tile_layer == layer and (
+                    bounds_list is None or any(_intersects(tile_bounds, b) for b in bounds_list)
+                )
+            ]
+            for key in stale:
+                del self._tiles[key]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+tile_cache = TileCache()
+
+
+# ----------------------------------------------------------------------
+# Invalidation hooks
+# ----------------------------------------------------------------------
+_PENDING_KEY = 'tile_cache_incidents'
+
+
+def _point_bounds(longitude, latitude):
+    if latitude is None or longitude is None:
+        return None
+    return (longitude, latitude, longitude, latitude)
+
+
+def _previous_point(incident):
+    """(longitude, latitude) before this flush's pending changes"""
+    state = inspect(incident)
+    point = []
+    for attr in ('longitude', 'latitude'):
+        history = state.attrs[attr].history
+        point.append(history.deleted[0] if history.deleted else getattr(incident, attr))
+    return point
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Incident):
+            pending.append(_point_bounds(obj.longitude, obj.latitude))
+            if obj in session.dirty:
+                # A moved incident must also leave the tiles at its old position
+                previous = _point_bounds(*_previous_point(obj))
+                if previous != pending[-1]:
+                    pending.append(previous)
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        tile_cache.invalidate('incidents', None if None in pending else pending)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _do_orm_execute(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Incident:
+            orm_execute_state.session.info.setdefault(_PENDING_KEY, []).append(None)
+
+
+def _track_previous(target, value, oldvalue, initiator):
+    """No-op; registered with active_history so the pre-edit value is loaded"""
+
+
+_listeners_registered = False
+
+
+def init_app(app):
+    global _listeners_registered
+    tile_cache.max_entries = app.config.get('TILE_CACHE_MAX_ENTRIES', 4096)
+    if _listeners_registered:
+        return
+    geofence_index.add_listener(lambda bounds_list: tile_cache.invalidate('geofences', bounds_list))
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    # Without active history, editing an expired incident (e.g. after a commit)
+    # would not record the old coordinates, and the old tile would never be invalidated
+    for attr in (Incident.latitude, Incident.longitude):
+        event.listen(attr, 'set', _track_previous, active_history=True)
+    _listeners_registered = True
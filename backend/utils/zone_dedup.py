@@ -0,0 +1,114 @@
+"""
+Overlap-aware deduplication of geofences.
+
+AI zone generation tends to return near-identical rectangles for the same
+area on every cache miss. Before inserting, candidate zones are compared
+against existing active zones (found through the spatial index) by
+intersection-over-union; a close enough match refreshes the existing row
+instead of adding another one.
+
+compact_duplicate_zones() applies the same rule to zones already in the
+table (see compact_geofences.py).
+"""
+from datetime import datetime
+
+import shapely
+from shapely.strtree import STRtree
+
+from extensions import db
+from models.geofence import Geofence
+from utils.geofence_index import geofence_index
+
+DEFAULT_IOU_THRESHOLD = 0.6
+
+
+def iou(a, b):
+    """Intersection-over-union of two polygons (0 when disjoint)"""
+    try:
+        intersection = a.intersection(b).area
+    except shapely.errors.GEOSException:
+        return 0.0
+    if intersection <= 0:
+        return 0.0
+    union = a.area + b.area - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def find_duplicate(geometry, threshold=DEFAULT_IOU_THRESHOLD, extra=()):
+    """
+    Best-matching active zone for `geometry` with IoU >= threshold.
+    `extra` holds (key, geometry) pairs not yet in the index (e.g. zones
+    accepted earlier in the same batch). Returns (key_or_IndexedZone, iou)
+    or (None, 0.0).
+    """
+    best, best_iou = None, 0.0
+    for entry in geofence_index.query_bbox(*geometry.bounds):
+        score = iou(geometry, entry.geometry)
+        if score > best_iou:
+            best, best_iou = entry, score
+    for key, other in extra:
+        score = iou(geometry, other)
+        if score > best_iou:
+            best, best_iou = key, score
+    if best_iou >= threshold:
+        return best, best_iou
+    return None, 0.0
+
+
+def merge_into(geofence, zone_data):
+    """Refresh an existing zone with newer metadata; returns True if anything changed"""
+    changed = False
+    for field in ('zone_type', 'risk_level', 'description'):
+        value = zone_data.get(field)
+        if value and getattr(geofence, field) != value:
+            setattr(geofence, field, value)
+            changed = True
+    if changed:
+        geofence.updated_at = datetime.utcnow()
+    return changed
+
+
+def compact_duplicate_zones(threshold=DEFAULT_IOU_THRESHOLD, dry_run=False):
+    """
+    Deactivate active zones that duplicate an older zone (IoU >= threshold).
+    The lowest id in each duplicate cluster is kept so references such as
+    user_zone_states stay valid. Returns {kept_id: [deactivated ids]}.
+    """
+    geofences = Geofence.query.filter_by(active=True).order_by(Geofence.id).all()
+    shapes, rows = [], []
+    for geofence in geofences:
+        geometry = geofence.get_shape()
+        if geometry is not None:
+            shapes.append(geometry)
+            rows.append(geofence)
+    if not rows:
+        return {}
+
+    tree = STRtree(shapes)
+    parent = list(range(len(rows)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = tree.query(shapes, predicate='intersects')
+    for i, j in zip(*pairs):
+        if i < j and iou(shapes[i], shapes[j]) >= threshold:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(len(rows)):
+        root = find(i)
+        if root != i:
+            clusters.setdefault(rows[root].id, []).append(rows[i])
+
+    if not dry_run:
+        for duplicates in clusters.values():
+            for geofence in duplicates:
+                geofence.active = False
+        db.session.commit()
+    return {kept: [gf.id for gf in duplicates] for kept, duplicates in clusters.items()}
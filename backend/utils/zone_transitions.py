@@ -0,0 +1,275 @@
+"""
+Per-tourist geofence enter/exit/dwell transitions.
+
+Rather than reporting every zone a tourist is inside on every location fix,
+the tracker remembers which zones each user is in and only reports changes:
+
+- enter: the user is now inside a zone they were last told they were outside
+- exit:  the user is now outside a zone they were last told they were inside
+- dwell: the user has stayed inside a zone for GEOFENCE_DWELL_SECONDS
+         (repeated every GEOFENCE_DWELL_REPEAT_SECONDS, 0 = once)
+
+Enter/exit notifications for the same zone are rate limited by
+GEOFENCE_TRANSITION_COOLDOWN_SECONDS, so GPS jitter along a boundary
+doesn't produce a stream of alternating alerts - the client is told about
+the settled state once the cooldown has passed.
+
+State lives in memory (bounded LRU) and is written through to the
+user_zone_states table whenever it changes, so a restarted or evicted
+worker resumes without re-alerting everybody. update() works on a copy
+that is staged on the session and only replaces the in-memory state once
+the session commits; a rollback leaves the committed state untouched.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.geofence import UserZoneState
+from utils.geofence_index import geofence_index
+
+
+class ZoneMembership:
+    """In-memory state for one (user, zone) pair"""
+    __slots__ = ('inside', 'notified_inside', 'entered_at', 'last_event_at', 'last_dwell_at', 'zone')
+
+    def __init__(self, inside=False, notified_inside=False, entered_at=None,
+                 last_event_at=None, last_dwell_at=None, zone=None):
+        self.inside = inside
+        self.notified_inside = notified_inside
+        self.entered_at = entered_at
+        self.last_event_at = last_event_at
+        self.last_dwell_at = last_dwell_at
+        self.zone = zone
+
+    def snapshot(self):
+        return (self.inside, self.notified_inside, self.entered_at, self.last_event_at, self.last_dwell_at)
+
+    def copy(self):
+        return ZoneMembership(*self.snapshot(), zone=self.zone)
+
+
+def zone_summary(zone):
+    """Alert-sized view of a Geofence.to_dict() payload"""
+    return {
+        'id': zone['id'],
+        'name': zone.get('name'),
+        'zone_type': zone.get('zone_type'),
+        'risk_level': zone.get('risk_level'),
+        'warning_message': zone.get('warning_message') or f"You are entering {zone.get('name')}",
+        'description': zone.get('description')
+    }
+
+
+class ZoneTransitionTracker:
+    """Keeps zone membership per user and turns fixes into transitions"""
+
+    def __init__(self, cooldown_seconds=120, dwell_seconds=600, dwell_repeat_seconds=1800, max_users=10000):
+        self.cooldown = timedelta(seconds=cooldown_seconds)
+        self.dwell = timedelta(seconds=dwell_seconds)
+        self.dwell_repeat = timedelta(seconds=dwell_repeat_seconds) if dwell_repeat_seconds else None
+        self.max_users = max_users
+        self._lock = threading.RLock()
+        self._users = OrderedDict()  # user_id -> {zone_id: ZoneMembership}
+
+    def configure(self, config):
+        self.cooldown = timedelta(seconds=config.get('GEOFENCE_TRANSITION_COOLDOWN_SECONDS', 120))
+        self.dwell = timedelta(seconds=config.get('GEOFENCE_DWELL_SECONDS', 600))
+        repeat = config.get('GEOFENCE_DWELL_REPEAT_SECONDS', 1800)
+        self.dwell_repeat = timedelta(seconds=repeat) if repeat else None
+        self.max_users = config.get('GEOFENCE_STATE_MAX_USERS', 10000)
+
+    # ------------------------------------------------------------------
+    # State loading / persistence
+    # ------------------------------------------------------------------
+    def _load_user(self, user_id):
+        memberships = self._users.get(user_id)
+        if memberships is not None:
+            self._users.move_to_end(user_id)
+            return memberships
+        memberships = {}
+        for row in UserZoneState.query.filter_by(user_id=user_id).all():
+            memberships[row.geofence_id] = ZoneMembership(
+                inside=row.inside,
+                notified_inside=row.notified_inside,
+                entered_at=row.entered_at,
+                last_event_at=row.last_event_at,
+                last_dwell_at=row.last_dwell_at
+            )
+        self._store(user_id, memberships)
+        return memberships
+
+    def _store(self, user_id, memberships):
+        self._users[user_id] = memberships
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def apply(self, staged):
+        """Swap in memberships staged by update() once their session committed"""
+        with self._lock:
+            for user_id, memberships in staged.items():
+                self._store(user_id, memberships)
+
+    def _persist(self, user_id, changed):
+        """Write changed memberships to the session (caller commits)"""
+        rows = {}
+        if changed:
+            existing = UserZoneState.query.filter(
+                UserZoneState.user_id == user_id,
+                UserZoneState.geofence_id.in_(list(changed))
+            ).all()
+            rows = {row.geofence_id: row for row in existing}
+        for zone_id, membership in changed.items():
+            row = rows.get(zone_id)
+            if membership is None:
+                if row is not None:
+                    db.session.delete(row)
+                continue
+            if row is None:
+                row = UserZoneState(user_id=user_id, geofence_id=zone_id)
+                db.session.add(row)
+            row.inside = membership.inside
+            row.notified_inside = membership.notified_inside
+            row.entered_at = membership.entered_at
+            row.last_event_at = membership.last_event_at
+            row.last_dwell_at = membership.last_dwell_at
+
+    def forget(self, user_id):
+        """Drop in-memory state for a user (e.g. account deleted)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    # ------------------------------------------------------------------
+    # Transitions
+    # ------------------------------------------------------------------
+    def _event(self, kind, membership, zone_id, now):
+        zone = membership.zone
+        if zone is None:
+            entry = geofence_index.get(zone_id)
+            zone = zone_summary(entry.zone) if entry else {'id': zone_id}
+        event = dict(zone, event=kind, timestamp=now.isoformat())
+        if kind != 'enter' and membership.entered_at:
+            event['dwell_seconds'] = int((now - membership.entered_at).total_seconds())
+        membership.last_event_at = now
+        return event
+
+    def update(self, user_id, zones, now=None):
+        """
+        Feed the zones (Geofence.to_dict() payloads) containing the user's
+        latest fix. Returns the list of transitions to report (usually empty).
+        Changed state is added to db.session; the caller commits, and only
+        then does the new state replace the in-memory one.
+        """
+        now = now or datetime.utcnow()
+        current = {zone['id']: zone for zone in zones}
+        transitions = []
+        changed = {}
+        staged = _pending(db.session())
+
+        with self._lock:
+            # Continue from this transaction's own uncommitted state (batch replay)
+            base = staged.get(user_id)
+            if base is None:
+                base = self._load_user(user_id)
+            memberships = {zone_id: membership.copy() for zone_id, membership in base.items()}
+
+            for zone_id in set(memberships) | set(current):
+                membership = memberships.get(zone_id)
+                if membership is None:
+                    membership = memberships[zone_id] = ZoneMembership()
+                before = membership.snapshot()
+                inside = zone_id in current
+                if inside:
+                    membership.zone = zone_summary(current[zone_id])
+                if inside and not membership.inside and not membership.notified_inside:
+                    # A suppressed exit (jitter) keeps the original entry time
+                    membership.entered_at = now
+                    membership.last_dwell_at = None
+                membership.inside = inside
+
+                cooled_down = membership.last_event_at is None or now - membership.last_event_at >= self.cooldown
+                if inside != membership.notified_inside and cooled_down:
+                    transitions.append(self._event('enter' if inside else 'exit', membership, zone_id, now))
+                    membership.notified_inside = inside
+                elif inside and membership.notified_inside and membership.entered_at:
+                    dwell_due = (
+                        now - membership.entered_at >= self.dwell and
+                        (membership.last_dwell_at is None or
+                         (self.dwell_repeat is not None and now - membership.last_dwell_at >= self.dwell_repeat))
+                    )
+                    if dwell_due:
+                        transitions.append(self._event('dwell', membership, zone_id, now))
+                        membership.last_dwell_at = now
+
+                settled_outside = not membership.inside and not membership.notified_inside
+                if settled_outside and (membership.last_event_at is None or
+                                        now - membership.last_event_at >= self.cooldown):
+                    # Nothing left to remember once the exit cooldown has passed
+                    del memberships[zone_id]
+                    changed[zone_id] = None
+                elif membership.snapshot() != before:
+                    changed[zone_id] = membership
+
+            self._persist(user_id, changed)
+        staged[user_id] = memberships
+        return transitions
+
+
+zone_tracker = ZoneTransitionTracker()
+
+
+# ----------------------------------------------------------------------
+# Publish staged memberships only when their transaction commits
+# ----------------------------------------------------------------------
+_PENDING_KEY = 'zone_tracker_pending'
+
+
+def _pending(session):
+    """Staged memberships of the session's transaction (begun now, so a rollback clears them)"""
+    if not session.in_transaction():
+        session.begin()
+    return session.info.setdefault(_PENDING_KEY, {})
+
+
+def _after_commit(session):
+    staged = session.info.pop(_PENDING_KEY, None)
+    if staged:
+        zone_tracker.apply(staged)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+_listeners_registered = False
+
+
+def init_app(app):
+    global _listeners_registered
+    zone_tracker.configure(app.config)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
+
+
+def emit_zone_transitions(user_id, transitions):
+    """Push transitions to the tourist's personal Socket.IO room"""
+    if not transitions:
+        return
+    try:
+        from app import socketio
+        if socketio:
+            room = f'user_{user_id}'
+            socketio.emit('geofence_transitions', {
+                'user_id': user_id,
+                'transitions': transitions
+            }, room=room)
+            print(f"📡 Sent {len(transitions)} geofence transition(s) to {room}")
+    except Exception as e:
+        print(f"⚠️ Could not emit geofence transitions: {e}")
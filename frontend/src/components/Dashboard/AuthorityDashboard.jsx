@@ -37,15 +37,15 @@ export default function AuthorityDashboard() {
   const mapRef = useRef(null)
   const mapContainerRef = useRef(null)
   const markersRef = useRef({})
+  const touristCursorRef = useRef(null)
+  const touristPollCountRef = useRef(0)
+  const touristSeqRef = useRef(null)
+  const touristPollRef = useRef(null)
 
   useEffect(() => {
     fetchIncidents()
-    fetchTouristLocations()
     initializeWebSocket()
     
-    // Refresh tourist locations every 10 seconds
-    const locationInterval = setInterval(fetchTouristLocations, 10000)
-    
     return () => {
       if (socketRef.current) {
         socketRef.current.disconnect()
@@ -58,7 +58,7 @@ export default function AuthorityDashboard() {
           console.log('Map cleanup error (non-critical):', error)
         }
       }
-      clearInterval(locationInterval)
+      stopTouristPolling()
     }
   }, [])
 
@@ -329,11 +329,47 @@ export default function AuthorityDashboard() {
     }
   }
 
+  // Replace entries by user_id, keeping whichever position is newer
+  const mergeTourists = (prev, locations) => {
+    const moved = new Map(locations.map(loc => [loc.user_id, loc]))
+    const merged = prev.map(loc => {
+      const update = moved.get(loc.user_id)
+      return update && update.timestamp >= loc.timestamp ? update : loc
+    })
+    const known = new Set(prev.map(loc => loc.user_id))
+    return merged.concat(locations.filter(loc => !known.has(loc.user_id)))
+  }
+
+  // REST polling is only a fallback while the socket is down
+  const startTouristPolling = () => {
+    if (touristPollRef.current) return
+    touristCursorRef.current = null
+    fetchTouristLocations()
+    touristPollRef.current = setInterval(fetchTouristLocations, 10000)
+  }
+
+  const stopTouristPolling = () => {
+    clearInterval(touristPollRef.current)
+    touristPollRef.current = null
+  }
+
   const fetchTouristLocations = async () => {
     try {
-      const response = await api.get('/location/all-tourists')
-      setTourists(response.data.locations || [])
-      console.log('✅ Fetched tourist locations:', response.data.locations?.length || 0)
+      // Only ask for tourists who moved since the last poll; a full refresh
+      // every 6th poll (~1 min) updates last_seen and drops removed tourists
+      const full = !touristCursorRef.current || touristPollCountRef.current % 6 === 0
+      touristPollCountRef.current += 1
+      const response = await api.get('/location/all-tourists', {
+        params: full ? {} : { since: touristCursorRef.current }
+      })
+      const locations = response.data.locations || []
+      touristCursorRef.current = response.data.cursor
+      if (full) {
+        setTourists(locations)
+      } else if (locations.length > 0) {
+        setTourists(prev => mergeTourists(prev, locations))
+      }
+      console.log(`✅ Fetched tourist locations (${full ? 'full' : 'moved'}):`, locations.length)
     } catch (error) {
       console.error('Failed to fetch tourist locations:', error)
     }
@@ -353,22 +389,47 @@ export default function AuthorityDashboard() {
     
     socketRef.current.on('connect', () => {
       console.log('✅ Authority connected to WebSocket')
-      socketRef.current.emit('join_authority_room')
+      socketRef.current.emit('join_authority_room', { token: localStorage.getItem('token') })
       console.log('👮 Joined authorities room')
     })
     
     socketRef.current.on('connect_error', (error) => {
       console.error('❌ WebSocket connection error:', error.message);
       console.log('🔄 Will retry connection...');
+      startTouristPolling();
     });
     
     socketRef.current.on('reconnect', (attemptNumber) => {
       console.log(`🔄 Reconnected to WebSocket (attempt ${attemptNumber})`);
-      socketRef.current.emit('join_authority_room');
+      socketRef.current.emit('join_authority_room', { token: localStorage.getItem('token') });
     });
     
     socketRef.current.on('disconnect', () => {
       console.log('❌ Authority disconnected from WebSocket')
+      startTouristPolling()
+    })
+    
+    socketRef.current.on('join_error', (data) => {
+      console.error('❌ Could not join room:', data.error)
+      startTouristPolling()
+    })
+    
+    // Live tourist positions: a snapshot on join, then sequenced deltas
+    socketRef.current.on('tourist_snapshot', (data) => {
+      stopTouristPolling()
+      touristSeqRef.current = data.seq
+      setTourists(data.positions || [])
+      console.log('📍 Tourist snapshot:', data.positions?.length || 0)
+    })
+    
+    socketRef.current.on('tourist_positions', (data) => {
+      if (touristSeqRef.current === null || data.seq <= touristSeqRef.current) return
+      if (data.seq !== touristSeqRef.current + 1) {
+        // Missed a delta - resync
+        socketRef.current.emit('request_tourist_snapshot')
+      }
+      touristSeqRef.current = data.seq
+      setTourists(prev => mergeTourists(prev, data.positions || []))
     })
     
     socketRef.current.on('joined', (data) => {
@@ -27,6 +27,7 @@ export default function UserDashboard() {
   const [incidentStatus, setIncidentStatus] = useState(null);
   const [showStatusNotification, setShowStatusNotification] = useState(false);
   const socketRef = useRef(null);
+  const socketAuthedRef = useRef(false); // Socket may carry location updates
   const lastCulturalFetchRef = useRef(null); // Track last fetch time
   const culturalCacheRef = useRef(null); // Cache cultural data
   const lastPlacesFetchRef = useRef(null); // Track last places fetch
@@ -35,6 +36,8 @@ export default function UserDashboard() {
   const lastWeatherFetchRef = useRef(null); // Track last weather fetch
   const lastGeofenceCheckRef = useRef(null); // Track last geofence check
   const lastLocationSendRef = useRef(null); // Track last location send
+  const nextLocationSendMsRef = useRef(30 * 1000); // Server-recommended reporting interval
+  const serverSafetyScoreRef = useRef(null); // Latest score computed by the backend
   
   const MAPBOX_TOKEN = import.meta.env.VITE_MAPBOX_TOKEN || 'pk.eyJ1IjoidmlrcmFudGEiLCJhIjoiY2xrbTJuMzJ5MDFvYjNlbzh4YnZ5YnpoYyJ9.placeholder';
   // Use Railway backend URL for WebSocket connection
@@ -130,8 +133,8 @@ export default function UserDashboard() {
         lastGeofenceCheckRef.current = now;
       }
       
-      // Location updates - only send if 30+ seconds old (reduce backend spam)
-      if (!lastLocationSendRef.current || (now - lastLocationSendRef.current > 30 * 1000)) {
+      // Location updates - at the interval the backend recommended (30s until it answers)
+      if (!lastLocationSendRef.current || (now - lastLocationSendRef.current > nextLocationSendMsRef.current)) {
         sendLocationToBackend();
         lastLocationSendRef.current = now;
       }
@@ -150,7 +153,7 @@ export default function UserDashboard() {
       
       const watchId = navigator.geolocation.watchPosition(
         (position) => {
-          const { latitude, longitude, accuracy } = position.coords;
+          const { latitude, longitude, accuracy, speed } = position.coords;
           console.log('📍 Location updated:', { latitude, longitude, accuracy });
           
           // Log accuracy information
@@ -169,6 +172,7 @@ export default function UserDashboard() {
             latitude,
             longitude,
             accuracy,
+            speed,
             timestamp: new Date().toISOString()
           });
         },
@@ -245,7 +249,7 @@ export default function UserDashboard() {
       // Join user-specific room
       if (user?.id) {
         console.log(`📡 Emitting join_user_room with user_id: ${user.id}`);
-        socketRef.current.emit('join_user_room', { user_id: user.id });
+        socketRef.current.emit('join_user_room', { user_id: user.id, token: localStorage.getItem('token') });
       } else {
         console.warn('⚠️ User ID not available, cannot join personal room');
       }
@@ -260,7 +264,7 @@ export default function UserDashboard() {
       console.log(`🔄 Reconnected to WebSocket (attempt ${attemptNumber})`);
       // Re-join room after reconnection
       if (user?.id) {
-        socketRef.current.emit('join_user_room', { user_id: user.id });
+        socketRef.current.emit('join_user_room', { user_id: user.id, token: localStorage.getItem('token') });
       }
     });
     
@@ -271,6 +275,7 @@ export default function UserDashboard() {
     // Confirmation that we joined the room
     socketRef.current.on('joined_user_room', (data) => {
       console.log('✅ Successfully joined user room:', data);
+      socketAuthedRef.current = Boolean(data.authenticated);
     });
     
     socketRef.current.on('incident_update', (data) => {
@@ -328,20 +333,47 @@ export default function UserDashboard() {
     
     socketRef.current.on('disconnect', () => {
       console.log('🔌 Tourist disconnected from WebSocket');
+      socketAuthedRef.current = false;
     });
   };
   
   // Send location updates to backend for tracking
+  const applyLocationResult = ({ safety_score, next_update_seconds }) => {
+    if (next_update_seconds) {
+      nextLocationSendMsRef.current = next_update_seconds * 1000;
+    }
+    if (safety_score) {
+      serverSafetyScoreRef.current = safety_score;
+      setSafetyScore(safety_score.score.toFixed(1));
+    }
+  };
+  
   const sendLocationToBackend = async () => {
     if (!currentLocation) return;
     
-    try {
-      await api.post('/location/update', {
-        latitude: currentLocation.latitude,
-        longitude: currentLocation.longitude,
-        accuracy: currentLocation.accuracy,
-        timestamp: currentLocation.timestamp
+    const fix = {
+      latitude: currentLocation.latitude,
+      longitude: currentLocation.longitude,
+      accuracy: currentLocation.accuracy,
+      speed: currentLocation.speed ?? null,
+      timestamp: currentLocation.timestamp
+    };
+    
+    // One socket frame per fix when the connection is authenticated; HTTP otherwise
+    if (socketRef.current?.connected && socketAuthedRef.current) {
+      socketRef.current.timeout(10000).emit('location_update', fix, (err, result) => {
+        if (err || result?.error) {
+          console.error('Location update error:', err || result.error);
+          return;
+        }
+        applyLocationResult(result);
       });
+      return;
+    }
+    
+    try {
+      const response = await api.post('/location/update', fix);
+      applyLocationResult(response.data);
     } catch (error) {
       // Silently fail - location tracking continues even if backend update fails
       console.error('Location update error:', error);
@@ -421,6 +453,12 @@ export default function UserDashboard() {
       return;
     }
     
+    // Prefer the backend score (zones, incidents, time of day) once we have one
+    if (serverSafetyScoreRef.current) {
+      setSafetyScore(serverSafetyScoreRef.current.score.toFixed(1));
+      return;
+    }
+    
     // Calculate safety score based on ACTUAL geofence data
     let score = 10; // Start with perfect score
     
@@ -543,88 +581,73 @@ export default function UserDashboard() {
     return '📍';
   };
 
+  // Convert a backend geofence into a safety-zone card (distance in km)
+  const toSafetyZone = (gf, distance) => {
+    const coords = gf.polygon?.coordinates?.[0] || [];
+    let centerLat = 0, centerLng = 0;
+    
+    if (coords.length > 0) {
+      coords.forEach(coord => {
+        const [lng, lat] = typeof coord === 'string' ? coord.split(' ').map(Number) : coord;
+        centerLat += lat;
+        centerLng += lng;
+      });
+      centerLat /= coords.length;
+      centerLng /= coords.length;
+    }
+
+    return {
+      id: gf.id,
+      name: gf.name,
+      type: gf.zone_type || 'Safety Zone',
+      safety: gf.risk_level === 'high' ? 'High Risk' : 
+             gf.risk_level === 'medium' ? 'Medium Safety' : 'High Safety',
+      lat: centerLat,
+      lng: centerLng,
+      distance: distance,
+      description: gf.description
+    };
+  };
+
   const fetchSafetyZones = async () => {
     try {
-      // Fetch real geofences from backend
-      const response = await api.get('/geofence/list?active=true');
-      const { geofences } = response.data;
-      
-      console.log('[fetchSafetyZones] 📊 Received geofences:', geofences?.length || 0);
-      if (geofences && geofences.length > 0) {
-        console.log('[fetchSafetyZones] 📍 First geofence sample:', JSON.stringify(geofences[0], null, 2));
-      } else {
-        console.warn('[fetchSafetyZones] ⚠️ No geofences returned from backend');
+      if (!currentLocation) {
+        // Nothing to rank by yet - show the first few zones
+        const response = await api.get('/geofence/list?active=true');
+        const { geofences } = response.data;
+        
+        if (geofences && geofences.length > 0) {
+          setSafetyZones(geofences.slice(0, 5).map(gf => toSafetyZone(gf, 999)));
+          setGeofences(geofences);
+        } else {
+          console.log('⚠️ No geofences from backend, using mock data');
+          useMockSafetyZones();
+        }
+        return;
       }
-      
-      if (geofences && geofences.length > 0) {
-        // Helper function to calculate distance between two points (Haversine formula)
-        const calculateDistance = (lat1, lon1, lat2, lon2) => {
-          const R = 6371; // Radius of the Earth in km
-          const dLat = (lat2 - lat1) * Math.PI / 180;
-          const dLon = (lon2 - lon1) * Math.PI / 180;
-          const a = Math.sin(dLat/2) * Math.sin(dLat/2) +
-                    Math.cos(lat1 * Math.PI / 180) * Math.cos(lat2 * Math.PI / 180) *
-                    Math.sin(dLon/2) * Math.sin(dLon/2);
-          const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1-a));
-          return R * c; // Distance in km
-        };
 
-        // Convert geofences to safety zones and calculate distance
-        const zones = geofences.map(gf => {
-          // Calculate center of polygon
-          const coords = gf.polygon?.coordinates?.[0] || [];
-          let centerLat = 0, centerLng = 0;
-          
-          if (coords.length > 0) {
-            coords.forEach(coord => {
-              const [lng, lat] = typeof coord === 'string' ? coord.split(' ').map(Number) : coord;
-              centerLat += lat;
-              centerLng += lng;
-            });
-            centerLat /= coords.length;
-            centerLng /= coords.length;
-          }
-
-          // Calculate distance from user location
-          const distance = currentLocation 
-            ? calculateDistance(currentLocation.latitude, currentLocation.longitude, centerLat, centerLng)
-            : 999; // Large number if no user location
-
-          return {
-            id: gf.id,
-            name: gf.name,
-            type: gf.zone_type || 'Safety Zone',
-            safety: gf.risk_level === 'high' ? 'High Risk' : 
-                   gf.risk_level === 'medium' ? 'Medium Safety' : 'High Safety',
-            lat: centerLat,
-            lng: centerLng,
-            distance: distance,
-            description: gf.description
-          };
-        });
+      const { latitude, longitude } = currentLocation;
+      // Nearest zones are ranked server-side; the map only needs zones around the user
+      const [nearestResponse, mapResponse] = await Promise.all([
+        api.get('/geofence/nearest', {
+          params: { latitude, longitude, k: 10, max_distance_m: 50000 }
+        }),
+        api.get('/geofence/list', {
+          params: { active: true, bbox: `${longitude - 0.5},${latitude - 0.5},${longitude + 0.5},${latitude + 0.5}` }
+        })
+      ]);
 
-        // Filter zones within 50km and sort by distance
-        const nearbyZones = zones
-          .filter(zone => zone.distance < 50)
-          .sort((a, b) => a.distance - b.distance)
-          .slice(0, 10); // Show max 10 zones
+      const nearbyZones = (nearestResponse.data.zones || []).map(gf => toSafetyZone(gf, gf.distance_m / 1000));
+      const mapGeofences = mapResponse.data.geofences || [];
 
-        console.log(`📍 Found ${nearbyZones.length} zones within 50km`);
-        console.log(`🗺️ Setting ${geofences.length} geofences for map rendering`);
-        console.log(`🗺️ Sample geofence polygon:`, geofences[0]?.polygon);
-        setSafetyZones(nearbyZones);
-        setGeofences(geofences); // Store raw geofence data for map rendering
-        
-        if (nearbyZones.length === 0 && currentLocation) {
-          console.log('🤖 No zones nearby, generating new zones with AI...');
-          await generateSafetyZones();
-        } else if (nearbyZones.length === 0) {
-          console.log('⚠️ No zones nearby, showing all zones');
-          setSafetyZones(zones.slice(0, 5)); // Show first 5 if none nearby
-        }
-      } else {
-        console.log('⚠️ No geofences from backend, using mock data');
-        useMockSafetyZones();
+      console.log(`📍 Found ${nearbyZones.length} zones within 50km`);
+      console.log(`🗺️ Setting ${mapGeofences.length} geofences for map rendering`);
+      setSafetyZones(nearbyZones);
+      setGeofences(mapGeofences); // Store raw geofence data for map rendering
+      
+      if (nearbyZones.length === 0) {
+        console.log('🤖 No zones nearby, generating new zones with AI...');
+        await generateSafetyZones();
       }
     } catch (error) {
       console.error('Error fetching safety zones:', error);